@@ -0,0 +1,205 @@
+"""
+Shared HTTP client for outside gateways (ZarinPal, SMS providers).
+
+Each gateway gets one ``GatewayClient`` per process. The client keeps a
+pooled ``requests.Session``, so calls reuse keep-alive connections instead
+of paying a TCP and TLS handshake every time, and applies:
+
+- separate connect and read timeouts
+- one immediate retry of connections that failed before the request was
+  sent, which is safe for POSTs
+- a circuit breaker that fails fast while a gateway keeps erroring, so
+  request threads don't pile up behind a dead upstream
+- a Prometheus latency histogram per gateway and endpoint
+
+``apost`` is the async variant for async views and consumers; it runs the
+same pooled call on a worker thread.
+"""
+import os
+import threading
+import time
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from prometheus_client import Histogram
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+GATEWAY_LATENCY = Histogram(
+    'gateway_request_duration_seconds',
+    'Latency of calls to outside gateways',
+    ['gateway', 'endpoint', 'outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling a gateway whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Count consecutive failures of a gateway and stop calling it for a while.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    fail immediately. Once ``reset_timeout`` seconds have passed one trial
+    call is let through; if it succeeds the circuit closes again, otherwise
+    it stays open for another ``reset_timeout``. State is per process.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check whether a call may go through.
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_running:
+                raise CircuitOpenError("Circuit breaker is open")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class GatewayClient:
+    """
+    Pooled, timed and circuit-broken HTTP client for one gateway.
+
+    Args:
+        name: Gateway name, used for logs and metrics
+        connect_timeout: Seconds to wait for a connection
+        read_timeout: Seconds to wait for the response
+        pool_size: Keep-alive connections kept open per host
+        failure_threshold: Consecutive failures that open the circuit
+        reset_timeout: Seconds the circuit stays open
+    """
+
+    def __init__(self, name, connect_timeout=None, read_timeout=None, pool_size=None,
+                 failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.GATEWAY_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else settings.GATEWAY_READ_TIMEOUT,
+        )
+        self.pool_size = pool_size or settings.GATEWAY_POOL_SIZE
+        self.breaker = CircuitBreaker(
+            failure_threshold or settings.GATEWAY_BREAKER_THRESHOLD,
+            reset_timeout or settings.GATEWAY_BREAKER_RESET_TIMEOUT,
+        )
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The pooled session, recreated in forked worker processes."""
+        with self._lock:
+            # Sockets can't be shared with a parent process (e.g. Celery prefork)
+            if self._session is None or self._pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=self.pool_size,
+                    max_retries=Retry(total=1, connect=1, read=0, status=0, other=0, redirect=0),
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+                self._pid = os.getpid()
+            return self._session
+
+    def post(self, url, endpoint=None, **kwargs):
+        """
+        POST to the gateway.
+
+        Args:
+            url: URL to post to
+            endpoint: Short name of the call for metrics (defaults to the last path segment)
+            **kwargs: Passed on to ``requests.Session.post``
+
+        Returns:
+            requests.Response: The response, whatever its status code
+
+        Raises:
+            CircuitOpenError: If the gateway has been failing and the circuit is open
+            requests.RequestException: If the request couldn't be completed
+        """
+        endpoint = endpoint or url.rstrip('/').rsplit('/', 1)[-1]
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            GATEWAY_LATENCY.labels(self.name, endpoint, 'circuit_open').observe(0)
+            logger.warning(f"Skipping {self.name} {endpoint} call: circuit breaker is open")
+            raise
+
+        started = time.perf_counter()
+        try:
+            response = self.session.post(url, **kwargs)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            GATEWAY_LATENCY.labels(self.name, endpoint, 'error').observe(time.perf_counter() - started)
+            raise
+
+        # Client errors are answers from a healthy gateway; only server errors count as failures
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        GATEWAY_LATENCY.labels(self.name, endpoint, f"{response.status_code // 100}xx").observe(
+            time.perf_counter() - started
+        )
+        return response
+
+    async def apost(self, url, endpoint=None, **kwargs):
+        """Async variant of ``post``, run on a worker thread with the same connection pool."""
+        return await sync_to_async(self.post, thread_sensitive=False)(url, endpoint=endpoint, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name, **options):
+    """
+    Get the process-wide client for a gateway, creating it on first use.
+
+    Args:
+        name: Gateway name
+        **options: GatewayClient options, used when the client is created
+
+    Returns:
+        GatewayClient: The shared client
+    """
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = GatewayClient(name, **options)
+        return client
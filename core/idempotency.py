@@ -0,0 +1,190 @@
+"""
+Idempotent API endpoints.
+
+Decorating an APIView handler with ``idempotent`` makes retries of a request
+(double taps, client retries after a timeout, repeated gateway callbacks)
+safe:
+
+- a request holds a lock while it runs; a concurrent repeat gets 409
+  instead of running in parallel
+- a request with an ``Idempotency-Key`` header stores its response for
+  IDEMPOTENCY_TTL seconds, and every repeat with that key gets it replayed,
+  with an ``Idempotent-Replayed`` header; the key reused with a different
+  request gets 422
+- a request without a key is identified by its fingerprint (method, path,
+  query and body, per user), which only guards against duplicates in
+  flight: once it's done, the same request runs again, so it sees the
+  current state rather than a stale answer
+
+Responses and locks are kept in the cache (Redis); while the cache is
+unavailable, the IdempotencyRecord table is used instead. Only successful
+responses are stored: errors, including gateway rejections, and 202
+responses aren't final answers, so their retries run the handler again.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .logging_utils import get_logger
+from .models import IdempotencyRecord
+
+logger = get_logger(__name__)
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def idempotent(scope):
+    """
+    Make an APIView handler method idempotent per user.
+
+    Args:
+        scope: Name of the endpoint, keeping the keys of endpoints apart
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return handler(view, request, *args, **kwargs)
+
+            fingerprint = request_fingerprint(request)
+            client_key = request.headers.get('Idempotency-Key')
+            key = _key(scope, request.user.pk, client_key or fingerprint)
+
+            if not client_key:
+                if not _begin(key, fingerprint):
+                    return Response(
+                        {"error": "This request is already being processed."},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                try:
+                    return handler(view, request, *args, **kwargs)
+                finally:
+                    _release(key)
+
+            stored = _get(key)
+            if stored is None and _begin(key, fingerprint):
+                try:
+                    response = handler(view, request, *args, **kwargs)
+                except Exception:
+                    _release(key)
+                    raise
+                if _is_final(response):
+                    _finish(key, fingerprint, response)
+                else:
+                    _release(key)
+                return response
+
+            stored = stored or _get(key)
+            if stored is not None and stored['fingerprint'] != fingerprint:
+                return Response(
+                    {"error": "This Idempotency-Key was already used for a different request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if stored is None or stored['status_code'] is None:
+                return Response(
+                    {"error": "This request is already being processed."},
+                    status=status.HTTP_409_CONFLICT
+                )
+            response = Response(stored['response'], status=stored['status_code'])
+            response[REPLAYED_HEADER] = 'true'
+            return response
+        return wrapper
+    return decorator
+
+
+def request_fingerprint(request):
+    """Hash what identifies a request: method, path, query and body."""
+    payload = json.dumps(
+        {
+            'method': request.method,
+            'path': request.path,
+            'query': sorted(request.query_params.lists()),
+            'body': request.data,
+        },
+        sort_keys=True,
+        cls=DjangoJSONEncoder,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _key(scope, user_id, identifier):
+    digest = hashlib.sha256(str(identifier).encode()).hexdigest()
+    return f"idempotency:{scope}:{user_id}:{digest}"
+
+
+def _is_final(response):
+    return (
+        isinstance(response, Response)
+        and status.is_success(response.status_code)
+        and response.status_code != status.HTTP_202_ACCEPTED
+    )
+
+
+def _get(key):
+    try:
+        return cache.get(key)
+    except Exception as e:
+        logger.warning(f"Idempotency cache unavailable, using the database: {str(e)}")
+    record = IdempotencyRecord.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+    if record is None:
+        return None
+    return {'fingerprint': record.fingerprint, 'status_code': record.status_code, 'response': record.response}
+
+
+def _begin(key, fingerprint):
+    """Take the lock of a new request; False if another request holds the key."""
+    entry = {'fingerprint': fingerprint, 'status_code': None, 'response': None}
+    try:
+        return cache.add(key, entry, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Idempotency cache unavailable, using the database: {str(e)}")
+
+    now = timezone.now()
+    IdempotencyRecord.objects.filter(key=key, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            IdempotencyRecord.objects.create(
+                key=key, fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT),
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def _finish(key, fingerprint, response):
+    # Stored as JSON, so a replay renders exactly what the first response did
+    data = json.loads(json.dumps(response.data, cls=DjangoJSONEncoder))
+    entry = {'fingerprint': fingerprint, 'status_code': response.status_code, 'response': data}
+    try:
+        cache.set(key, entry, timeout=settings.IDEMPOTENCY_TTL)
+        return
+    except Exception as e:
+        logger.warning(f"Idempotency cache unavailable, using the database: {str(e)}")
+    IdempotencyRecord.objects.update_or_create(key=key, defaults={
+        **entry, 'expires_at': timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_TTL),
+    })
+
+
+def _release(key):
+    try:
+        cache.delete(key)
+        return
+    except Exception as e:
+        logger.warning(f"Idempotency cache unavailable, using the database: {str(e)}")
+    IdempotencyRecord.objects.filter(key=key).delete()
+
+
+def purge_expired():
+    """Delete expired records from the database fallback; returns how many."""
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,82 @@
+"""
+Prometheus metrics of every worker process.
+
+Gunicorn and Celery each run several worker processes, and every process
+has its own in-memory registry. With PROMETHEUS_MULTIPROC_DIR set in their
+environment, prometheus_client writes each process's samples to files in
+that directory instead, and ``registry`` merges them, so a scrape sees all
+workers rather than whichever one answered.
+
+- the web service serves its metrics at ``/metrics/``, to clients in
+  METRICS_ALLOWED_IPS or presenting METRICS_TOKEN as a bearer token
+- Celery workers, which have no HTTP server, serve theirs on
+  CELERY_METRICS_PORT (see university_food_system.celery); the port is
+  only reachable inside the service network
+
+The directory must be emptied when the service starts, before workers are
+forked (``reset_multiprocess_dir``), and the files of exited workers marked
+dead (``mark_process_dead``).
+"""
+import hmac
+import ipaddress
+import os
+import shutil
+
+from django.conf import settings
+from prometheus_client import REGISTRY, CollectorRegistry, generate_latest, multiprocess, start_http_server
+
+from .logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def _multiprocess_dir():
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+
+def registry():
+    """Get the registry to expose: all workers' samples in multiprocess mode, this process's otherwise."""
+    if not _multiprocess_dir():
+        return REGISTRY
+    merged = CollectorRegistry()
+    multiprocess.MultiProcessCollector(merged)
+    return merged
+
+
+def render():
+    return generate_latest(registry())
+
+
+def reset_multiprocess_dir():
+    """Empty the multiprocess directory of a previous run; call before forking workers."""
+    path = _multiprocess_dir()
+    if not path:
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def mark_process_dead(pid):
+    if _multiprocess_dir():
+        multiprocess.mark_process_dead(pid)
+
+
+def serve_worker_metrics():
+    """Serve the metrics of a Celery worker and its pool processes over HTTP."""
+    reset_multiprocess_dir()
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=registry())
+        logger.info(f"Serving worker metrics on port {settings.CELERY_METRICS_PORT}")
+
+
+def is_scrape_allowed(request):
+    """Check whether a request may read the metrics, by client address or bearer token."""
+    token = settings.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    if token and header.startswith('Bearer ') and hmac.compare_digest(header[len('Bearer '):], token):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False) for network in settings.METRICS_ALLOWED_IPS)
@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class Voucher(models.Model):
@@ -36,3 +37,20 @@ class Voucher(models.Model):
 
     def __str__(self):
         return f"Voucher - Discount: {self.price}"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    A stored response of an idempotent endpoint (see core.idempotency).
+
+    Records are normally kept in Redis; this table holds them while Redis is
+    unavailable. A record without ``status_code`` is a request in progress.
+    """
+    key = models.CharField(max_length=128, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
@@ -1,3 +1,182 @@
-from django.test import TestCase
+import os
+import subprocess
+import sys
+import tempfile
+from unittest.mock import patch
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from prometheus_client import REGISTRY
+
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+
+from core import metrics
+from core.http import CircuitOpenError, GatewayClient
+from core.idempotency import idempotent
+from core.models import IdempotencyRecord
+from notifications.tests.fake_sms_server import FakeSMSServer
+
+
+class GatewayClientTestCase(SimpleTestCase):
+    def latency_count(self, client, endpoint, outcome):
+        return REGISTRY.get_sample_value(
+            'gateway_request_duration_seconds_count',
+            {'gateway': client.name, 'endpoint': endpoint, 'outcome': outcome},
+        ) or 0
+
+    def test_reuses_keep_alive_connection(self):
+        client = GatewayClient('test_keep_alive')
+        with FakeSMSServer() as server:
+            for _ in range(3):
+                self.assertEqual(client.post(server.url, json={}).status_code, 200)
+
+        self.assertEqual(len({request['client_port'] for request in server.requests}), 1)
+
+    def test_records_latency_per_endpoint(self):
+        client = GatewayClient('test_metrics')
+        with FakeSMSServer(statuses=[200, 503]) as server:
+            client.post(server.url, endpoint='verify', json={})
+            client.post(server.url, endpoint='verify', json={})
+
+        self.assertEqual(self.latency_count(client, 'verify', '2xx'), 1)
+        self.assertEqual(self.latency_count(client, 'verify', '5xx'), 1)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        client = GatewayClient('test_breaker', failure_threshold=2, reset_timeout=30)
+        with FakeSMSServer(statuses=[500, 502]) as server:
+            client.post(server.url, json={})
+            client.post(server.url, json={})
+
+            # Fails fast without calling the gateway
+            with self.assertRaises(CircuitOpenError):
+                client.post(server.url, json={})
+            self.assertEqual(len(server.requests), 2)
+
+            # After the reset timeout one trial call goes through and closes the circuit
+            with patch('core.http.time.monotonic', return_value=client.breaker.opened_at + 31):
+                self.assertEqual(client.post(server.url, json={}).status_code, 200)
+            client.post(server.url, json={})
+
+        self.assertEqual(len(server.requests), 4)
+
+    def test_connection_errors_count_as_failures(self):
+        client = GatewayClient('test_refused', failure_threshold=1, connect_timeout=0.5)
+        with FakeSMSServer() as server:
+            url = server.url
+        # The server is gone, so the connection is refused
+        with self.assertRaises(requests.ConnectionError):
+            client.post(url, json={})
+        with self.assertRaises(CircuitOpenError):
+            client.post(url, json={})
+
+    def test_async_post(self):
+        client = GatewayClient('test_async')
+        with FakeSMSServer() as server:
+            response = async_to_sync(client.apost)(server.url, json={'a': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(server.requests[0]['json'], {'a': 1})
+
+
+METRICS_WORKER = """
+from prometheus_client import Histogram
+Histogram('worker_job_seconds', 'Job time').observe(1)
+"""
+
+
+class MetricsTestCase(SimpleTestCase):
+    def test_scrapes_are_restricted(self):
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='127.0.0.1').status_code, 200)
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='203.0.113.9').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['203.0.113.0/24']):
+            self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='203.0.113.9').status_code, 200)
+        with override_settings(METRICS_TOKEN='s3cret'):
+            response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.9', HTTP_AUTHORIZATION='Bearer s3cret')
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get('/metrics/', REMOTE_ADDR='203.0.113.9', HTTP_AUTHORIZATION='Bearer guess')
+            self.assertEqual(response.status_code, 403)
+
+    def test_multiprocess_mode_merges_worker_processes(self):
+        with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+            for _ in range(2):
+                subprocess.run([sys.executable, '-c', METRICS_WORKER], check=True, env=os.environ)
+            self.assertEqual(metrics.registry().get_sample_value('worker_job_seconds_count'), 2)
+
+
+class CountingView(APIView):
+    calls = 0
+    during = None
+
+    @idempotent('counting')
+    def post(self, request):
+        CountingView.calls += 1
+        if request.data.get('fail'):
+            return Response({"error": "gateway down"}, status=503)
+        if request.data.get('reject'):
+            return Response({"error": "gateway rejected the request"}, status=400)
+        if CountingView.during:
+            # Something arriving while this request still runs
+            return Response({"during": CountingView.during()}, status=201)
+        return Response({"calls": CountingView.calls}, status=201)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class IdempotencyTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        CountingView.calls = 0
+        CountingView.during = None
+        self.user = get_user_model().objects.create_user(phone_number='09120000001', password='x', role='student')
+
+    def post(self, data, key=None, user=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        request = APIRequestFactory().post('/counting/', data, format='json', **headers)
+        force_authenticate(request, user=user or self.user)
+        return CountingView.as_view()(request)
+
+    def test_requests_without_a_key_only_block_duplicates_in_flight(self):
+        CountingView.during = lambda: self.post({'reservation_id': 1}).status_code
+        self.assertEqual(self.post({'reservation_id': 1}).data, {"during": 409})
+        CountingView.during = None
+        # Once done, the same request runs again instead of replaying a possibly stale answer
+        self.assertEqual(self.post({'reservation_id': 1}).data, {"calls": 2})
+        again = self.post({'reservation_id': 1})
+        self.assertEqual(again.data, {"calls": 3})
+        self.assertNotIn('Idempotent-Replayed', again)
+
+    def test_client_keys(self):
+        self.assertEqual(self.post({'a': 1}, key='k1').data, {"calls": 1})
+        self.assertEqual(self.post({'a': 1}, key='k1').data, {"calls": 1})
+        self.assertEqual(self.post({'a': 2}, key='k1').status_code, 422)
+        self.assertEqual(self.post({'a': 1}, key='k2').data, {"calls": 2})
+        replayed = self.post({'a': 1}, key='k1')
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+
+    def test_errors_are_not_stored(self):
+        self.assertEqual(self.post({'reject': True}, key='k1').status_code, 400)
+        self.assertEqual(self.post({'reject': True}, key='k1').status_code, 400)
+        self.assertEqual(CountingView.calls, 2)
+
+    def test_server_errors_are_not_stored(self):
+        self.assertEqual(self.post({'fail': True}).status_code, 503)
+        self.assertEqual(self.post({'fail': True}).status_code, 503)
+        self.assertEqual(CountingView.calls, 2)
+
+    def test_falls_back_to_the_database(self):
+        with patch('core.idempotency.cache') as broken:
+            for method in ('get', 'add', 'set', 'delete'):
+                getattr(broken, method).side_effect = ConnectionError("redis down")
+            self.assertEqual(self.post({'reservation_id': 1}, key='k1').data, {"calls": 1})
+            self.assertEqual(self.post({'reservation_id': 1}, key='k1').data, {"calls": 1})
+
+            record = IdempotencyRecord.objects.get()
+            self.assertEqual(record.status_code, 201)
+            # A request still in progress blocks its repeats
+            record.status_code = None
+            record.save()
+            self.assertEqual(self.post({'reservation_id': 1}, key='k1').status_code, 409)
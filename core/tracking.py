@@ -0,0 +1,86 @@
+"""
+Field change tracking for models.
+
+Models that mix in FieldTrackerMixin remember the values of their
+``tracked_fields`` as they were loaded from (or last saved to) the database,
+so signal handlers and save() overrides can tell what changed without
+re-reading the row.
+"""
+from django.db import models
+
+
+class FieldTrackerMixin(models.Model):
+    """
+    Remember the database values of ``tracked_fields`` on each instance.
+
+    Fields are named by attribute name, so foreign keys are tracked as
+    ``<name>_id``. The snapshot is taken when the instance is loaded and
+    refreshed after every save.
+    """
+    tracked_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self):
+        # Deferred fields are left out and looked up on demand by original_value()
+        self._tracked_originals = {
+            name: self.__dict__[name] for name in self.tracked_fields if name in self.__dict__
+        }
+
+    def original_value(self, name):
+        """
+        Get the value a tracked field had in the database.
+
+        Args:
+            name: Attribute name of a tracked field
+
+        Returns:
+            The loaded value, or None for instances that haven't been saved yet
+        """
+        if self._state.adding:
+            return None
+        originals = self.__dict__.setdefault('_tracked_originals', {})
+        if name not in originals:
+            # The field was deferred when the row was loaded
+            originals[name] = type(self)._base_manager.filter(pk=self.pk).values_list(name, flat=True).first()
+        return originals[name]
+
+    def has_changed(self, name):
+        """Check whether a tracked field differs from its database value."""
+        if self._state.adding:
+            return True
+        return getattr(self, name) != self.original_value(name)
+
+    def changed_fields(self):
+        """
+        Get the tracked fields that differ from their database values.
+
+        Returns:
+            dict: Mapping of attribute name to its original value
+        """
+        return {
+            name: self.original_value(name)
+            for name in self.tracked_fields
+            if self.has_changed(name)
+        }
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self._snapshot_tracked_fields()
+            return
+
+        # Fields left out of update_fields still hold their old database values
+        originals = self.__dict__.setdefault('_tracked_originals', {})
+        fields = {field.attname: field for field in self._meta.concrete_fields}
+        for name in self.tracked_fields:
+            if fields[name].name in update_fields or name in update_fields:
+                originals[name] = getattr(self, name)
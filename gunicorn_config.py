@@ -14,3 +14,14 @@ loglevel = "info"
 
 # Worker Class
 worker_class = "gthread"
+
+
+# Prometheus multiprocess mode (core.metrics)
+def on_starting(server):
+    from core.metrics import reset_multiprocess_dir
+    reset_multiprocess_dir()
+
+
+def child_exit(server, worker):
+    from core.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
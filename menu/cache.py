@@ -0,0 +1,156 @@
+"""
+Cache of serialized daily menus.
+
+The daily menu is read far more often than it changes, so its serialized
+structure (menu, items, food, time slots) is cached per date and meal type.
+Entries are never deleted; instead each key carries two version counters:
+
+- a menu version, bumped when the menu, one of its items or time slots is
+  saved or deleted
+- a food version, bumped when any food or food category changes, since
+  every menu embeds food
+
+Seat counts change with every order, so they are not trusted from the cache:
+``get_daily_menu`` overlays the current capacities with one small query.
+Visibility (students don't see today's past time slots) is applied to the
+cached structure per request.
+
+Every cache call is guarded; if the cache is unreachable the menu is built
+from the database as before.
+"""
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+
+from core.logging_utils import get_logger
+
+from .models import DailyMenu, DailyMenuItem, TimeSlot
+from .serializers import GetDailyMenuSerializer
+
+logger = get_logger(__name__)
+
+FOOD_VERSION_KEY = 'menu_cache:food_version'
+MISSING = 'missing'
+
+
+def _menu_version_key(date, meal_type):
+    return f"menu_cache:version:{date}:{meal_type}"
+
+
+def _new_version():
+    # Seeding from the clock means a version lost from the cache never restarts at a number already used
+    return int(time.time() * 1000)
+
+
+def _get_versions(date, meal_type):
+    keys = [_menu_version_key(date, meal_type), FOOD_VERSION_KEY]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(key):
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Could not invalidate menu cache key {key}: {str(e)}")
+
+
+def invalidate_menu(date, meal_type):
+    """Invalidate the cached menu for a date and meal type once the current transaction commits."""
+    transaction.on_commit(lambda: _bump(_menu_version_key(date, meal_type)))
+
+
+def invalidate_food():
+    """Invalidate every cached menu once the current transaction commits."""
+    transaction.on_commit(lambda: _bump(FOOD_VERSION_KEY))
+
+
+def _build(date, meal_type, request):
+    try:
+        daily_menu = DailyMenu.objects.prefetch_related(
+            Prefetch(
+                'items',
+                queryset=DailyMenuItem.objects.select_related('food__category').prefetch_related(
+                    Prefetch('time_slots', queryset=TimeSlot.objects.order_by('start_time', 'id'))
+                )
+            )
+        ).get(date=date, meal_type=meal_type)
+    except DailyMenu.DoesNotExist:
+        return MISSING
+    return GetDailyMenuSerializer(daily_menu, context={'request': request}).data
+
+
+def _overlay_capacities(data):
+    """Replace the cached seat counts with the current ones."""
+    capacities = {}
+    slot_capacities = {}
+    for item_id, daily_capacity, is_available, slot_id, slot_capacity in DailyMenuItem.objects.filter(
+        daily_menu_id=data['id']
+    ).values_list('id', 'daily_capacity', 'is_available', 'time_slots__id', 'time_slots__capacity'):
+        capacities[item_id] = (daily_capacity, is_available)
+        if slot_id is not None:
+            slot_capacities[slot_id] = slot_capacity
+
+    for item in data['items']:
+        if item['id'] in capacities:
+            item['daily_capacity'], item['is_available'] = capacities[item['id']]
+        for slot in item['time_slots']:
+            slot['capacity'] = slot_capacities.get(slot['id'], slot['capacity'])
+
+
+def get_daily_menu(date, meal_type, request, upcoming_after=None):
+    """
+    Get the serialized daily menu for a date and meal type.
+
+    Args:
+        date: Menu date
+        meal_type: 'lunch' or 'dinner'
+        request: The current request, used to build absolute image URLs
+        upcoming_after: If given, only time slots starting after this instant are included
+
+    Returns:
+        dict: The menu as GetDailyMenuSerializer renders it, or None if there is no menu
+    """
+    key = None
+    data = None
+    try:
+        menu_version, food_version = _get_versions(date, meal_type)
+        # Image URLs are absolute, so the host the menu is served from is part of the key
+        key = f"menu_cache:daily:{date}:{meal_type}:{menu_version}:{food_version}:{request.build_absolute_uri('/')}"
+        data = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Menu cache unavailable, building menu from the database: {str(e)}")
+
+    fresh = data is None
+    if fresh:
+        data = _build(date, meal_type, request)
+        if key:
+            try:
+                cache.set(key, data, timeout=settings.MENU_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"Could not cache daily menu {date} {meal_type}: {str(e)}")
+
+    if data == MISSING:
+        return None
+
+    if not fresh:
+        _overlay_capacities(data)
+
+    if upcoming_after is not None:
+        for item in data['items']:
+            item['time_slots'] = [
+                slot for slot in item['time_slots']
+                if slot['starts_at'] is None or datetime.fromisoformat(slot['starts_at']) > upcoming_after
+            ]
+    return data
@@ -0,0 +1,318 @@
+"""
+Live seat availability for daily menus.
+
+``seat_stream`` is an ASGI application that serves the seat counts of a
+daily menu as Server-Sent Events, so students can watch seats go instead of
+polling the menu endpoint. It needs an ASGI server, so it is off unless
+SEAT_STREAM_ENABLED is set:
+
+- ordering processes only collect the ids of the time slots whose seats
+  were taken or released; a background thread publishes the ids collected
+  in each SEAT_STREAM_WINDOW as one Redis message, so neither a query nor
+  a Redis round-trip runs on the order path
+- each stream process keeps one Redis subscription (``SeatStreamHub``),
+  reads the current capacities of the changed slots once per window and
+  fans them out to its local connections
+- a connection first receives a ``snapshot`` event with every slot of the
+  menu, then ``capacity`` events with the slots and items that changed
+
+Events carry absolute capacities rather than differences, so a lost or
+reordered message is corrected by the next one.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import date as dt_date
+from urllib.parse import parse_qs
+
+import redis
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from core.logging_utils import get_logger
+
+from .models import TimeSlot
+
+logger = get_logger(__name__)
+
+CHANNEL_PREFIX = 'univ_food:seats:'
+CHANGES_CHANNEL = 'univ_food:seats-changed'
+HEARTBEAT_INTERVAL = 15
+
+
+def _channel(date, meal_type):
+    return f"{CHANNEL_PREFIX}{date}:{meal_type}"
+
+
+def capacities(**filters):
+    """
+    Get the current seat counts of the time slots matching ``filters``.
+
+    Returns:
+        dict: Mapping of channel name to a payload with ``time_slots``
+        (slot id to capacity) and ``items`` (item id to daily capacity and
+        availability)
+    """
+    payloads = defaultdict(lambda: {'time_slots': {}, 'items': {}})
+    for slot_id, capacity, item_id, daily_capacity, is_available, date, meal_type in TimeSlot.objects.filter(
+        **filters
+    ).values_list(
+        'id', 'capacity', 'daily_menu_item_id', 'daily_menu_item__daily_capacity',
+        'daily_menu_item__is_available', 'daily_menu_item__daily_menu__date',
+        'daily_menu_item__daily_menu__meal_type',
+    ):
+        payload = payloads[_channel(date, meal_type)]
+        payload['time_slots'][str(slot_id)] = capacity
+        payload['items'][str(item_id)] = {'daily_capacity': daily_capacity, 'is_available': is_available}
+    return payloads
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def _get_publisher():
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = redis.Redis.from_url(
+                settings.SEAT_STREAM_REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5
+            )
+        return _publisher
+
+
+def publish_capacity_changes(time_slot_ids):
+    """
+    Mark time slots as changed once the current transaction commits.
+
+    Args:
+        time_slot_ids: Ids of the time slots whose capacity changed
+    """
+    if not settings.SEAT_STREAM_ENABLED:
+        return
+    time_slot_ids = {pk for pk in time_slot_ids if pk}
+    if time_slot_ids:
+        transaction.on_commit(lambda: _mark_changed(time_slot_ids))
+
+
+_changed = set()
+_changed_lock = threading.Lock()
+_flusher = None
+
+
+def _mark_changed(time_slot_ids):
+    with _changed_lock:
+        _changed.update(time_slot_ids)
+    _ensure_flusher()
+
+
+def _ensure_flusher():
+    global _flusher
+    with _changed_lock:
+        # Threads don't survive a fork, so a forked worker starts its own
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_forever, name='seat-stream-flusher', daemon=True)
+            _flusher.start()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(settings.SEAT_STREAM_WINDOW)
+        flush_changes()
+
+
+def flush_changes():
+    """Publish the time slots changed since the last flush as one message."""
+    with _changed_lock:
+        time_slot_ids = set(_changed)
+        _changed.clear()
+    if not time_slot_ids:
+        return
+    try:
+        _get_publisher().publish(CHANGES_CHANNEL, json.dumps(sorted(time_slot_ids)))
+    except Exception as e:
+        # Kept for the next window; orders never wait on Redis
+        logger.warning(f"Could not publish seat changes: {str(e)}")
+        with _changed_lock:
+            _changed.update(time_slot_ids)
+
+
+class _Listener:
+    """One stream connection's pending, not yet sent, updates."""
+
+    def __init__(self):
+        self.pending = {'time_slots': {}, 'items': {}}
+        self.ready = asyncio.Event()
+
+    def merge(self, payload):
+        self.pending['time_slots'].update(payload.get('time_slots', {}))
+        self.pending['items'].update(payload.get('items', {}))
+        self.ready.set()
+
+    def take(self):
+        pending, self.pending = self.pending, {'time_slots': {}, 'items': {}}
+        self.ready.clear()
+        return pending
+
+
+class SeatStreamHub:
+    """
+    Per-process fan-out of Redis seat messages to local stream connections.
+
+    The Redis subscription is started with the first listener and kept for
+    the life of the process, reconnecting after errors.
+    """
+
+    def __init__(self):
+        self.listeners = defaultdict(set)
+        self.changed = set()
+        self._task = None
+
+    def subscribe(self, channel):
+        listener = _Listener()
+        self.listeners[channel].add(listener)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return listener
+
+    def unsubscribe(self, channel, listener):
+        self.listeners[channel].discard(listener)
+        if not self.listeners[channel]:
+            del self.listeners[channel]
+
+    def dispatch(self, channel, payload):
+        for listener in self.listeners.get(channel, ()):
+            listener.merge(payload)
+
+    async def refresh(self):
+        """Read the capacities of the changed slots and send them to their listeners."""
+        time_slot_ids, self.changed = self.changed, set()
+        if not time_slot_ids or not self.listeners:
+            return
+        payloads = await sync_to_async(capacities)(pk__in=time_slot_ids)
+        for channel, payload in payloads.items():
+            self.dispatch(channel, payload)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            client = aioredis.from_url(settings.SEAT_STREAM_REDIS_URL)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(CHANGES_CHANNEL)
+                deadline = None
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=settings.SEAT_STREAM_WINDOW
+                    )
+                    if message:
+                        if not self.changed:
+                            deadline = loop.time() + settings.SEAT_STREAM_WINDOW
+                        self.changed.update(json.loads(message['data']))
+                    # One capacity read per window, however many orders came in
+                    if self.changed and loop.time() >= deadline:
+                        await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Seat stream subscription failed, reconnecting: {str(e)}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+
+hub = SeatStreamHub()
+
+
+def _authenticate(scope, params):
+    """Validate the JWT from the Authorization header or, for EventSource clients, the ``token`` parameter."""
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+    headers = dict(scope.get('headers', []))
+    raw = headers.get(b'authorization', b'').decode()
+    token = raw.split(' ', 1)[1] if raw.lower().startswith('bearer ') else params.get('token', [''])[0]
+    try:
+        JWTAuthentication().get_validated_token(token.encode())
+        return True
+    except (InvalidToken, TokenError):
+        return False
+
+
+async def _respond(send, status, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+def _event(name, payload):
+    return {
+        'type': 'http.response.body',
+        'body': f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode(),
+        'more_body': True,
+    }
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def seat_stream(scope, receive, send):
+    """
+    ASGI application streaming seat changes of a daily menu as Server-Sent Events.
+
+    Query parameters: ``date`` (YYYY-MM-DD), ``meal_type`` (lunch/dinner) and,
+    for clients that can't set headers, ``token`` (a JWT access token).
+    """
+    params = parse_qs(scope.get('query_string', b'').decode())
+    try:
+        date = dt_date.fromisoformat(params.get('date', [''])[0])
+    except ValueError:
+        return await _respond(send, 400, {"error": "Invalid date format. Use YYYY-MM-DD"})
+    meal_type = params.get('meal_type', [''])[0]
+    if meal_type not in ['lunch', 'dinner']:
+        return await _respond(send, 400, {"error": "Invalid meal type. Must be 'lunch' or 'dinner'"})
+    if not _authenticate(scope, params):
+        return await _respond(send, 401, {"error": "Authentication credentials were not provided or are invalid."})
+
+    channel = _channel(date, meal_type)
+    # Subscribe before taking the snapshot so no change falls between the two
+    listener = hub.subscribe(channel)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        snapshot = await sync_to_async(capacities)(
+            daily_menu_item__daily_menu__date=date, daily_menu_item__daily_menu__meal_type=meal_type
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send(_event('snapshot', snapshot.get(channel, {'time_slots': {}, 'items': {}})))
+
+        while not disconnected.done():
+            ready = asyncio.ensure_future(listener.ready.wait())
+            await asyncio.wait({ready, disconnected}, timeout=HEARTBEAT_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            ready.cancel()
+            if disconnected.done():
+                break
+            if not listener.ready.is_set():
+                await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+                continue
+            await send(_event('capacity', listener.take()))
+    finally:
+        hub.unsubscribe(channel, listener)
+        disconnected.cancel()
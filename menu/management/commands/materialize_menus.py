@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from menu.materialize import materialize, template_plan
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the daily menus of a date range from the weekday template menus. "
+        "Items that already exist on a day are left alone, so it is safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('start_date', help="First date (YYYY-MM-DD)")
+        parser.add_argument('end_date', help="Last date, inclusive (YYYY-MM-DD)")
+        parser.add_argument('--meal-type', choices=['lunch', 'dinner'], help="Only create this meal type")
+
+    def handle(self, *args, **options):
+        try:
+            start_date = datetime.strptime(options['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError("Invalid date format. Use YYYY-MM-DD")
+        if end_date < start_date:
+            raise CommandError("end_date must not be before start_date")
+
+        plan = template_plan(start_date, end_date, [options['meal_type']] if options['meal_type'] else None)
+        _, result = materialize(plan)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.menus_created} menus, {result.items_created} items and "
+            f"{result.slots_created} time slots across {len(plan)} meal days "
+            f"({result.items_skipped} items already existed)."
+        ))
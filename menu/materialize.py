@@ -0,0 +1,245 @@
+"""
+Bulk materialization of daily menus.
+
+Daily menus, their items and time slots are computed in memory and written
+with one ``bulk_create`` per table, instead of one INSERT (and a round of
+``post_save`` receivers) per row. Because ``bulk_create`` skips signals, the
+work those receivers did is done here instead:
+
+- availability is settled once, before writing: an item is available only if
+  it was requested so and has daily and per-slot capacity, and its time
+  slots follow the item
+- each touched menu's cache entry is invalidated once
+
+Materialization is idempotent: an item whose food and serving window already
+exist on the menu is left alone, so re-running a template over the same
+dates adds nothing.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date as dt_date
+from datetime import datetime, timedelta
+
+from django.db import transaction
+
+from .cache import invalidate_menu
+from .models import DailyMenu, DailyMenuItem, TemplateMenu, TimeSlot
+
+ITEM_FIELDS = ['start_time', 'end_time', 'time_slot_count', 'time_slot_capacity', 'daily_capacity']
+
+
+@dataclass
+class MaterializeResult:
+    menus_created: int = 0
+    items_created: int = 0
+    items_skipped: int = 0
+    slots_created: int = 0
+
+
+def slot_times(start_time, end_time, count):
+    """
+    Split a serving window into ``count`` equal time slots.
+
+    Slots are whole minutes long; any remainder is left at the end of the
+    window. A window ending at or before its start runs past midnight.
+
+    Returns:
+        list: (start_time, end_time) tuples
+    """
+    if not count:
+        return []
+    duration = (end_time.hour * 60 + end_time.minute) - (start_time.hour * 60 + start_time.minute)
+    if duration <= 0:
+        duration += 24 * 60
+    slot_duration = duration // count
+    start = datetime.combine(dt_date.min, start_time)
+    return [
+        (
+            (start + timedelta(minutes=i * slot_duration)).time(),
+            (start + timedelta(minutes=(i + 1) * slot_duration)).time(),
+        )
+        for i in range(count)
+    ]
+
+
+def _item_key(food_id, start_time, end_time):
+    return food_id, start_time, end_time
+
+
+def _existing_menus(plan):
+    return {
+        (menu.date, menu.meal_type): menu
+        for menu in DailyMenu.objects.filter(
+            date__in={date for date, _ in plan}, meal_type__in={meal_type for _, meal_type in plan}
+        )
+    }
+
+
+def _existing_items(menu_ids):
+    existing = defaultdict(set)
+    for menu_id, food_id, start_time, end_time in DailyMenuItem.objects.filter(
+        daily_menu_id__in=list(menu_ids)
+    ).values_list('daily_menu_id', 'food_id', 'start_time', 'end_time'):
+        existing[menu_id].add(_item_key(food_id, start_time, end_time))
+    return existing
+
+
+def materialize(plan):
+    """
+    Create the daily menus, items and time slots described by ``plan``.
+
+    Args:
+        plan: Mapping of (date, meal_type) to a list of item dicts with
+            ``food_id``, ``start_time``, ``end_time``, ``time_slot_count``,
+            ``time_slot_capacity``, ``daily_capacity`` and optionally
+            ``is_available``
+
+    Returns:
+        tuple: Mapping of (date, meal_type) to its DailyMenu, and a
+        MaterializeResult with what was written
+    """
+    result = MaterializeResult()
+    if not plan:
+        return {}, result
+
+    with transaction.atomic():
+        menus = _existing_menus(plan)
+        new_menus = [
+            DailyMenu(date=date, meal_type=meal_type) for date, meal_type in plan if (date, meal_type) not in menus
+        ]
+        for menu in DailyMenu.objects.bulk_create(new_menus):
+            menus[(menu.date, menu.meal_type)] = menu
+        result.menus_created = len(new_menus)
+        touched = {(menu.date, menu.meal_type) for menu in new_menus}
+
+        existing = _existing_items(menus[key].pk for key in plan)
+
+        new_items = []
+        for key, items in plan.items():
+            menu = menus[key]
+            for item in items:
+                item_key = _item_key(item['food_id'], item['start_time'], item['end_time'])
+                if item_key in existing[menu.pk]:
+                    result.items_skipped += 1
+                    continue
+                existing[menu.pk].add(item_key)
+                touched.add(key)
+                new_items.append(DailyMenuItem(
+                    daily_menu=menu,
+                    food_id=item['food_id'],
+                    is_available=(
+                        item.get('is_available', True)
+                        and item['daily_capacity'] > 0
+                        and item['time_slot_capacity'] > 0
+                    ),
+                    **{field: item[field] for field in ITEM_FIELDS},
+                ))
+        DailyMenuItem.objects.bulk_create(new_items)
+        result.items_created = len(new_items)
+
+        new_slots = []
+        for item in new_items:
+            for start_time, end_time in slot_times(item.start_time, item.end_time, item.time_slot_count):
+                slot = TimeSlot(
+                    daily_menu_item=item,
+                    start_time=start_time,
+                    end_time=end_time,
+                    capacity=item.time_slot_capacity,
+                    is_available=item.is_available,
+                )
+                slot.set_bounds()
+                new_slots.append(slot)
+        TimeSlot.objects.bulk_create(new_slots)
+        result.slots_created = len(new_slots)
+
+        for date, meal_type in touched:
+            invalidate_menu(date, meal_type)
+
+    return {key: menus[key] for key in plan}, result
+
+
+def template_items(template_menu):
+    """Get a template menu's items in the form ``materialize`` expects."""
+    return [
+        {'food_id': item.food_id, **{field: getattr(item, field) for field in ITEM_FIELDS}}
+        for item in template_menu.items.all()
+    ]
+
+
+def template_plan(start_date, end_date, meal_types=None, templates=None):
+    """
+    Plan the daily menus of every date in a range from the weekday templates.
+
+    Each date uses the TemplateMenus mapped to the date's weekday name, by
+    default those whose ``day`` is that weekday. Dates without a template
+    are left out.
+
+    Args:
+        start_date: First date, inclusive
+        end_date: Last date, inclusive
+        meal_types: Only plan these meal types; all by default
+        templates: Optional mapping of weekday name to a list of TemplateMenu ids
+
+    Returns:
+        dict: A plan for ``materialize``
+    """
+    queryset = TemplateMenu.objects.prefetch_related('items')
+    if templates is not None:
+        queryset = queryset.filter(pk__in={pk for pks in templates.values() for pk in pks})
+    if meal_types:
+        queryset = queryset.filter(meal_type__in=meal_types)
+    queryset = queryset.order_by('id').in_bulk()
+
+    by_day = defaultdict(list)
+    if templates is None:
+        for template in queryset.values():
+            by_day[template.day].append(template)
+    else:
+        for day, pks in templates.items():
+            by_day[day] = [queryset[pk] for pk in pks if pk in queryset]
+
+    plan = {}
+    date = start_date
+    while date <= end_date:
+        for template in by_day.get(date.strftime('%A'), []):
+            plan.setdefault((date, template.meal_type), []).extend(template_items(template))
+        date += timedelta(days=1)
+    return plan
+
+
+def diff_plan(plan):
+    """
+    Compare a plan with the menus that already exist, without writing anything.
+
+    Returns:
+        list: One dict per planned (date, meal_type) that would change, with
+        whether the menu is new, the items that would be added and how many
+        planned items already exist. Items on a day that the plan doesn't
+        have are counted as ``unplanned``; materializing never removes them.
+    """
+    menus = _existing_menus(plan)
+    existing = _existing_items(menu.pk for menu in menus.values())
+
+    changes = []
+    for (date, meal_type), items in sorted(plan.items()):
+        menu = menus.get((date, meal_type))
+        present = existing[menu.pk] if menu else set()
+        planned = {_item_key(item['food_id'], item['start_time'], item['end_time']) for item in items}
+        added = [
+            item for item in items
+            if _item_key(item['food_id'], item['start_time'], item['end_time']) not in present
+        ]
+        if menu and not added:
+            continue
+        changes.append({
+            'date': str(date),
+            'meal_type': meal_type,
+            'new_menu': menu is None,
+            'add': [
+                {'food_id': item['food_id'], 'start_time': str(item['start_time']), 'end_time': str(item['end_time'])}
+                for item in added
+            ],
+            'existing': len(items) - len(added),
+            'unplanned': len(present - planned),
+        })
+    return changes
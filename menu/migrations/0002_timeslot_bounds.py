@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:14
+
+from django.db import migrations, models
+
+# Same rules as menu.schedule.slot_bounds: a slot starting before its item's window
+# belongs to the next day, and so does an end at or before the slot's start
+BACKFILL_BOUNDS = """
+    UPDATE menu_timeslot AS ts
+    SET starts_at = (
+            (dm.date + CASE WHEN ts.start_time < dmi.start_time THEN 1 ELSE 0 END) + ts.start_time
+        ) AT TIME ZONE 'Asia/Tehran',
+        ends_at = (
+            (dm.date + CASE WHEN ts.start_time < dmi.start_time THEN 1 ELSE 0 END
+                + CASE WHEN ts.end_time <= ts.start_time THEN 1 ELSE 0 END) + ts.end_time
+        ) AT TIME ZONE 'Asia/Tehran'
+    FROM menu_dailymenuitem AS dmi
+    JOIN menu_dailymenu AS dm ON dm.id = dmi.daily_menu_id
+    WHERE dmi.id = ts.daily_menu_item_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeslot',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(fields=['starts_at', 'daily_menu_item'], name='menu_timeslot_starts_at_idx'),
+        ),
+        migrations.RunSQL(BACKFILL_BOUNDS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:17
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_menus(apps, schema_editor):
+    """Move the items of duplicate daily menus onto the oldest one, so (date, meal_type) can be unique."""
+    DailyMenu = apps.get_model('menu', 'DailyMenu')
+    DailyMenuItem = apps.get_model('menu', 'DailyMenuItem')
+    duplicates = (
+        DailyMenu.objects.values('date', 'meal_type')
+        .annotate(count=Count('id'), keep=Min('id'))
+        .filter(count__gt=1)
+    )
+    for row in duplicates:
+        others = DailyMenu.objects.filter(date=row['date'], meal_type=row['meal_type']).exclude(pk=row['keep'])
+        DailyMenuItem.objects.filter(daily_menu__in=others).update(daily_menu_id=row['keep'])
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_timeslot_bounds'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_menus, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailymenu',
+            constraint=models.UniqueConstraint(fields=('date', 'meal_type'), name='unique_daily_menu'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+
+from core.tracking import FieldTrackerMixin
 from food.models import Food
 
 
@@ -31,15 +33,24 @@ class TemplateMenuItem(models.Model):
         return f"{self.food.name} ({self.template_menu})"
 
 
-class DailyMenu(models.Model):
+class DailyMenu(FieldTrackerMixin, models.Model):
     date = models.DateField()
     meal_type = models.CharField(max_length=10, choices=[('lunch', 'Lunch'), ('dinner', 'Dinner')])
 
+    # A new date moves the bounds of the menu's time slots, and a new date or
+    # meal type leaves a cached copy under the old key (menu.signals)
+    tracked_fields = ('date', 'meal_type')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'meal_type'], name='unique_daily_menu'),
+        ]
+
     def __str__(self):
         return f"{self.date} - {self.meal_type}"
 
 
-class DailyMenuItem(models.Model):
+class DailyMenuItem(FieldTrackerMixin, models.Model):
     daily_menu = models.ForeignKey(DailyMenu, on_delete=models.CASCADE, related_name="items")
     food = models.ForeignKey(Food, on_delete=models.CASCADE)
     start_time = models.TimeField()
@@ -49,6 +60,9 @@ class DailyMenuItem(models.Model):
     daily_capacity = models.PositiveIntegerField()
     is_available = models.BooleanField(default=True)
 
+    # A new start moves the bounds of the item's time slots (menu.signals)
+    tracked_fields = ('start_time',)
+
     def save(self, *args, **kwargs):
         """Override save method to update related TimeSlot capacities."""
         if self.pk:  # Check if the object is being updated
@@ -67,6 +81,33 @@ class TimeSlot(models.Model):
     end_time = models.TimeField()
     capacity = models.PositiveIntegerField()
     is_available = models.BooleanField(default=True)
+    # start_time/end_time on the menu's date as instants, see menu.schedule
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['starts_at', 'daily_menu_item'], name='menu_timeslot_starts_at_idx'),
+        ]
+
+    def set_bounds(self):
+        """Compute ``starts_at`` and ``ends_at`` from the wall-clock times and the menu's date."""
+        from .schedule import slot_bounds
+
+        item = self.daily_menu_item
+        # Values may still be the strings they were assigned as
+        to_time = models.TimeField().to_python
+        self.starts_at, self.ends_at = slot_bounds(
+            models.DateField().to_python(item.daily_menu.date),
+            to_time(item.start_time), to_time(self.start_time), to_time(self.end_time),
+        )
+
+    def save(self, *args, **kwargs):
+        self.set_bounds()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'start_time', 'end_time'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'starts_at', 'ends_at'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.daily_menu_item.food.name} - {self.start_time} to {self.end_time}"
@@ -0,0 +1,61 @@
+"""
+Absolute timing of time slots.
+
+A time slot is stored as wall-clock times on its menu's date, which made
+every "has this slot started?" check combine the date, the time and the
+Tehran offset per request, and got slots after midnight wrong (a dinner slot
+at 00:30 belongs to the next calendar day). ``TimeSlot.starts_at`` and
+``ends_at`` hold the precomputed instants instead; this module computes them
+and answers timing questions from them, so they are plain comparisons, or a
+range scan on the ``starts_at`` index in queries.
+
+The bounds are kept in step with the slot's times, its menu item's start
+and its menu's date (see menu.signals).
+"""
+from datetime import datetime, timedelta
+
+import pytz
+from django.utils import timezone
+
+IRAN_TZ = pytz.timezone("Asia/Tehran")
+
+
+def slot_bounds(date, item_start_time, start_time, end_time):
+    """
+    Get the absolute start and end of a time slot.
+
+    A slot starting before its menu item's serving window belongs to the
+    next day, and so does an end at or before the slot's start.
+
+    Args:
+        date: Date of the slot's daily menu
+        item_start_time: Start of the menu item's serving window
+        start_time: Slot start (wall clock)
+        end_time: Slot end (wall clock)
+
+    Returns:
+        tuple: Timezone-aware (starts_at, ends_at)
+    """
+    start_date = date + timedelta(days=1) if start_time < item_start_time else date
+    starts_at = IRAN_TZ.localize(datetime.combine(start_date, start_time))
+    ends_at = IRAN_TZ.localize(datetime.combine(start_date, end_time))
+    if ends_at <= starts_at:
+        ends_at = IRAN_TZ.localize(datetime.combine(start_date + timedelta(days=1), end_time))
+    return starts_at, ends_at
+
+
+def _bounds(time_slot):
+    # Rows saved before the bounds were added may not have them yet
+    if time_slot.starts_at is None or time_slot.ends_at is None:
+        time_slot.set_bounds()
+    return time_slot.starts_at, time_slot.ends_at
+
+
+def has_started(time_slot, now=None):
+    """Whether a time slot's start has passed, so it can no longer be ordered."""
+    return _bounds(time_slot)[0] <= (now or timezone.now())
+
+
+def has_ended(time_slot, now=None):
+    """Whether a time slot's end has passed."""
+    return _bounds(time_slot)[1] <= (now or timezone.now())
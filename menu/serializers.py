@@ -1,10 +1,10 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import TemplateMenu, TemplateMenuItem, DailyMenu, DailyMenuItem, TimeSlot
 from django.db.models import Q
 from rest_framework.response import Response
 from rest_framework import status
 import ast
-from datetime import datetime, timedelta
 from food.serializers import FoodSerializer
 from food.models import Food
 
@@ -71,7 +71,7 @@ class CreateTemplateMenuSerializer(serializers.ModelSerializer):
 class TimeSlotSerializer(serializers.ModelSerializer):
     class Meta:
         model = TimeSlot
-        fields = ['id', 'start_time', 'end_time', 'capacity']
+        fields = ['id', 'start_time', 'end_time', 'starts_at', 'ends_at', 'capacity']
 
 
 class GetDailyMenuItemSerializer(serializers.ModelSerializer):
@@ -94,11 +94,6 @@ class CreateDailyMenuSerializer(serializers.ModelSerializer):
     items = CreateDailyMenuItemSerializer(many=True)
 
     def create(self, validated_data):
-        daily_menu = DailyMenu.objects.filter(Q(date=validated_data["date"]) & Q(meal_type=validated_data["meal_type"]))
-        if daily_menu:
-            daily_menu = daily_menu[0]
-        else:
-            daily_menu = DailyMenu.objects.create(date=validated_data["date"],meal_type=validated_data["meal_type"])
         items_data = validated_data.pop('items', [])
         # Ensure items_data is a list of dictionaries
         if isinstance(items_data, str):
@@ -110,51 +105,14 @@ class CreateDailyMenuSerializer(serializers.ModelSerializer):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-        for item_data in items_data:
+        # Imported here since the menu cache, which materialize uses, imports this module
+        from .materialize import materialize
 
-            # Set is_available to True by default if not provided
-            is_available = item_data.get('is_available', True)
-            
-            daily_menu_item = DailyMenuItem.objects.create(
-                daily_menu=daily_menu,
-                food_id=item_data.get('food').id,
-                start_time=item_data.get('start_time'),
-                end_time=item_data.get('end_time'),
-                time_slot_count=item_data.get('time_slot_count'),
-                time_slot_capacity=item_data.get('time_slot_capacity'),
-                daily_capacity=item_data.get('daily_capacity'),
-                is_available=is_available
-            )
-            daily_menu_item.refresh_from_db()
-            
-            # Calculate time slots
-            duration = (
-                (daily_menu_item.end_time.hour * 60 + daily_menu_item.end_time.minute) -
-                (daily_menu_item.start_time.hour * 60 + daily_menu_item.start_time.minute)
-            )
-            slot_duration = duration // daily_menu_item.time_slot_count
-            
-            # Create time slots
-            for i in range(daily_menu_item.time_slot_count):
-    
-                start_time = (
-                    (datetime.combine(datetime.today(), daily_menu_item.start_time) + 
-                    timedelta(minutes=i * slot_duration)).time()
-                )
-
-                end_time = (
-                    (datetime.combine(datetime.today(), daily_menu_item.start_time) + 
-                    timedelta(minutes=(i * slot_duration)+slot_duration)).time()
-                )
-                
-                TimeSlot.objects.create(
-                    daily_menu_item=daily_menu_item,
-                    start_time=start_time,
-                    end_time=end_time,
-                    capacity=daily_menu_item.time_slot_capacity
-                )
-
-        return daily_menu
+        key = (validated_data["date"], validated_data["meal_type"])
+        menus, _ = materialize({key: [
+            {**item_data, 'food_id': item_data['food'].id} for item_data in items_data
+        ]})
+        return menus[key]
 
     class Meta:
         model = DailyMenu
@@ -167,3 +125,37 @@ class GetDailyMenuSerializer(serializers.ModelSerializer):
     class Meta:
         model = DailyMenu
         fields = ['id', 'date', 'meal_type', 'items']
+
+
+class PlanMenusSerializer(serializers.Serializer):
+    """Validates a request to materialize the menus of a date range from templates."""
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    templates = serializers.DictField(
+        child=serializers.ListField(child=serializers.IntegerField()),
+        required=False,
+        help_text="Weekday name to the TemplateMenu ids to use on that weekday",
+    )
+    meal_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=['lunch', 'dinner']), required=False
+    )
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate_templates(self, value):
+        days = {choice for choice, _ in TemplateMenu._meta.get_field('day').choices}
+        unknown_days = set(value) - days
+        if unknown_days:
+            raise serializers.ValidationError(f"Unknown weekdays: {', '.join(sorted(unknown_days))}")
+        ids = {pk for pks in value.values() for pk in pks}
+        missing = ids - set(TemplateMenu.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError(f"Template menus not found: {sorted(missing)}")
+        return value
+
+    def validate(self, attrs):
+        days = (attrs['end_date'] - attrs['start_date']).days + 1
+        if days < 1:
+            raise serializers.ValidationError("end_date must not be before start_date.")
+        if days > settings.MENU_PLAN_MAX_DAYS:
+            raise serializers.ValidationError(f"A plan can cover at most {settings.MENU_PLAN_MAX_DAYS} days.")
+        return attrs
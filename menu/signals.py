@@ -1,6 +1,9 @@
-from django.db.models.signals import post_save, pre_save
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from .models import DailyMenuItem, TimeSlot
+from food.models import Food, FoodCategory
+from .cache import invalidate_food, invalidate_menu
+from .models import DailyMenu, DailyMenuItem, TimeSlot
 
 @receiver(post_save, sender=DailyMenuItem)
 def update_daily_menu_item_availability(sender, instance, **kwargs):
@@ -37,3 +40,52 @@ def update_time_slot_capacity(sender, instance, **kwargs):
     if original.time_slot_capacity != instance.time_slot_capacity:
         instance.time_slots.update(capacity=instance.time_slot_capacity)
 
+
+def _refresh_slot_bounds(time_slots):
+    slots = list(time_slots.select_related('daily_menu_item__daily_menu'))
+    for slot in slots:
+        slot.set_bounds()
+    TimeSlot.objects.bulk_update(slots, ['starts_at', 'ends_at'])
+
+
+@receiver(post_save, sender=DailyMenuItem)
+def update_time_slot_bounds(sender, instance, created, **kwargs):
+    """Recompute the bounds of an item's time slots when its start time changes."""
+    if not created and instance.has_changed('start_time'):
+        _refresh_slot_bounds(TimeSlot.objects.filter(daily_menu_item=instance))
+
+
+@receiver(post_save, sender=DailyMenu)
+def update_time_slot_bounds_of_menu(sender, instance, created, **kwargs):
+    """Recompute the bounds of a menu's time slots when its date changes."""
+    if not created and instance.has_changed('date'):
+        _refresh_slot_bounds(TimeSlot.objects.filter(daily_menu_item__daily_menu=instance))
+
+
+@receiver([post_save, post_delete], sender=DailyMenu)
+def invalidate_cached_menu(sender, instance, created=False, **kwargs):
+    """Drop the cached copy of a daily menu when it changes, under its old date and meal type too."""
+    invalidate_menu(instance.date, instance.meal_type)
+    moved = {} if created else instance.changed_fields()
+    if moved:
+        invalidate_menu(moved.get('date', instance.date), moved.get('meal_type', instance.meal_type))
+
+
+@receiver([post_save, post_delete], sender=DailyMenuItem)
+@receiver([post_save, post_delete], sender=TimeSlot)
+def invalidate_cached_menu_of_item(sender, instance, **kwargs):
+    """Drop the cached copy of the daily menu an item or time slot belongs to."""
+    try:
+        item = instance.daily_menu_item if sender is TimeSlot else instance
+        daily_menu = item.daily_menu
+    except ObjectDoesNotExist:
+        # Deleted along with its menu, whose own signal invalidates the cache
+        return
+    invalidate_menu(daily_menu.date, daily_menu.meal_type)
+
+
+@receiver([post_save, post_delete], sender=Food)
+@receiver([post_save, post_delete], sender=FoodCategory)
+def invalidate_cached_menus_of_food(sender, instance, **kwargs):
+    """Menus embed food details, so any food or category change invalidates all of them."""
+    invalidate_food()
@@ -0,0 +1,62 @@
+"""
+Celery tasks for menu planning.
+"""
+from dataclasses import asdict
+from datetime import date as dt_date
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+
+from core.logging_utils import get_logger
+from university_food_system.tasks_with_logging import task_with_logging
+
+from .materialize import MaterializeResult, diff_plan, materialize, template_plan
+
+logger = get_logger(__name__)
+
+
+@shared_task(bind=True)
+@task_with_logging
+def plan_menus(self, start_date, end_date, templates=None, meal_types=None, dry_run=False):
+    """
+    Materialize the daily menus of a date range from weekday templates.
+
+    The range is written MENU_PLAN_CHUNK_DAYS days at a time, each chunk in
+    its own transaction, so a year of menus never holds one long transaction
+    and a failure keeps the chunks already written (re-running skips them).
+    Progress is reported as a PROGRESS state with the days done so far.
+
+    Args:
+        start_date: First date, inclusive (YYYY-MM-DD)
+        end_date: Last date, inclusive (YYYY-MM-DD)
+        templates: Optional mapping of weekday name to a list of TemplateMenu ids;
+            by default each template applies to its own ``day``
+        meal_types: Only plan these meal types; all by default
+        dry_run: Only report what would change
+
+    Returns:
+        dict: Totals of what was written, or with ``dry_run`` the per-day changes
+    """
+    start_date = dt_date.fromisoformat(start_date)
+    end_date = dt_date.fromisoformat(end_date)
+    total_days = (end_date - start_date).days + 1
+
+    if dry_run:
+        changes = diff_plan(template_plan(start_date, end_date, meal_types, templates))
+        return {'dry_run': True, 'days': total_days, 'changes': changes}
+
+    totals = MaterializeResult()
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=settings.MENU_PLAN_CHUNK_DAYS - 1), end_date)
+        _, result = materialize(template_plan(chunk_start, chunk_end, meal_types, templates))
+        for field, value in asdict(result).items():
+            setattr(totals, field, getattr(totals, field) + value)
+
+        done_days = (chunk_end - start_date).days + 1
+        logger.info(f"Planned menus up to {chunk_end} ({done_days}/{total_days} days)")
+        self.update_state(state='PROGRESS', meta={'done_days': done_days, 'days': total_days, **asdict(totals)})
+        chunk_start = chunk_end + timedelta(days=1)
+
+    return {'dry_run': False, 'days': total_days, **asdict(totals)}
@@ -1,3 +1,404 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from food.models import Food
+from menu import live
+from menu.materialize import materialize, template_plan
+from menu.models import DailyMenu, DailyMenuItem, TemplateMenu, TemplateMenuItem, TimeSlot
+from menu.schedule import IRAN_TZ, has_ended, has_started
+from menu.tasks import plan_menus
+from orders.seats import allocate_seats, release_seats
+
+User = get_user_model()
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'menu-tests'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DailyMenuCacheTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        self.date = datetime.now().date() + timedelta(days=1)
+        self.menu = DailyMenu.objects.create(date=self.date, meal_type='lunch')
+        self.item = DailyMenuItem.objects.create(
+            daily_menu=self.menu, food=self.food, start_time='12:00', end_time='14:00',
+            time_slot_count=2, time_slot_capacity=10, daily_capacity=20,
+        )
+        self.slots = [
+            TimeSlot.objects.create(daily_menu_item=self.item, start_time=start, end_time=end, capacity=10)
+            for start, end in (('12:00', '13:00'), ('13:00', '14:00'))
+        ]
+        self.student = User.objects.create_user(phone_number='09120000090', password='x', role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def get_menu(self, date=None):
+        return self.client.get(reverse('daily_menu'), {'date': str(date or self.date), 'meal_type': 'lunch'})
+
+    def test_cached_menu_overlays_current_capacity(self):
+        first = self.get_menu()
+        self.assertEqual(first.status_code, 200)
+
+        # Orders change capacity with queryset updates, which don't invalidate the cache
+        TimeSlot.objects.filter(pk=self.slots[0].pk).update(capacity=3)
+        DailyMenuItem.objects.filter(pk=self.item.pk).update(daily_capacity=13)
+
+        # Only the capacity overlay hits the database
+        with self.assertNumQueries(1):
+            second = self.get_menu()
+
+        item = second.data['items'][0]
+        self.assertEqual(item['daily_capacity'], 13)
+        self.assertEqual([slot['capacity'] for slot in item['time_slots']], [3, 10])
+        self.assertEqual(item['food']['name'], 'Kebab')
+
+    def test_changes_invalidate_the_cache(self):
+        self.get_menu()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.food.name = 'Joojeh'
+            self.food.save()
+        self.assertEqual(self.get_menu().data['items'][0]['food']['name'], 'Joojeh')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.slots[1].delete()
+        self.assertEqual(len(self.get_menu().data['items'][0]['time_slots']), 1)
+
+    def test_moving_a_menu_invalidates_its_old_key(self):
+        self.get_menu()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu.date = self.date + timedelta(days=1)
+            self.menu.save()
+        self.assertEqual(self.get_menu().status_code, 404)
+        self.assertEqual(self.get_menu(self.date + timedelta(days=1)).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu.meal_type = 'dinner'
+            self.menu.save()
+        self.assertEqual(self.get_menu(self.date + timedelta(days=1)).status_code, 404)
+
+    def test_missing_menu(self):
+        self.assertEqual(self.get_menu(self.date + timedelta(days=1)).status_code, 404)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DailyMenu.objects.create(date=self.date + timedelta(days=1), meal_type='lunch')
+        self.assertEqual(self.get_menu(self.date + timedelta(days=1)).status_code, 200)
+
+    def test_students_only_see_upcoming_slots_today(self):
+        today = datetime.now().date()
+        menu = DailyMenu.objects.create(date=today, meal_type='lunch')
+        item = DailyMenuItem.objects.create(
+            daily_menu=menu, food=self.food, start_time='00:00', end_time='23:59',
+            time_slot_count=2, time_slot_capacity=10, daily_capacity=20,
+        )
+        TimeSlot.objects.create(daily_menu_item=item, start_time='00:00', end_time='00:01', capacity=10)
+        TimeSlot.objects.create(daily_menu_item=item, start_time='23:59', end_time='23:59:59', capacity=10)
+
+        self.assertEqual(len(self.get_menu(today).data['items'][0]['time_slots']), 1)
+
+        admin = User.objects.create_user(phone_number='09120000091', password='x', role='admin')
+        self.client.force_authenticate(admin)
+        # Served from the same cache entry, with every slot visible
+        self.assertEqual(len(self.get_menu(today).data['items'][0]['time_slots']), 2)
+
+
+@override_settings(SEAT_STREAM_ENABLED=True, SEAT_STREAM_WINDOW=0.05)
+class SeatStreamTestCase(TestCase):
+    def setUp(self):
+        food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        self.date = datetime.now().date() + timedelta(days=1)
+        menu = DailyMenu.objects.create(date=self.date, meal_type='lunch')
+        self.item = DailyMenuItem.objects.create(
+            daily_menu=menu, food=food, start_time='12:00', end_time='14:00',
+            time_slot_count=2, time_slot_capacity=10, daily_capacity=20,
+        )
+        self.slots = [
+            TimeSlot.objects.create(daily_menu_item=self.item, start_time=start, end_time=end, capacity=10)
+            for start, end in (('12:00', '13:00'), ('13:00', '14:00'))
+        ]
+        self.channel = live._channel(self.date, 'lunch')
+        self.student = User.objects.create_user(phone_number='09120000092', password='x', role='student')
+
+    def test_order_path_only_marks_slots_changed(self):
+        live._changed.clear()
+        publisher = MagicMock()
+        with patch('menu.live._get_publisher', return_value=publisher), patch('menu.live._ensure_flusher'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                allocate_seats({self.slots[0].pk: 3})
+                release_seats({self.slots[0].pk: 1})
+            # Committing neither queries nor talks to Redis
+            with self.assertNumQueries(0):
+                for callback in callbacks:
+                    callback()
+            publisher.publish.assert_not_called()
+
+            # The background flush sends every change of the window as one message
+            live.flush_changes()
+            live.flush_changes()
+        publisher.publish.assert_called_once_with(live.CHANGES_CHANNEL, json.dumps([self.slots[0].pk]))
+
+    def test_publish_failure_does_not_break_orders(self):
+        live._changed.clear()
+        with patch('menu.live._get_publisher', side_effect=ConnectionError), patch('menu.live._ensure_flusher'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(allocate_seats({self.slots[0].pk: 1}), {self.slots[0].pk: 1})
+            live.flush_changes()
+        # Kept for the next flush
+        self.assertEqual(live._changed, {self.slots[0].pk})
+        live._changed.clear()
+
+    async def test_hub_reads_changed_capacities_once_per_window(self):
+        listener = live._Listener()
+        live.hub.listeners[self.channel].add(listener)
+        try:
+            await sync_to_async(allocate_seats)({self.slots[0].pk: 2})
+            live.hub.changed.update([self.slots[0].pk, self.slots[1].pk])
+            await live.hub.refresh()
+        finally:
+            live.hub.unsubscribe(self.channel, listener)
+
+        self.assertEqual(listener.take(), {
+            'time_slots': {str(self.slots[0].pk): 8, str(self.slots[1].pk): 10},
+            'items': {str(self.item.pk): {'daily_capacity': 18, 'is_available': True}},
+        })
+        self.assertEqual(live.hub.changed, set())
+
+    async def stream(self, query, on_start=None):
+        """Run the stream app until it has sent a snapshot, then call ``on_start`` and disconnect."""
+        sent = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if message.get('body', b'').startswith(b'event: snapshot'):
+                if on_start:
+                    await on_start()
+                asyncio.get_running_loop().call_later(0.3, disconnect.set)
+
+        scope = {'type': 'http', 'path': '/api/menu/live/', 'query_string': query.encode(), 'headers': []}
+        with patch.object(live.hub, '_run', new=lambda: asyncio.sleep(0)):
+            await asyncio.wait_for(live.seat_stream(scope, receive, send), timeout=5)
+        return sent
+
+    def events(self, sent):
+        return [
+            message['body'].decode().split('\n')[:2]
+            for message in sent if message['type'] == 'http.response.body'
+        ]
+
+    async def test_stream_sends_snapshot_then_coalesced_updates(self):
+        token = str(AccessToken.for_user(self.student))
+        slot_a, slot_b = (str(slot.pk) for slot in self.slots)
+
+        async def burst():
+            # Three updates inside one window arrive as a single event with the latest values
+            live.hub.dispatch(self.channel, {'time_slots': {slot_a: 9}, 'items': {}})
+            live.hub.dispatch(self.channel, {'time_slots': {slot_a: 8}, 'items': {}})
+            live.hub.dispatch(self.channel, {'time_slots': {slot_b: 4}, 'items': {}})
+            # Other menus' updates are not forwarded
+            live.hub.dispatch(live._channel(self.date, 'dinner'), {'time_slots': {'999': 1}, 'items': {}})
+
+        sent = await self.stream(f"date={self.date}&meal_type=lunch&token={token}", on_start=burst)
+
+        self.assertEqual(sent[0]['status'], 200)
+        (snapshot_name, snapshot), (update_name, update) = self.events(sent)
+        self.assertEqual(snapshot_name, 'event: snapshot')
+        self.assertEqual(json.loads(snapshot[len('data: '):])['time_slots'], {slot_a: 10, slot_b: 10})
+        self.assertEqual(update_name, 'event: capacity')
+        self.assertEqual(json.loads(update[len('data: '):]), {'time_slots': {slot_a: 8, slot_b: 4}, 'items': {}})
+        self.assertNotIn(self.channel, live.hub.listeners)
+
+    async def test_stream_rejects_bad_requests(self):
+        token = str(AccessToken.for_user(self.student))
+        sent = await self.stream(f"date=tomorrow&meal_type=lunch&token={token}")
+        self.assertEqual(sent[0]['status'], 400)
+        sent = await self.stream(f"date={self.date}&meal_type=lunch&token=invalid")
+        self.assertEqual(sent[0]['status'], 401)
+
+
+class MaterializeTestCase(TestCase):
+    def setUp(self):
+        self.kebab = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        self.rice = Food.objects.create(name='Rice', price=Decimal('50000.00'))
+        self.start = datetime(2026, 9, 21).date()  # A Monday
+        for day in ('Monday', 'Wednesday'):
+            template = TemplateMenu.objects.create(day=day, meal_type='lunch')
+            TemplateMenuItem.objects.create(
+                template_menu=template, food=self.kebab, start_time=time(12, 0), end_time=time(14, 0),
+                time_slot_count=4, time_slot_capacity=10, daily_capacity=40,
+            )
+            TemplateMenuItem.objects.create(
+                template_menu=template, food=self.rice, start_time=time(12, 0), end_time=time(13, 0),
+                time_slot_count=2, time_slot_capacity=0, daily_capacity=20,
+            )
+
+    def test_materializes_a_date_range_in_bulk(self):
+        plan = template_plan(self.start, self.start + timedelta(days=27))
+        self.assertEqual(len(plan), 8)
+
+        # Two lookups and one insert per table, plus the savepoint, whatever the range
+        with self.assertNumQueries(7):
+            _, result = materialize(plan)
+        self.assertEqual((result.menus_created, result.items_created, result.slots_created), (8, 16, 48))
+
+        item = DailyMenuItem.objects.get(daily_menu__date=self.start, food=self.kebab)
+        self.assertEqual(
+            list(item.time_slots.order_by('start_time').values_list('start_time', 'end_time')),
+            [(time(12, 0), time(12, 30)), (time(12, 30), time(13, 0)), (time(13, 0), time(13, 30)), (time(13, 30), time(14, 0))],
+        )
+        # Items without per-slot capacity are unavailable, along with their slots
+        rice = DailyMenuItem.objects.get(daily_menu__date=self.start, food=self.rice)
+        self.assertFalse(rice.is_available)
+        self.assertFalse(rice.time_slots.filter(is_available=True).exists())
+
+    def test_rerun_is_idempotent(self):
+        materialize(template_plan(self.start, self.start + timedelta(days=6)))
+        _, result = materialize(template_plan(self.start, self.start + timedelta(days=13)))
+
+        self.assertEqual((result.menus_created, result.items_created, result.items_skipped), (2, 4, 4))
+        self.assertEqual(DailyMenu.objects.count(), 4)
+        self.assertEqual(TimeSlot.objects.count(), 24)
+
+    def test_use_template_endpoint(self):
+        admin = User.objects.create_user(phone_number='09120000093', password='x', role='admin')
+        client = APIClient()
+        client.force_authenticate(admin)
+        data = {'day': 'Monday', 'date': str(self.start), 'meal_type': 'lunch'}
+
+        for _ in range(2):
+            self.assertEqual(client.post(reverse('use_template_for_daily'), data).status_code, 201)
+
+        self.assertEqual(DailyMenuItem.objects.filter(daily_menu__date=self.start).count(), 2)
+        self.assertEqual(TimeSlot.objects.count(), 6)
+
+    @override_settings(MENU_PLAN_CHUNK_DAYS=7)
+    def test_plan_menus_writes_in_chunks_and_reports_progress(self):
+        with patch.object(plan_menus, 'update_state') as update_state:
+            result = plan_menus(str(self.start), str(self.start + timedelta(days=29)))
+
+        self.assertEqual(result['menus_created'], 9)
+        self.assertEqual(result['slots_created'], 54)
+        self.assertEqual(
+            [call.kwargs['meta']['done_days'] for call in update_state.call_args_list], [7, 14, 21, 28, 30]
+        )
+
+    def test_plan_menus_dry_run_diffs_against_existing_days(self):
+        monday = TemplateMenu.objects.get(day='Monday')
+        materialize(template_plan(self.start, self.start))
+        # Use Monday's template on Tuesdays too
+        templates = {'Monday': [monday.pk], 'Tuesday': [monday.pk]}
+
+        result = plan_menus(str(self.start), str(self.start + timedelta(days=1)), templates=templates, dry_run=True)
+
+        self.assertEqual(result['changes'], [{
+            'date': str(self.start + timedelta(days=1)), 'meal_type': 'lunch', 'new_menu': True,
+            'add': [
+                {'food_id': self.kebab.pk, 'start_time': '12:00:00', 'end_time': '14:00:00'},
+                {'food_id': self.rice.pk, 'start_time': '12:00:00', 'end_time': '13:00:00'},
+            ],
+            'existing': 0, 'unplanned': 0,
+        }])
+        self.assertEqual(DailyMenu.objects.count(), 1)
+
+    def test_plan_endpoint_enqueues_a_job(self):
+        admin = User.objects.create_user(phone_number='09120000094', password='x', role='admin')
+        client = APIClient()
+        client.force_authenticate(admin)
+        data = {'start_date': str(self.start), 'end_date': str(self.start + timedelta(days=180))}
+
+        with patch('menu.views.plan_menus.delay', return_value=MagicMock(id='task-1')) as delay:
+            response = client.post(reverse('plan_menus'), data, format='json')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.data['task_id'], 'task-1')
+            delay.assert_called_once_with(
+                data['start_date'], data['end_date'], templates=None, meal_types=None, dry_run=False
+            )
+
+            bad = client.post(reverse('plan_menus'), {**data, 'templates': {'Someday': [1]}}, format='json')
+            self.assertEqual(bad.status_code, 400)
+
+
+def local(instant):
+    return instant.astimezone(IRAN_TZ).strftime('%d %H:%M')
+
+
+class SlotScheduleTestCase(TestCase):
+    def setUp(self):
+        self.food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        self.date = datetime(2026, 9, 21).date()
+
+    def test_dinner_slots_past_midnight_belong_to_the_next_day(self):
+        menus, _ = materialize({(self.date, 'dinner'): [{
+            'food_id': self.food.pk, 'start_time': time(22, 0), 'end_time': time(1, 0),
+            'time_slot_count': 3, 'time_slot_capacity': 10, 'daily_capacity': 30,
+        }]})
+
+        slots = TimeSlot.objects.filter(daily_menu_item__daily_menu=menus[(self.date, 'dinner')]).order_by('starts_at')
+        self.assertEqual(
+            [(local(slot.starts_at), local(slot.ends_at)) for slot in slots],
+            [('21 22:00', '21 23:00'), ('21 23:00', '22 00:00'), ('22 00:00', '22 01:00')],
+        )
+
+    def test_start_checks(self):
+        menu = DailyMenu.objects.create(date=self.date, meal_type='lunch')
+        item = DailyMenuItem.objects.create(
+            daily_menu=menu, food=self.food, start_time='12:00', end_time='14:00',
+            time_slot_count=2, time_slot_capacity=10, daily_capacity=20,
+        )
+        early = TimeSlot.objects.create(daily_menu_item=item, start_time='12:00', end_time='13:00', capacity=10)
+        late = TimeSlot.objects.create(daily_menu_item=item, start_time='13:00', end_time='14:00', capacity=10)
+        now = IRAN_TZ.localize(datetime(2026, 9, 21, 12, 30))
+
+        self.assertTrue(has_started(early, now))
+        self.assertFalse(has_ended(early, now))
+        self.assertFalse(has_started(late, now))
+
+        # Moving a slot moves its bounds
+        early.start_time = '12:45'
+        early.save(update_fields=['start_time'])
+        early.refresh_from_db()
+        self.assertFalse(has_started(early, now))
+
+        # Slots saved before their bounds were computed fall back to the wall-clock times
+        TimeSlot.objects.filter(pk=late.pk).update(starts_at=None, ends_at=None)
+        late.refresh_from_db()
+        self.assertFalse(has_started(late, now))
+        self.assertTrue(has_ended(late, now + timedelta(hours=2)))
+
+    def test_moving_an_item_or_menu_moves_its_slots(self):
+        menu = DailyMenu.objects.create(date=self.date, meal_type='dinner')
+        item = DailyMenuItem.objects.create(
+            daily_menu=menu, food=self.food, start_time='22:00', end_time='23:30',
+            time_slot_count=1, time_slot_capacity=10, daily_capacity=10,
+        )
+        slot = TimeSlot.objects.create(daily_menu_item=item, start_time='23:00', end_time='23:30', capacity=10)
+
+        # Starting the item after the slot makes the slot belong to the next day
+        item = DailyMenuItem.objects.get(pk=item.pk)
+        item.start_time = time(23, 15)
+        item.save()
+        slot.refresh_from_db()
+        self.assertEqual((local(slot.starts_at), local(slot.ends_at)), ('22 23:00', '22 23:30'))
+
+        menu = DailyMenu.objects.get(pk=menu.pk)
+        menu.date = self.date + timedelta(days=7)
+        menu.save()
+        slot.refresh_from_db()
+        self.assertEqual((local(slot.starts_at), local(slot.ends_at)), ('29 23:00', '29 23:30'))
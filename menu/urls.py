@@ -6,6 +6,8 @@ from .views import (
     DailyMenuItemView,
     ToggleDailyMenuItemAvailabilityView,
     UseTemplateForDailyView,
+    PlanMenusView,
+    PlanMenusStatusView,
 )
 
 urlpatterns = [
@@ -15,4 +17,6 @@ urlpatterns = [
     path('daily/<int:pk>/', DailyMenuItemView.as_view(), name='daily_menu_item'),
     path('daily/<int:id>/availability/', ToggleDailyMenuItemAvailabilityView.as_view(), name='toggle_daily_menu_item'),
     path('use-template/', UseTemplateForDailyView.as_view(), name='use_template_for_daily'),
+    path('plan/', PlanMenusView.as_view(), name='plan_menus'),
+    path('plan/<str:task_id>/', PlanMenusStatusView.as_view(), name='plan_menus_status'),
 ]
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from celery.result import AsyncResult
 from .models import TemplateMenu, TemplateMenuItem, DailyMenu, DailyMenuItem, TimeSlot
 from .serializers import (
     CreateDailyMenuItemSerializer,
@@ -10,8 +11,12 @@ from .serializers import (
     CreateTemplateMenuSerializer,
     GetDailyMenuItemSerializer,
     GetDailyMenuSerializer,
+    PlanMenusSerializer,
     TemplateMenuSerializer,
 )
+from .cache import get_daily_menu
+from .materialize import materialize, template_items
+from .tasks import plan_menus
 from university_food_system.permissions import IsAdminOnly, IsAdminOrReadOnly
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q, Prefetch
@@ -131,10 +136,7 @@ class DailyMenuView(APIView):
             )
 
         try:
-            # Get current Iran time
-            current_iran_time = timezone.now().astimezone(IRAN_TZ)
             current_date = datetime.now().date()
-            current_iran_time = current_iran_time.time()
 
             # Validate and parse requested date
             try:
@@ -160,41 +162,12 @@ class DailyMenuView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            if requested_date == current_date:
-                # Optimize query with select_related and prefetch_related
-                daily_menu = DailyMenu.objects.select_related().prefetch_related(
-                    Prefetch(
-                        'items',
-                        queryset=DailyMenuItem.objects.select_related('food').prefetch_related(
-                            Prefetch(
-                            'time_slots',
-                            queryset=TimeSlot.objects.all() if user.role == "admin"
-                            else TimeSlot.objects.filter(start_time__gt=current_iran_time)
-                        )
-                    )
-                )
-                ).get(
-                Q(date=date) & Q(meal_type=meal_type)
-                )
-            else:
-                # Optimize query with select_related and prefetch_related
-                daily_menu = DailyMenu.objects.select_related().prefetch_related(
-                    Prefetch(
-                        'items',
-                        queryset=DailyMenuItem.objects.select_related('food').prefetch_related(
-                            Prefetch(
-                            'time_slots',
-                            queryset=TimeSlot.objects.all()
-                        )
-                    )
-                )
-                ).get(
-                Q(date=date) & Q(meal_type=meal_type)
-            )
-
-            # For admin users, return all data
-            serializer = GetDailyMenuSerializer(daily_menu, context={'request': request})
-            return Response(serializer.data)
+            # Students only see time slots that haven't started yet
+            upcoming_after = timezone.now() if user.role != "admin" else None
+            data = get_daily_menu(requested_date, meal_type, request, upcoming_after=upcoming_after)
+            if data is None:
+                raise DailyMenu.DoesNotExist
+            return Response(data)
 
         except DailyMenu.DoesNotExist:
             return Response(
@@ -293,43 +266,54 @@ class UseTemplateForDailyView(APIView):
         except TemplateMenu.DoesNotExist:
             return Response({"error": "Template menu not found for the specified day."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Create or retrieve the daily menu for the given date and meal type
-        daily_menu, created = DailyMenu.objects.get_or_create(date=date, meal_type=template_menu.meal_type)
-
-        # Copy template menu items to daily menu items
-        for item in template_menu.items.all():
-            daily_menu_item = DailyMenuItem.objects.create(
-                daily_menu=daily_menu,
-                food=item.food,
-                start_time=item.start_time,
-                end_time=item.end_time,
-                time_slot_count=item.time_slot_count,
-                time_slot_capacity=item.time_slot_capacity,
-                daily_capacity=item.daily_capacity,
-                is_available=True
-            )
-
-            # Calculate and create time slots for each daily menu item
-            duration = (
-                (daily_menu_item.end_time.hour * 60 + daily_menu_item.end_time.minute) -
-                (daily_menu_item.start_time.hour * 60 + daily_menu_item.start_time.minute)
-            )
-            slot_duration = duration // daily_menu_item.time_slot_count
+        try:
+            date = datetime.strptime(date, '%Y-%m-%d').date()
+        except ValueError:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
 
-            for i in range(daily_menu_item.time_slot_count):
-                start_time = (
-                    (datetime.combine(datetime.today(), daily_menu_item.start_time) +
-                     timedelta(minutes=i * slot_duration)).time()
-                )
-                end_time = (
-                    (datetime.combine(datetime.today(), daily_menu_item.start_time) +
-                     timedelta(minutes=(i * slot_duration) + slot_duration)).time()
-                )
-                TimeSlot.objects.create(
-                    daily_menu_item=daily_menu_item,
-                    start_time=start_time,
-                    end_time=end_time,
-                    capacity=daily_menu_item.time_slot_capacity
-                )
+        # Create or reuse the daily menu and copy the template's items and time slots into it
+        materialize({(date, template_menu.meal_type): template_items(template_menu)})
 
         return Response({"message": "Daily menu created successfully from template."}, status=status.HTTP_201_CREATED)
+
+
+class PlanMenusView(APIView):
+    """
+    Materialize the daily menus of a date range from templates in the background.
+
+    POST: Start a planning job; responds with its task id
+    """
+    permission_classes = [IsAuthenticated, IsAdminOnly]
+
+    def post(self, request):
+        serializer = PlanMenusSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        task = plan_menus.delay(
+            str(data['start_date']),
+            str(data['end_date']),
+            templates=data.get('templates'),
+            meal_types=data.get('meal_types'),
+            dry_run=data['dry_run'],
+        )
+        return Response({"task_id": task.id}, status=status.HTTP_202_ACCEPTED)
+
+
+class PlanMenusStatusView(APIView):
+    """
+    GET: State of a planning job, with its progress while running and its result once done
+    """
+    permission_classes = [IsAuthenticated, IsAdminOnly]
+
+    def get(self, request, task_id):
+        result = AsyncResult(task_id)
+        response = {"task_id": task_id, "state": result.state}
+        if result.state == 'PROGRESS':
+            response["progress"] = result.info
+        elif result.state == 'SUCCESS':
+            response["result"] = result.result
+        elif result.state == 'FAILURE':
+            response["error"] = str(result.result)
+        return Response(response)
@@ -0,0 +1,11 @@
+from django.contrib import admin
+from .models import SMSOutbox
+
+
+@admin.register(SMSOutbox)
+class SMSOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'phone_number', 'template_id', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'template_id', 'created_at')
+    search_fields = ('phone_number', 'dedupe_key')
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
+    list_per_page = 50
@@ -0,0 +1,53 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class SMSOutbox(models.Model):
+    """
+    An SMS waiting to be sent.
+
+    Rows are written in the same transaction as the change that triggers the
+    message and sent later by the drain_sms_outbox task, so a slow or failing
+    SMS provider never blocks a request or holds database locks.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    phone_number = models.CharField(max_length=15)
+    template_id = models.CharField(max_length=20, help_text="Provider template the message is rendered from")
+    parameters = models.JSONField(default=dict, help_text="Template parameters as name/value pairs")
+    dedupe_key = models.CharField(
+        max_length=100,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text="Optional key that stops the same message from being queued twice"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'SMS outbox message'
+        indexes = [
+            # The drain query only ever looks at pending messages that are due
+            models.Index(
+                fields=['next_attempt_at'],
+                condition=Q(status='pending'),
+                name='sms_outbox_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"SMS {self.id} to {self.phone_number} ({self.status})"
@@ -0,0 +1,127 @@
+"""
+Transactional SMS outbox.
+
+``queue_sms`` and ``queue_many`` write outbox rows inside the caller's
+transaction, so a message exists exactly when the change that caused it
+commits. Once it does, a drain task is kicked off to send it right away; the
+periodic drain picks up anything the kick missed.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.logging_utils import get_logger
+
+from .models import SMSOutbox
+
+logger = get_logger(__name__)
+
+
+def queue_sms(phone_number, template_id, parameters, dedupe_key=None):
+    """
+    Queue one templated SMS.
+
+    Args:
+        phone_number: Recipient's phone number
+        template_id: Provider template id
+        parameters: Mapping of template parameter names to values
+        dedupe_key: Optional key; a message with the same key is only queued once
+    """
+    queue_many([SMSOutbox(
+        phone_number=phone_number,
+        template_id=str(template_id),
+        parameters=parameters,
+        dedupe_key=dedupe_key,
+    )])
+
+
+def queue_many(messages):
+    """
+    Queue several unsaved SMSOutbox messages with one INSERT.
+
+    Messages whose dedupe_key is already queued are silently dropped.
+    """
+    if not messages:
+        return
+    SMSOutbox.objects.bulk_create(messages, ignore_conflicts=True)
+    transaction.on_commit(_kick_drain)
+
+
+def _kick_drain():
+    from .tasks import drain_sms_outbox
+
+    try:
+        drain_sms_outbox.delay()
+    except Exception as e:
+        # The periodic drain will send the messages instead
+        logger.warning(f"Could not queue SMS outbox drain: {str(e)}")
+
+
+def claim_batch(limit):
+    """
+    Claim up to ``limit`` due messages for sending.
+
+    Rows are picked with ``FOR UPDATE SKIP LOCKED``, so concurrent drains
+    split the backlog instead of waiting on each other. Claimed rows get a
+    lease: ``next_attempt_at`` is pushed forward, so if the worker dies
+    mid-send the messages become due again once the lease runs out.
+
+    Returns:
+        list: The claimed SMSOutbox messages, with ``attempts`` already counted
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            SMSOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=SMSOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:limit]
+        )
+        if messages:
+            SMSOutbox.objects.filter(pk__in=[message.pk for message in messages]).update(
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + timedelta(seconds=settings.SMS_OUTBOX_LEASE),
+            )
+    for message in messages:
+        message.attempts += 1
+    return messages
+
+
+def retry_delay(attempts):
+    """
+    Get the backoff before the next attempt.
+
+    The delay doubles with every attempt, with up to 20% jitter so messages
+    that failed together don't all retry in the same second.
+    """
+    delay = settings.SMS_RETRY_BASE_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=delay * random.uniform(1.0, 1.2))
+
+
+def record_results(sent, failed):
+    """
+    Store the outcome of a drain batch.
+
+    Args:
+        sent: Messages the provider accepted
+        failed: List of (message, error, retryable) tuples
+    """
+    now = timezone.now()
+    if sent:
+        SMSOutbox.objects.filter(pk__in=[message.pk for message in sent]).update(
+            status=SMSOutbox.STATUS_SENT, sent_at=now, last_error=''
+        )
+
+    updates = []
+    for message, error, retryable in failed:
+        message.last_error = str(error)[:1000]
+        if retryable and message.attempts < settings.SMS_MAX_ATTEMPTS:
+            message.next_attempt_at = now + retry_delay(message.attempts)
+        else:
+            message.status = SMSOutbox.STATUS_FAILED
+        updates.append(message)
+    if updates:
+        SMSOutbox.objects.bulk_update(updates, ['status', 'last_error', 'next_attempt_at'])
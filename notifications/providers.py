@@ -0,0 +1,124 @@
+"""
+SMS provider clients used by the outbox drain.
+
+Providers send through the pooled gateway client in ``core.http``, so a
+drain batch reuses a handful of keep-alive connections instead of opening a
+new TLS connection per message. Sends are throttled by a per-provider rate
+limit shared by all workers through the default cache.
+"""
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from core.http import get_client
+from core.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+def get_sms_client():
+    """Get the shared HTTP client for the SMS provider."""
+    return get_client(
+        'sms_ir',
+        connect_timeout=settings.SMS_CONNECT_TIMEOUT,
+        read_timeout=settings.SMS_READ_TIMEOUT,
+    )
+
+
+class SMSProviderError(Exception):
+    """Raised when a provider rejects or fails to deliver a message."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class RateLimiter:
+    """
+    Fixed-window limit on calls per second, shared through the default cache.
+
+    If the cache is unreachable the limiter lets calls through rather than
+    stopping notifications altogether.
+    """
+
+    def __init__(self, name, per_second):
+        self.name = name
+        self.per_second = per_second
+
+    @staticmethod
+    def _now():
+        return time.time()
+
+    def acquire(self):
+        """Block until a call is allowed in the current one-second window."""
+        if not self.per_second:
+            return
+        while True:
+            window = int(self._now())
+            key = f"sms_rate:{self.name}:{window}"
+            try:
+                cache.add(key, 0, timeout=2)
+                count = cache.incr(key)
+            except Exception as e:
+                logger.warning(f"SMS rate limiter unavailable, sending without limit: {str(e)}")
+                return
+            if count <= self.per_second:
+                return
+            # Wait for the next window
+            time.sleep(max(window + 1 - self._now(), 0.01))
+
+
+class SMSIrProvider:
+    """
+    Client for the sms.ir template (verify) API.
+
+    sms.ir has no bulk form of the template API, so a batch is sent as
+    individual requests over the shared keep-alive session.
+    """
+    name = 'sms_ir'
+
+    def __init__(self):
+        self.client = get_sms_client()
+        self.rate_limiter = RateLimiter(self.name, settings.SMS_RATE_LIMIT_PER_SECOND)
+
+    def send(self, message):
+        """
+        Send one outbox message.
+
+        Args:
+            message: SMSOutbox instance to send
+
+        Raises:
+            SMSProviderError: If the message wasn't accepted; ``retryable``
+                tells whether trying again later may succeed
+        """
+        self.rate_limiter.acquire()
+        payload = {
+            "mobile": message.phone_number,
+            "templateId": message.template_id,
+            "parameters": [{"name": name, "value": str(value)} for name, value in message.parameters.items()],
+        }
+        try:
+            response = self.client.post(
+                settings.SMS_API_URL,
+                endpoint='send',
+                json=payload,
+                headers={'Accept': 'text/plain', 'x-api-key': settings.SMS_API_KEY},
+            )
+        except requests.RequestException as e:
+            raise SMSProviderError(f"Request to SMS provider failed: {str(e)}")
+
+        if response.status_code == 200:
+            return
+        # Throttling and server errors are worth retrying; anything else is a bad request
+        retryable = response.status_code == 429 or response.status_code >= 500
+        raise SMSProviderError(
+            f"SMS provider returned {response.status_code}: {response.text[:200]}",
+            retryable=retryable,
+        )
+
+
+def get_provider():
+    """Get the configured SMS provider."""
+    return SMSIrProvider()
@@ -0,0 +1,58 @@
+"""
+Celery tasks for sending queued notifications.
+"""
+from celery import shared_task
+from django.conf import settings
+from core.logging_utils import get_logger
+from university_food_system.tasks_with_logging import task_with_logging
+from .outbox import claim_batch, record_results
+from .providers import SMSProviderError, get_provider
+
+logger = get_logger(__name__)
+
+
+@shared_task
+@task_with_logging
+def drain_sms_outbox(batch_size=None, max_batches=10):
+    """
+    Send due messages from the SMS outbox in batches.
+
+    Several drains can run at once; each claims its own rows. Failed sends
+    are retried with exponential backoff until SMS_MAX_ATTEMPTS is reached.
+
+    Args:
+        batch_size: Messages claimed per batch (defaults to SMS_OUTBOX_BATCH_SIZE)
+        max_batches: Batches to send before returning, so one run can't hog a worker
+
+    Returns:
+        str: A summary of sent and failed messages
+    """
+    batch_size = batch_size or settings.SMS_OUTBOX_BATCH_SIZE
+    provider = get_provider()
+    sent_count = failed_count = 0
+
+    for _ in range(max_batches):
+        messages = claim_batch(batch_size)
+        if not messages:
+            break
+
+        sent, failed = [], []
+        for message in messages:
+            try:
+                provider.send(message)
+                sent.append(message)
+            except SMSProviderError as e:
+                logger.warning(f"Sending SMS {message.id} failed (attempt {message.attempts}): {str(e)}")
+                failed.append((message, e, e.retryable))
+            except Exception as e:
+                logger.error(f"Unexpected error sending SMS {message.id}: {str(e)}", exc_info=True)
+                failed.append((message, e, True))
+
+        record_results(sent, failed)
+        sent_count += len(sent)
+        failed_count += len(failed)
+
+        if len(messages) < batch_size:
+            break
+
+    return f"{sent_count} SMS sent, {failed_count} failed."
@@ -0,0 +1,60 @@
+"""
+A local stand-in for the SMS provider's HTTP API.
+
+Records every request it receives and answers with scripted status codes,
+so the outbox drain can be exercised end to end over real HTTP.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeSMSServer:
+    """
+    Run a fake provider on a free port for the duration of a ``with`` block.
+
+    Responses are taken from ``statuses`` in order; once it runs out every
+    request is answered with 200.
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections open like the real provider does
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server._lock:
+                    server.requests.append({
+                        'headers': dict(self.headers),
+                        'json': json.loads(body or b'{}'),
+                        'client_port': self.client_address[1],
+                    })
+                    status = server.statuses.pop(0) if server.statuses else 200
+                payload = json.dumps({'status': 1 if status == 200 else 0}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/send/verify"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
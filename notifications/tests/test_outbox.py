@@ -0,0 +1,106 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from notifications.models import SMSOutbox
+from notifications.outbox import claim_batch, queue_sms
+from notifications.providers import RateLimiter
+from notifications.tasks import drain_sms_outbox
+from notifications.tests.fake_sms_server import FakeSMSServer
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE, SMS_API_KEY='test-key', SMS_RATE_LIMIT_PER_SECOND=0)
+class SMSOutboxTestCase(TestCase):
+    def queue(self, count=1, **kwargs):
+        for i in range(count):
+            queue_sms(f'0912000{i:04d}', '849510', {'name': 'Ali', 'delivery_code': f'{i:06d}'}, **kwargs)
+
+    @patch('notifications.tasks.drain_sms_outbox.delay')
+    def test_queue_is_part_of_the_transaction(self, drain):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.queue()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertFalse(SMSOutbox.objects.exists())
+        drain.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queue(dedupe_key='reservation-ready:1')
+            self.queue(dedupe_key='reservation-ready:1')
+        self.assertEqual(SMSOutbox.objects.count(), 1)
+        drain.assert_called()
+
+    def test_drain_sends_messages_over_http(self):
+        self.queue(3)
+        with FakeSMSServer() as server, override_settings(SMS_API_URL=server.url):
+            result = drain_sms_outbox()
+
+        self.assertEqual(result, '3 SMS sent, 0 failed.')
+        self.assertEqual(len(server.requests), 3)
+        request = server.requests[0]
+        self.assertEqual(request['headers']['x-api-key'], 'test-key')
+        self.assertEqual(request['json']['templateId'], '849510')
+        self.assertIn({'name': 'delivery_code', 'value': '000000'}, request['json']['parameters'])
+        self.assertEqual(SMSOutbox.objects.filter(status=SMSOutbox.STATUS_SENT, attempts=1).count(), 3)
+
+    def test_server_error_is_retried_with_backoff(self):
+        self.queue()
+        with FakeSMSServer(statuses=[500]) as server, override_settings(SMS_API_URL=server.url):
+            self.assertEqual(drain_sms_outbox(), '0 SMS sent, 1 failed.')
+            message = SMSOutbox.objects.get()
+            self.assertEqual(message.status, SMSOutbox.STATUS_PENDING)
+            self.assertIn('500', message.last_error)
+            self.assertGreater(message.next_attempt_at, timezone.now() + timedelta(seconds=20))
+
+            # Not due yet
+            self.assertEqual(drain_sms_outbox(), '0 SMS sent, 0 failed.')
+
+            SMSOutbox.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(drain_sms_outbox(), '1 SMS sent, 0 failed.')
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, SMSOutbox.STATUS_SENT)
+        self.assertEqual(message.attempts, 2)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_rejected_message_is_not_retried(self):
+        self.queue()
+        with FakeSMSServer(statuses=[400]) as server, override_settings(SMS_API_URL=server.url):
+            drain_sms_outbox()
+        self.assertEqual(SMSOutbox.objects.get().status, SMSOutbox.STATUS_FAILED)
+
+    @override_settings(SMS_MAX_ATTEMPTS=2)
+    def test_gives_up_after_max_attempts(self):
+        self.queue()
+        with FakeSMSServer(statuses=[503, 503]) as server, override_settings(SMS_API_URL=server.url):
+            drain_sms_outbox()
+            SMSOutbox.objects.update(next_attempt_at=timezone.now())
+            drain_sms_outbox()
+        message = SMSOutbox.objects.get()
+        self.assertEqual(message.status, SMSOutbox.STATUS_FAILED)
+        self.assertEqual(message.attempts, 2)
+
+    def test_claimed_messages_are_leased(self):
+        self.queue(2)
+        self.assertEqual(len(claim_batch(10)), 2)
+        # A second drain doesn't pick them up again until the lease runs out
+        self.assertEqual(claim_batch(10), [])
+
+    @patch('notifications.providers.time.sleep')
+    def test_rate_limiter_waits_for_next_window(self, sleep):
+        limiter = RateLimiter('test', per_second=2)
+        clock = iter([100.5, 100.6, 100.7, 100.8, 101.0])
+        with patch.object(RateLimiter, '_now', side_effect=lambda: next(clock)):
+            limiter.acquire()
+            limiter.acquire()
+            limiter.acquire()
+        sleep.assert_called_once()
+        self.assertAlmostEqual(sleep.call_args.args[0], 0.2)
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from .models import Reservation
+from .transitions import transition
 from menu.models import TimeSlot
 from django.db import transaction
 
@@ -57,25 +58,29 @@ class ReservationAdmin(admin.ModelAdmin):
     time_slot_link.short_description = _('Time Slot')
     time_slot_link.allow_tags = True
 
+    def _transition(self, request, queryset, new_status, label):
+        """Move the selected reservations through the transition engine so side effects are applied."""
+        result = transition(queryset, new_status)
+        message = f'Successfully marked {len(result.updated)} reservations as {label}.'
+        if result.skipped:
+            message += f' Skipped {len(result.skipped)} reservations whose status does not allow it.'
+        self.message_user(request, message)
+
     @admin.action(description='Mark selected reservations as waiting')
     def mark_as_waiting(self, request, queryset):
-        updated = queryset.update(status='waiting')
-        self.message_user(request, f'Successfully marked {updated} reservations as waiting.')
+        self._transition(request, queryset, 'waiting', 'waiting')
 
     @admin.action(description='Mark selected reservations as preparing')
     def mark_as_preparing(self, request, queryset):
-        updated = queryset.update(status='preparing')
-        self.message_user(request, f'Successfully marked {updated} reservations as preparing.')
+        self._transition(request, queryset, 'preparing', 'preparing')
 
     @admin.action(description='Mark selected reservations as ready to pickup')
     def mark_as_ready_to_pickup(self, request, queryset):
-        updated = queryset.update(status='ready_to_pickup')
-        self.message_user(request, f'Successfully marked {updated} reservations as ready to pickup.')
+        self._transition(request, queryset, 'ready_to_pickup', 'ready to pickup')
 
     @admin.action(description='Mark selected reservations as picked up')
     def mark_as_picked_up(self, request, queryset):
-        updated = queryset.update(status='picked_up')
-        self.message_user(request, f'Successfully marked {updated} reservations as picked up.')
+        self._transition(request, queryset, 'picked_up', 'picked up')
 
     def get_queryset(self, request):
         """Optimize the queryset to avoid multiple database queries."""
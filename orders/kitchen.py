@@ -0,0 +1,96 @@
+"""
+The kitchen's order sheet for one meal.
+
+Kitchen prep needs two things: how many portions of each food to make for
+each time slot, and the tray list. ``meal_counts`` gets the first with one
+grouped query, so no reservation is loaded at all. ``tray_csv`` streams the
+second as CSV straight from a ``values_list`` iterator: rows are read from
+the database in chunks and written out as they arrive, without building
+model instances or holding the whole meal in memory.
+
+Only reservations the kitchen has to cook count: unpaid and cancelled ones
+are left out.
+"""
+import csv
+
+from django.db.models import Count
+
+from .models import Reservation
+
+SKIPPED_STATUSES = ('pending_payment', 'cancelled')
+TRAY_COLUMNS = [
+    'reservation_number', 'delivery_code', 'time_slot', 'food', 'student_number',
+    'first_name', 'last_name', 'has_voucher', 'has_extra_voucher', 'status',
+]
+TRAY_CHUNK_SIZE = 2000
+
+
+def meal_reservations(date, meal_type):
+    """Get the reservations of a meal the kitchen has to cook."""
+    return Reservation.objects.filter(reserved_date=date, meal_type=meal_type).exclude(status__in=SKIPPED_STATUSES)
+
+
+def _slot_label(start_time, end_time):
+    if start_time is None:
+        return ''
+    return f"{start_time:%H:%M}-{end_time:%H:%M}"
+
+
+def meal_counts(date, meal_type):
+    """
+    Count the portions of each food per time slot.
+
+    Returns:
+        dict: ``total`` and ``counts``, one entry per food and time slot
+        ordered by slot start time and food name
+    """
+    rows = (
+        meal_reservations(date, meal_type)
+        .values('food', 'food__name', 'time_slot', 'time_slot__start_time', 'time_slot__end_time')
+        .annotate(count=Count('id'))
+        .order_by('time_slot__start_time', 'food__name')
+    )
+    counts = [
+        {
+            'food': row['food'],
+            'food_name': row['food__name'],
+            'time_slot': row['time_slot'],
+            'slot': _slot_label(row['time_slot__start_time'], row['time_slot__end_time']),
+            'count': row['count'],
+        }
+        for row in rows
+    ]
+    return {'total': sum(entry['count'] for entry in counts), 'counts': counts}
+
+
+class _Echo:
+    """A file-like object whose writes return the written line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def tray_csv(date, meal_type):
+    """
+    Generate the tray list of a meal as CSV lines, in reservation number order.
+
+    Yields:
+        str: The header, then one line per reservation
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(TRAY_COLUMNS)
+    rows = (
+        meal_reservations(date, meal_type)
+        .order_by('time_slot__start_time', 'reservation_number', 'id')
+        .values_list(
+            'reservation_number', 'delivery_code', 'time_slot__start_time', 'time_slot__end_time',
+            'food__name', 'student__student_number', 'student__first_name', 'student__last_name',
+            'has_voucher', 'has_extra_voucher', 'status',
+        )
+    )
+    for (number, code, start_time, end_time, food, student_number, first_name, last_name,
+         has_voucher, has_extra_voucher, status) in rows.iterator(chunk_size=TRAY_CHUNK_SIZE):
+        yield writer.writerow([
+            number, code, _slot_label(start_time, end_time), food, student_number,
+            first_name, last_name, int(has_voucher), int(has_extra_voucher), status,
+        ])
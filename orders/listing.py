@@ -0,0 +1,109 @@
+"""
+Paginated, single-query reservation listings.
+
+Order listings for receivers, the kitchen and students used to serialize
+every matching reservation with ``ReservationSerializer``, fetching the
+student, food and time slot of each row separately. Here rows are read with
+one ``values()`` query that joins all three, and rendered with the
+serializer's own fields, so the output is exactly what the serializer
+produces without building model instances.
+
+Pages are cut by keyset (``id > last id seen``), not offset, so deep pages
+cost the same as the first and orders created while paging don't shift
+later pages. The cursor returned with a page is opaque to clients.
+"""
+import base64
+
+from django.conf import settings
+
+from .serializers import ReservationSerializer
+
+NESTED_FIELDS = ('student', 'food', 'time_slot')
+
+
+class ReservationRows:
+    """Renders ``values()`` rows of reservations like ReservationSerializer."""
+
+    def __init__(self):
+        fields = ReservationSerializer().fields
+        self.flat = [
+            (name, field) for name, field in fields.items()
+            if name not in NESTED_FIELDS and name != 'trust_score'
+        ]
+        self.nested = {name: list(fields[name].fields.items()) for name in NESTED_FIELDS}
+        self.lookups = [
+            *(name for name, _ in self.flat),
+            *(f"{name}_id" for name in NESTED_FIELDS),
+            *(f"{name}__{sub}" for name, subfields in self.nested.items() for sub, _ in subfields),
+            'student__trust_score',
+        ]
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def render(self, row):
+        data = {name: _represent(field, row[name]) for name, field in self.flat}
+        for name, subfields in self.nested.items():
+            data[name] = None if row[f"{name}_id"] is None else {
+                sub: _represent(field, row[f"{name}__{sub}"]) for sub, field in subfields
+            }
+        data['trust_score'] = row['student__trust_score'] if row['student_id'] is not None else 0
+        return data
+
+
+def _represent(field, value):
+    return None if value is None else field.to_representation(value)
+
+
+reservation_rows = ReservationRows()
+
+
+def _encode_cursor(pk):
+    return base64.urlsafe_b64encode(str(pk).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+
+
+def keyset_page(request, queryset, descending=False):
+    """
+    Get one page of reservations, rendered.
+
+    Query parameters: ``limit`` (default ORDER_LIST_PAGE_SIZE, at most
+    ORDER_LIST_MAX_PAGE_SIZE) and ``cursor`` (the ``next`` of the previous page).
+
+    Args:
+        request: The current request
+        queryset: Reservations to list
+        descending: Newest first instead of oldest first
+
+    Returns:
+        dict: ``results``, ``limit`` and ``next``, the cursor of the following
+        page or None on the last one
+
+    Raises:
+        ValueError: If ``limit`` or ``cursor`` is invalid
+    """
+    limit = int(request.query_params.get('limit', settings.ORDER_LIST_PAGE_SIZE))
+    if limit < 1:
+        raise ValueError("limit must be positive.")
+    limit = min(limit, settings.ORDER_LIST_MAX_PAGE_SIZE)
+
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        last_id = _decode_cursor(cursor)
+        queryset = queryset.filter(id__lt=last_id) if descending else queryset.filter(id__gt=last_id)
+
+    # One extra row tells whether there is a next page without a COUNT
+    rows = list(reservation_rows.values(queryset.order_by('-id' if descending else 'id'))[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'next': _encode_cursor(rows[-1]['id']) if has_next else None,
+        'limit': limit,
+        'results': [reservation_rows.render(row) for row in rows],
+    }
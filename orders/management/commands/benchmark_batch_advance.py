@@ -0,0 +1,78 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from orders.models import Reservation
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the throughput of advancing trays one PATCH at a time with the "
+        "batch endpoint. Runs in a transaction that is rolled back, so nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trays', type=int, default=300, help="Trays advanced by each path")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._benchmark(options['trays'])
+            # Drops the benchmark's rows and any notifications queued on commit
+            transaction.set_rollback(True)
+
+    def _benchmark(self, trays):
+        food = Food.objects.create(name='Benchmark tray', price=Decimal('100000.00'))
+        # Far enough ahead not to collide with real menus
+        date = timezone.now().date() + timedelta(days=3650)
+        item = DailyMenuItem.objects.create(
+            daily_menu=DailyMenu.objects.create(date=date, meal_type='lunch'), food=food,
+            start_time='12:00', end_time='14:00',
+            time_slot_count=2, time_slot_capacity=trays, daily_capacity=trays * 2,
+        )
+        slots = [
+            TimeSlot.objects.create(daily_menu_item=item, start_time=start, end_time=end, capacity=trays)
+            for start, end in (('12:00', '13:00'), ('13:00', '14:00'))
+        ]
+        student = User.objects.create_user(phone_number='09999990050', password=None, role='student')
+        receiver = User.objects.create_user(phone_number='09999990051', password=None, role='receiver')
+        client = APIClient()
+        client.force_authenticate(receiver)
+
+        def reserve(slot):
+            return [reservation.pk for reservation in Reservation.objects.bulk_create([
+                Reservation(
+                    student=student, food=food, time_slot=slot, meal_type='lunch', reserved_date=date,
+                    price=food.price, status='preparing', reservation_number=n + 1, delivery_code=f'{n + 1:04d}00',
+                )
+                for n in range(trays)
+            ])]
+
+        per_order_ids = reserve(slots[0])
+        started = time.perf_counter()
+        for pk in per_order_ids:
+            client.patch(reverse('update_order_status', args=[pk]), {'status': 'ready_to_pickup'}, format='json')
+        per_order = time.perf_counter() - started
+
+        reserve(slots[1])
+        started = time.perf_counter()
+        client.post(reverse('batch_advance_orders'), {
+            'status': 'ready_to_pickup', 'reserved_date': date.isoformat(),
+            'meal_type': 'lunch', 'time_slot': slots[1].pk,
+        }, format='json')
+        batch = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{trays} trays: per-order {per_order:.3f}s ({trays / per_order:.0f}/s), "
+            f"batch {batch:.3f}s ({trays / batch:.0f}/s), {per_order / batch:.0f}x faster"
+        )
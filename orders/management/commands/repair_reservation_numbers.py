@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from orders.models import Reservation, ReservationSequence
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill reservation number sequences for existing days and repair "
+        "duplicate or missing reservation numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Only repair this reserved date (YYYY-MM-DD)")
+        parser.add_argument('--meal-type', choices=['lunch', 'dinner'], help="Only repair this meal type")
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report what would change without writing anything",
+        )
+
+    def handle(self, *args, **options):
+        reservations = Reservation.objects.all()
+        if options['date']:
+            try:
+                reserved_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError("Invalid date format. Use YYYY-MM-DD")
+            reservations = reservations.filter(reserved_date=reserved_date)
+        if options['meal_type']:
+            reservations = reservations.filter(meal_type=options['meal_type'])
+
+        days = (
+            reservations
+            .values('meal_type', 'reserved_date')
+            .annotate(last_number=Max('reservation_number'))
+            .order_by('reserved_date', 'meal_type')
+        )
+
+        total_renumbered = 0
+        for day in days:
+            total_renumbered += self._repair_day(day, options['dry_run'])
+
+        verb = "Would renumber" if options['dry_run'] else "Renumbered"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {total_renumbered} reservations across {len(days)} meal days."
+        ))
+
+    def _repair_day(self, day, dry_run):
+        meal_type, reserved_date = day['meal_type'], day['reserved_date']
+
+        with transaction.atomic():
+            # Lock the day's rows so new orders wait until the repair is done
+            rows = list(
+                Reservation.objects.select_for_update()
+                .filter(meal_type=meal_type, reserved_date=reserved_date)
+                .order_by('id')
+                .values_list('id', 'reservation_number')
+            )
+
+            # The earliest reservation keeps a number; later duplicates and blanks get new ones
+            seen = set()
+            to_renumber = []
+            for pk, number in rows:
+                if number and number not in seen:
+                    seen.add(number)
+                else:
+                    to_renumber.append(pk)
+
+            last_number = day['last_number'] or 0
+            counter = ReservationSequence.objects.select_for_update().filter(
+                meal_type=meal_type, reserved_date=reserved_date
+            ).first()
+            if counter and counter.last_number > last_number:
+                last_number = counter.last_number
+
+            self.stdout.write(
+                f"{reserved_date} {meal_type}: {len(rows)} reservations, "
+                f"counter {counter.last_number if counter else 'missing'} -> {last_number}, "
+                f"{len(to_renumber)} to renumber"
+            )
+            if dry_run:
+                return len(to_renumber)
+
+            ReservationSequence.objects.update_or_create(
+                meal_type=meal_type,
+                reserved_date=reserved_date,
+                defaults={'last_number': last_number},
+            )
+            if not to_renumber:
+                return 0
+
+            numbers = ReservationSequence.objects.next_numbers(meal_type, reserved_date, len(to_renumber))
+            updates = []
+            for pk, number in zip(to_renumber, numbers):
+                reservation = Reservation(pk=pk, reservation_number=min(number, 9999))
+                # Keep the delivery code's 4-digit prefix in step with the new number
+                reservation.generate_delivery_code()
+                updates.append(reservation)
+            Reservation.objects.bulk_update(updates, ['reservation_number', 'delivery_code'])
+            return len(to_renumber)
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-17 02:28
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_sequences(apps, schema_editor):
+    """Start each existing meal/day counter at its highest issued number."""
+    Reservation = apps.get_model('orders', 'Reservation')
+    ReservationSequence = apps.get_model('orders', 'ReservationSequence')
+    rows = (
+        Reservation.objects
+        .values('meal_type', 'reserved_date')
+        .annotate(last_number=Max('reservation_number'))
+    )
+    ReservationSequence.objects.bulk_create([
+        ReservationSequence(
+            meal_type=row['meal_type'],
+            reserved_date=row['reserved_date'],
+            last_number=row['last_number'] or 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_reservation_has_extra_voucher_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meal_type', models.CharField(choices=[('lunch', 'Lunch'), ('dinner', 'Dinner')], max_length=10)),
+                ('reserved_date', models.DateField()),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('meal_type', 'reserved_date'), name='unique_reservation_sequence')],
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0003_food_supports_extra_voucher'),
+        ('menu', '0003_indexes'),
+        ('orders', '0007_reservationsequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['reserved_date', 'meal_type', 'status'], name='res_date_meal_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['student', 'reserved_date', 'meal_type'], name='res_student_date_meal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['delivery_code', 'meal_type', 'reserved_date'], name='res_delivery_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('status__in', ['waiting', 'preparing', 'ready_to_pickup'])), fields=['reserved_date', 'meal_type'], name='res_active_date_meal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('status', 'pending_payment')), fields=['created_at'], name='res_pending_created_idx'),
+        ),
+    ]
@@ -1,16 +1,75 @@
-from django.db import models
+from django.db import models, connections, transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from food.models import Food
 from core.models import Voucher
+from core.tracking import FieldTrackerMixin
 from menu.models import TimeSlot
 import random
+from contextlib import nullcontext
 from django.db.models import Sum, F
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 User = get_user_model()
 
-class Reservation(models.Model):
+
+class ReservationSequenceManager(models.Manager):
+    def next_numbers(self, meal_type, reserved_date, count=1):
+        """
+        Reserve ``count`` consecutive reservation numbers for a meal and day.
+
+        A single ``INSERT ... ON CONFLICT DO UPDATE ... RETURNING`` bumps the
+        counter row, so allocation is O(1) and two concurrent callers can never
+        receive the same number. The row lock is released when the caller's
+        transaction ends; if it rolls back, so does the counter, which keeps
+        the sequence gap-free.
+
+        Args:
+            meal_type: 'lunch' or 'dinner'
+            reserved_date: Date the reservations are for
+            count: How many numbers to reserve
+
+        Returns:
+            range: The reserved numbers in ascending order
+        """
+        table = connections[self.db].ops.quote_name(self.model._meta.db_table)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (meal_type, reserved_date, last_number)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (meal_type, reserved_date)
+                DO UPDATE SET last_number = {table}.last_number + EXCLUDED.last_number
+                RETURNING last_number
+                """,
+                [meal_type, reserved_date, count],
+            )
+            last_number = cursor.fetchone()[0]
+        return range(last_number - count + 1, last_number + 1)
+
+    def next_number(self, meal_type, reserved_date):
+        """Reserve the next reservation number for a meal and day."""
+        return self.next_numbers(meal_type, reserved_date)[0]
+
+
+class ReservationSequence(models.Model):
+    """Counter holding the last reservation number issued for a meal and day."""
+    meal_type = models.CharField(max_length=10, choices=[('lunch', 'Lunch'), ('dinner', 'Dinner')])
+    reserved_date = models.DateField()
+    last_number = models.PositiveIntegerField(default=0)
+
+    objects = ReservationSequenceManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['meal_type', 'reserved_date'], name='unique_reservation_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.reserved_date} {self.meal_type}: {self.last_number}"
+
+
+class Reservation(FieldTrackerMixin, models.Model):
     STATUS_CHOICES = [
         ('cancelled', 'Cancelled'),
         ('pending_payment', 'Pending Payment'),
@@ -48,21 +107,41 @@ class Reservation(models.Model):
     reservation_number = models.PositiveIntegerField(blank=True, null=True, help_text="Sequential number for each meal and day")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(null=True, blank=True)
+    # Set on every status change; pickup stations sync the changes since their last download
+    status_changed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Kitchen, pickup and report screens: one meal of one day, often one status
+            models.Index(fields=['reserved_date', 'meal_type', 'status'], name='res_date_meal_status_idx'),
+            # "Already booked this meal?" checks and a student's own orders
+            models.Index(fields=['student', 'reserved_date', 'meal_type'], name='res_student_date_meal_idx'),
+            # Pickup by delivery code
+            models.Index(fields=['delivery_code', 'meal_type', 'reserved_date'], name='res_delivery_code_idx'),
+            # Orders still to be served; much smaller than the whole history
+            models.Index(
+                fields=['reserved_date', 'meal_type'],
+                condition=models.Q(status__in=['waiting', 'preparing', 'ready_to_pickup']),
+                name='res_active_date_meal_idx',
+            ),
+            # Payment expiry sweeps only look at pending payments
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status='pending_payment'),
+                name='res_pending_created_idx',
+            ),
+        ]
+
+    # Status and slot as loaded from the database, so status changes can be handled without re-reading the row
+    tracked_fields = ('status', 'time_slot_id')
 
     def assign_reservation_number(self):
         """Assign a sequential reservation number for this meal type and date."""
         if not self.reservation_number:
-            # Get the highest reservation number for this meal type and date
-            highest = Reservation.objects.filter(
-                meal_type=self.meal_type,
-                reserved_date=self.reserved_date
-            ).aggregate(models.Max('reservation_number'))
-            
-            # Start from 1 if no reservations exist for this meal/day
-            current_highest = highest['reservation_number__max'] or 0
+            number = ReservationSequence.objects.next_number(self.meal_type, self.reserved_date)
             
             # Assign the next number (max 9999)
-            self.reservation_number = min(current_highest + 1, 9999)
+            self.reservation_number = min(number, 9999)
     
     def generate_delivery_code(self):
         """Generate a unique 6-digit delivery code based on reservation number + random digits."""
@@ -80,8 +159,13 @@ class Reservation(models.Model):
         self.delivery_code = seq_part + random_part
         
 
-    def calculate_price(self):
-        """Calculate the final price after applying vouchers."""
+    def calculate_price(self, voucher_price=None):
+        """
+        Calculate the final price after applying vouchers.
+
+        Args:
+            voucher_price: Current voucher price, if the caller already fetched it
+        """
         if not hasattr(self, 'food') or not self.food:
             return 0
             
@@ -90,59 +174,69 @@ class Reservation(models.Model):
         
         # Apply regular voucher if applicable
         if self.has_voucher:
-            price -= float(Voucher.get_voucher_price())
+            if voucher_price is None:
+                voucher_price = Voucher.get_voucher_price()
+            price -= float(voucher_price)
             
             # Apply extra voucher if applicable (same value as regular voucher)
             if self.has_extra_voucher and self.food.supports_extra_voucher:
-                price -= float(Voucher.get_voucher_price())
+                price -= float(voucher_price)
         
         return max(price, 0)  # Ensure price doesn't go below zero
 
+    @staticmethod
+    def trust_impact(status, price, has_voucher, has_extra_voucher):
+        """
+        Get the trust score change caused by moving a reservation to ``status``.
+
+        Returns:
+            int or None: Points to add (negative for penalties), or None if
+            the status doesn't affect the trust score
+        """
+        if status == 'picked_up':
+            # Positive impact for picking up food
+            return int(price / 10000)  # +1 point per 10,000 tomans
+        if status == 'not_picked_up' and has_voucher:
+            # Negative impact for not picking up with voucher, doubled for an extra voucher
+            return -20 if has_extra_voucher else -10
+        return None
+
     def update_trust_score(self):
-        """Update user's trust score based on reservation status."""
-        if not self.student or self.student.role != 'student':
+        """
+        Update user's trust score based on a status change.
+
+        Called from the pre_save signal, so the impact is stored with the
+        reservation. The score itself is changed with an F() expression so
+        concurrent updates for the same student can't overwrite each other.
+        """
+        # Only process status changes of existing reservations
+        if self._state.adding or not self.has_changed('status'):
             return
-            
-        # Only process status changes
-        if not self.pk:  # New reservation
+
+        if not self.student_id or self.student.role != 'student':
             return
             
-        try:
-            old_instance = Reservation.objects.get(pk=self.pk)
-            if self.status == old_instance.status:
-                return
-        except Reservation.DoesNotExist:
+        impact = self.trust_impact(self.status, self.price, self.has_voucher, self.has_extra_voucher)
+        if impact is None:
             return
-            
-        # Handle trust score updates based on status changes
-        if self.status == 'picked_up':
-            # Positive impact for picking up food
-            points = int(self.price / 10000)  # +1 point per 10,000 tomans
-            self.trust_score_impact = points
-            self.student.trust_score += points
-            self.student.trust_score_updated_at = timezone.now()
-            self.student.save()
-            
-        elif self.status == 'not_picked_up' and self.has_voucher:
-            # Negative impact for not picking up with voucher
-            penalty = -10
-            
-            # Additional penalty for extra voucher
-            if self.has_extra_voucher:
-                penalty -= 10
-                
-            self.trust_score_impact = penalty
-            self.student.trust_score += penalty  # penalty is negative, so this decreases the score
-            self.student.trust_score_updated_at = timezone.now()
-            self.student.save()
+
+        now = timezone.now()
+        self.trust_score_impact = impact
+        User.all_objects.filter(pk=self.student_id).update(
+            trust_score=F('trust_score') + impact,
+            trust_score_updated_at=now,
+        )
+        # Keep the loaded student in step for callers that render the new score
+        self.student.trust_score += impact
+        self.student.trust_score_updated_at = now
     
     def save(self, *args, **kwargs):
-        # Calculate price if not already set
-        if not self.price or not self.original_price:
-            self.price = self.calculate_price()
-            
-        # Check if this is a new reservation (created_at is None)
+        # Check if this is a new reservation
         is_new = self._state.adding
+
+        # Calculate price for new reservations if not already set
+        if is_new and (not self.price or not self.original_price):
+            self.price = self.calculate_price()
         
         # If it's a new reservation and price is zero and voucher is applied, set status to waiting
         if is_new and self.price == 0 and self.has_voucher:
@@ -156,22 +250,47 @@ class Reservation(models.Model):
             raise ValueError("This food item does not support extra vouchers")
             
         # Check if user can use vouchers based on trust score
-        if self.student and self.student.trust_score < 0 and (self.has_voucher or self.has_extra_voucher):
+        if (self.has_voucher or self.has_extra_voucher) and self.student and self.student.trust_score < 0:
             raise ValueError("Cannot use vouchers with a negative trust score")
         
-        # Assign reservation number if not already assigned
-        if not self.reservation_number:
-            self.assign_reservation_number()
-        
-        # Generate delivery code if not already generated
-        if not self.delivery_code:
-            self.generate_delivery_code()
+        # Keep the number allocation, the seat and trust score changes made by the
+        # pre_save signal and the write itself in one transaction, so a failed save
+        # rolls them all back instead of leaving a gap or a lost seat
+        needs_transaction = not self.reservation_number or self.has_changed('status')
+        with transaction.atomic(using=kwargs.get('using')) if needs_transaction else nullcontext():
+            # Assign reservation number if not already assigned
+            if not self.reservation_number:
+                self.assign_reservation_number()
             
-        # Save the reservation first to get an ID
-        super().save(*args, **kwargs)
-        
-        # Update trust score if status changed
-        self.update_trust_score()
+            # Generate delivery code if not already generated
+            if not self.delivery_code:
+                self.generate_delivery_code()
+                
+            # Status changes are handled by the pre_save signal
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.student.phone_number} - {self.food.name} ({self.status})"
+
+
+class PickupSyncBatch(models.Model):
+    """
+    A batch of deliveries uploaded by a pickup station.
+
+    Stations retry uploads until they get an answer, so each batch is stored
+    with its outcome and a repeated upload gets the same answer instead of
+    being applied twice.
+    """
+    station_id = models.CharField(max_length=64)
+    batch_id = models.CharField(max_length=64)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    results = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['station_id', 'batch_id'], name='unique_pickup_sync_batch'),
+        ]
+
+    def __str__(self):
+        return f"{self.station_id} batch {self.batch_id}"
@@ -0,0 +1,116 @@
+"""
+Pickup counter cache.
+
+Every student at the pickup counter is looked up by delivery code. For the
+meal being served, all reservations are rendered once (one query, see
+orders.listing) and kept in the cache, one key per delivery code, for the
+whole pickup session. A scan is then a single cache read: it doesn't wait on
+Postgres and keeps working if the database stalls.
+
+- a session is loaded by ``preload_pickup_sessions`` shortly before a meal's
+  first time slot starts, or by the first lookup
+- status changes refresh the affected entries after their transaction
+  commits (``refresh``), so the counter sees deliveries straight away
+- codes missing from a loaded session (orders placed after loading) are
+  read from the database and added
+
+Every cache call is guarded; without the cache, lookups go to the database.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.logging_utils import get_logger
+
+from .listing import reservation_rows
+from .models import Reservation
+
+logger = get_logger(__name__)
+
+
+def _session_key(date, meal_type):
+    return f"pickup:{date}:{meal_type}"
+
+
+def _code_key(date, meal_type, delivery_code):
+    return f"pickup:{date}:{meal_type}:{delivery_code}"
+
+
+def _render(queryset):
+    return [reservation_rows.render(row) for row in reservation_rows.values(queryset)]
+
+
+def load_session(date, meal_type):
+    """
+    Cache every reservation of a meal by delivery code.
+
+    Returns:
+        int: Number of reservations cached
+    """
+    entries = {
+        _code_key(date, meal_type, data['delivery_code']): data
+        for data in _render(Reservation.objects.filter(reserved_date=date, meal_type=meal_type))
+        if data['delivery_code']
+    }
+    cache.set_many(entries, timeout=settings.PICKUP_CACHE_TTL)
+    cache.set(_session_key(date, meal_type), True, timeout=settings.PICKUP_CACHE_TTL)
+    logger.info(f"Loaded pickup session {date} {meal_type} with {len(entries)} reservations")
+    return len(entries)
+
+
+def lookup(date, meal_type, delivery_code):
+    """
+    Get a reservation by delivery code, rendered like ReservationSerializer.
+
+    Returns:
+        dict: The reservation, or None if there is none with this code
+    """
+    session_loaded = False
+    try:
+        if not cache.get(_session_key(date, meal_type)):
+            load_session(date, meal_type)
+        session_loaded = True
+        data = cache.get(_code_key(date, meal_type, delivery_code))
+        if data is not None:
+            return data
+    except Exception as e:
+        logger.warning(f"Pickup cache unavailable, reading from the database: {str(e)}")
+        session_loaded = False
+
+    rendered = _render(Reservation.objects.filter(
+        delivery_code=delivery_code, meal_type=meal_type, reserved_date=date
+    )[:1])
+    if not rendered:
+        return None
+    if session_loaded:
+        try:
+            cache.set(_code_key(date, meal_type, delivery_code), rendered[0], timeout=settings.PICKUP_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not cache reservation {rendered[0]['id']} for pickup: {str(e)}")
+    return rendered[0]
+
+
+def refresh(reservation_ids):
+    """Update the cached copies of reservations once the current transaction commits."""
+    reservation_ids = list(reservation_ids)
+    if reservation_ids:
+        transaction.on_commit(lambda: _refresh(reservation_ids))
+
+
+def _refresh(reservation_ids):
+    try:
+        sessions = defaultdict(dict)
+        for data in _render(Reservation.objects.filter(pk__in=reservation_ids, delivery_code__isnull=False)):
+            sessions[(data['reserved_date'], data['meal_type'])][
+                _code_key(data['reserved_date'], data['meal_type'], data['delivery_code'])
+            ] = data
+
+        loaded = cache.get_many([_session_key(*session) for session in sessions])
+        for session, entries in sessions.items():
+            # Sessions nobody has loaded load everything fresh when they're first used
+            if _session_key(*session) in loaded:
+                cache.set_many(entries, timeout=settings.PICKUP_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Could not refresh pickup cache for {len(reservation_ids)} reservations: {str(e)}")
@@ -0,0 +1,182 @@
+"""
+Bulk reservation placement.
+
+Students usually book a whole week at once. ``place_reservations`` validates
+and inserts a batch of reservations in one transaction with a fixed number of
+queries, however many entries the batch has: time slots (with their menu
+items), foods and existing reservations are each fetched once, seats are
+taken with one grouped allocation, reservation numbers are reserved in one
+block per meal and day, and the rows are written with ``bulk_create``.
+
+Each entry succeeds or fails on its own, so one full slot doesn't stop the
+rest of the week from being booked.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.logging_utils import get_logger
+from core.models import Voucher
+from food.models import Food
+from menu.models import TimeSlot
+from menu.schedule import has_started
+
+from .models import Reservation, ReservationSequence
+from .seats import allocate_seats
+from .transitions import transition
+from .serializers import BulkReservationItemSerializer
+
+logger = get_logger(__name__)
+
+
+def _error(message):
+    return {"non_field_errors": [message]}
+
+
+def place_reservations(student, entries):
+    """
+    Validate and create a batch of reservations for one student.
+
+    Args:
+        student: User placing the orders
+        entries: List of raw request entries (see BulkReservationItemSerializer)
+
+    Returns:
+        list: One result per entry, in request order. Successful results carry
+        the created ``reservation``; failed ones carry ``errors``.
+    """
+    results = [{"index": index} for index in range(len(entries))]
+    valid = []
+    for index, entry in enumerate(entries):
+        serializer = BulkReservationItemSerializer(data=entry)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index]["errors"] = serializer.errors
+
+    if not valid:
+        return results
+
+    with transaction.atomic():
+        accepted = _validate_entries(student, valid, results)
+
+        granted = allocate_seats(Counter(data['time_slot'].pk for _, data in accepted))
+        reservations = []
+        for index, data in accepted:
+            slot_id = data['time_slot'].pk
+            if not granted[slot_id]:
+                results[index]["errors"] = _error("The selected time slot is full. Please choose a different slot.")
+                continue
+            granted[slot_id] -= 1
+            data['time_slot'].capacity = max(data['time_slot'].capacity - 1, 0)
+            reservations.append((index, Reservation(student=student, **data)))
+
+        if reservations:
+            _prepare(reservations)
+            Reservation.objects.bulk_create([reservation for _, reservation in reservations])
+            _cancel_superseded(student, [reservation for _, reservation in reservations])
+
+    for index, reservation in reservations:
+        results[index]["reservation"] = reservation
+
+    logger.info(f"Placed {len(reservations)} of {len(entries)} reservations for student {student.id}")
+    return results
+
+
+def _validate_entries(student, valid, results):
+    """
+    Check the batch against the menu and the student's existing reservations.
+
+    Returns:
+        list: (index, data) pairs that passed, with ``food`` and ``time_slot``
+        replaced by model instances
+    """
+    time_slots = TimeSlot.objects.select_related('daily_menu_item__daily_menu').in_bulk(
+        {data['time_slot'] for _, data in valid}
+    )
+    foods = Food.objects.in_bulk({data['food'] for _, data in valid})
+    taken = set(
+        Reservation.objects.filter(
+            student=student,
+            reserved_date__in={data['reserved_date'] for _, data in valid},
+        ).exclude(status__in=['cancelled', 'pending_payment']).values_list('reserved_date', 'meal_type')
+    )
+
+    now = timezone.now()
+    accepted = []
+    for index, data in valid:
+        time_slot = time_slots.get(data['time_slot'])
+        food = foods.get(data['food'])
+        if time_slot is None:
+            results[index]["errors"] = {"time_slot": ["Time slot not found."]}
+            continue
+        if food is None:
+            results[index]["errors"] = {"food": ["Food item not found."]}
+            continue
+
+        menu_item = time_slot.daily_menu_item
+        key = (data['reserved_date'], data['meal_type'])
+        if (menu_item.daily_menu.date, menu_item.daily_menu.meal_type) != key:
+            message = "The selected time slot is not on the menu for this date and meal type."
+        elif menu_item.food_id != food.pk:
+            message = "The selected food is not served in this time slot."
+        elif data['has_voucher'] and student.trust_score < 0:
+            message = "Cannot use vouchers with a negative trust score"
+        elif data['has_extra_voucher'] and not food.supports_extra_voucher:
+            message = "This food item does not support extra vouchers"
+        elif has_started(time_slot, now):
+            message = "The selected time slot has already ended. Please choose a future time slot."
+        elif key in taken:
+            message = "You already have a reservation for this date and meal type."
+        else:
+            message = None
+
+        if message:
+            results[index]["errors"] = _error(message)
+            continue
+
+        # Later entries for the same meal count as duplicates of this one
+        taken.add(key)
+        accepted.append((index, {**data, 'food': food, 'time_slot': time_slot}))
+
+    return accepted
+
+
+def _prepare(reservations):
+    """Fill in what Reservation.save() would: price, status, number and delivery code."""
+    voucher_price = None
+    if any(reservation.has_voucher for _, reservation in reservations):
+        voucher_price = Voucher.get_voucher_price()
+
+    by_day = defaultdict(list)
+    for _, reservation in reservations:
+        reservation.price = Decimal(str(reservation.calculate_price(voucher_price)))
+        if reservation.price == 0 and reservation.has_voucher:
+            reservation.status = 'waiting'
+        by_day[(reservation.meal_type, reservation.reserved_date)].append(reservation)
+
+    for (meal_type, reserved_date), day_reservations in by_day.items():
+        numbers = ReservationSequence.objects.next_numbers(meal_type, reserved_date, len(day_reservations))
+        for reservation, number in zip(day_reservations, numbers):
+            reservation.reservation_number = min(number, 9999)
+            reservation.generate_delivery_code()
+
+
+def _cancel_superseded(student, reservations):
+    """Cancel pending payments for meals that were just booked for free, as PlaceOrderView does."""
+    free_meals = Q()
+    for reservation in reservations:
+        if reservation.status == 'waiting':
+            free_meals |= Q(reserved_date=reservation.reserved_date, meal_type=reservation.meal_type)
+    if not free_meals:
+        return
+
+    transition(
+        Reservation.objects.filter(free_meals, student=student, status='pending_payment').exclude(
+            id__in=[reservation.pk for reservation in reservations]
+        ),
+        'cancelled',
+    )
@@ -0,0 +1,256 @@
+"""
+Seat allocation for time slots and daily menu items.
+
+Capacity is decremented with conditional UPDATE statements
+(``SET capacity = capacity - 1 WHERE capacity > 0``) so concurrent orders can
+never push a slot or menu item below zero, regardless of what the caller's
+in-memory copy of the row says.
+
+An optional token layer backed by the default cache (Redis in production) can
+be enabled with ``SEAT_TOKENS_ENABLED``. It keeps a per-slot counter in front
+of Postgres so that, once a slot is sold out, further requests are rejected
+without touching the database. The database remains the source of truth: a
+token only grants permission to *try* the conditional UPDATE. Counters are
+only moved once the surrounding transaction commits, so an allocation that
+fails or is rolled back never loses a seat.
+"""
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from core.logging_utils import get_logger
+from menu.live import publish_capacity_changes
+from menu.models import DailyMenuItem, TimeSlot
+
+logger = get_logger(__name__)
+
+
+class SeatUnavailable(Exception):
+    """Raised when a time slot or menu item has no capacity left."""
+
+
+def _tokens_enabled():
+    return getattr(settings, 'SEAT_TOKENS_ENABLED', False)
+
+
+def _token_key(time_slot_id):
+    return f"seat_tokens:{time_slot_id}"
+
+
+def _has_tokens(time_slot):
+    """
+    Check the seat tokens left for the given time slot.
+
+    The counter is seeded from the slot's current capacity the first time it
+    is needed and expires after ``SEAT_TOKEN_TTL`` seconds, so any drift from
+    the database corrects itself.
+
+    Returns:
+        bool: False if the slot is known to be sold out, True otherwise.
+    """
+    key = _token_key(time_slot.pk)
+    try:
+        cache.add(key, time_slot.capacity, timeout=settings.SEAT_TOKEN_TTL)
+        remaining = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Seat token store unavailable, falling back to database: {str(e)}")
+        return True
+    # The key may have expired since add(); let the database decide.
+    return remaining is None or remaining > 0
+
+
+def _spend_tokens(time_slot_id, count):
+    try:
+        cache.decr(_token_key(time_slot_id), count)
+    except ValueError:
+        pass  # No counter yet; it will be seeded from the database.
+    except Exception as e:
+        logger.warning(f"Could not spend seat tokens for time slot {time_slot_id}: {str(e)}")
+
+
+def _return_tokens(time_slot_id, count=1):
+    try:
+        cache.incr(_token_key(time_slot_id), count)
+    except ValueError:
+        pass  # Counter expired; it will be re-seeded from the database.
+    except Exception as e:
+        logger.warning(f"Could not return seat tokens for time slot {time_slot_id}: {str(e)}")
+
+
+def allocate_seat(time_slot):
+    """
+    Atomically take one seat from a time slot and its daily menu item.
+
+    Both rows are decremented inside a single transaction; if either has no
+    capacity left the whole allocation is rolled back. The in-memory
+    ``time_slot`` is updated so callers can render the new capacity without
+    re-reading it.
+
+    Args:
+        time_slot: TimeSlot instance to allocate a seat from
+
+    Raises:
+        SeatUnavailable: If the slot or the menu item is full or unavailable
+    """
+    if _tokens_enabled() and not _has_tokens(time_slot):
+        raise SeatUnavailable("The selected time slot is full. Please choose a different slot.")
+
+    with transaction.atomic():
+        updated = TimeSlot.objects.filter(
+            pk=time_slot.pk,
+            capacity__gt=0,
+        ).update(capacity=F('capacity') - 1)
+        if not updated:
+            raise SeatUnavailable("The selected time slot is full. Please choose a different slot.")
+
+        updated = DailyMenuItem.objects.filter(
+            pk=time_slot.daily_menu_item_id,
+            daily_capacity__gt=0,
+            is_available=True,
+        ).update(
+            daily_capacity=F('daily_capacity') - 1,
+            # SET expressions see the pre-update row, so 1 means "this was the last seat"
+            is_available=Case(
+                When(daily_capacity__lte=1, then=Value(False)),
+                default=Value(True),
+            ),
+        )
+        if not updated:
+            raise SeatUnavailable("This menu item is no longer available. Please choose a different item.")
+
+    publish_capacity_changes([time_slot.pk])
+    if _tokens_enabled():
+        transaction.on_commit(partial(_spend_tokens, time_slot.pk, 1))
+    time_slot.capacity = max(time_slot.capacity - 1, 0)
+
+
+def allocate_seats(time_slot_counts):
+    """
+    Take seats from several time slots at once.
+
+    The slots and their daily menu items are locked with ``SELECT ... FOR
+    UPDATE`` (in primary key order, so concurrent batches can't deadlock each
+    other), as many of the requested seats as capacity allows are granted,
+    and each table is then updated with a single statement. Slots sharing a
+    menu item also share its daily capacity; they are served in primary key
+    order.
+
+    Args:
+        time_slot_counts: Mapping of time slot id to the number of seats wanted
+
+    Returns:
+        dict: Mapping of time slot id to the number of seats granted (0 for
+        slots that are full, unavailable or missing)
+    """
+    time_slot_counts = {pk: count for pk, count in time_slot_counts.items() if pk and count}
+    granted = dict.fromkeys(time_slot_counts, 0)
+    if not time_slot_counts:
+        return granted
+
+    with transaction.atomic():
+        slots = list(
+            TimeSlot.objects.select_for_update()
+            .filter(pk__in=time_slot_counts.keys())
+            .order_by('pk')
+            .values_list('id', 'capacity', 'daily_menu_item_id')
+        )
+        item_remaining = {
+            pk: daily_capacity if is_available else 0
+            for pk, daily_capacity, is_available in DailyMenuItem.objects.select_for_update()
+            .filter(pk__in={item_id for _, _, item_id in slots})
+            .order_by('pk')
+            .values_list('id', 'daily_capacity', 'is_available')
+        }
+
+        item_counts = Counter()
+        for slot_id, capacity, item_id in slots:
+            count = min(time_slot_counts[slot_id], capacity, item_remaining.get(item_id, 0))
+            if count:
+                granted[slot_id] = count
+                item_remaining[item_id] -= count
+                item_counts[item_id] += count
+
+        slot_updates = {pk: count for pk, count in granted.items() if count}
+        if not slot_updates:
+            return granted
+
+        TimeSlot.objects.filter(pk__in=slot_updates.keys()).update(
+            capacity=F('capacity') - Case(
+                *[When(pk=pk, then=Value(count)) for pk, count in slot_updates.items()],
+                default=Value(0),
+            )
+        )
+        sold_out = [pk for pk in item_counts if item_remaining[pk] == 0]
+        DailyMenuItem.objects.filter(pk__in=item_counts.keys()).update(
+            daily_capacity=F('daily_capacity') - Case(
+                *[When(pk=pk, then=Value(count)) for pk, count in item_counts.items()],
+                default=Value(0),
+            ),
+            is_available=Case(
+                When(pk__in=sold_out, then=Value(False)),
+                default=F('is_available'),
+            ),
+        )
+
+    publish_capacity_changes(slot_updates)
+    if _tokens_enabled():
+        for pk, count in slot_updates.items():
+            transaction.on_commit(partial(_spend_tokens, pk, count))
+
+    return granted
+
+
+def release_seats(time_slot_counts):
+    """
+    Give seats back to time slots and their daily menu items.
+
+    Each table is updated with a single statement regardless of how many
+    slots are involved. Menu items that had sold out become available again;
+    items an admin switched off while they still had capacity stay off.
+
+    Args:
+        time_slot_counts: Mapping of time slot id to the number of seats to release
+
+    Returns:
+        int: Total number of seats released
+    """
+    time_slot_counts = {pk: count for pk, count in time_slot_counts.items() if pk and count}
+    if not time_slot_counts:
+        return 0
+
+    item_counts = Counter()
+    for slot_id, item_id in TimeSlot.objects.filter(
+        pk__in=time_slot_counts.keys()
+    ).values_list('id', 'daily_menu_item_id'):
+        item_counts[item_id] += time_slot_counts[slot_id]
+
+    with transaction.atomic():
+        TimeSlot.objects.filter(pk__in=time_slot_counts.keys()).update(
+            capacity=F('capacity') + Case(
+                *[When(pk=pk, then=Value(count)) for pk, count in time_slot_counts.items()],
+                default=Value(0),
+            )
+        )
+        if item_counts:
+            DailyMenuItem.objects.filter(pk__in=item_counts.keys()).update(
+                daily_capacity=F('daily_capacity') + Case(
+                    *[When(pk=pk, then=Value(count)) for pk, count in item_counts.items()],
+                    default=Value(0),
+                ),
+                is_available=Case(
+                    When(daily_capacity=0, then=Value(True)),
+                    default=F('is_available'),
+                ),
+            )
+
+    publish_capacity_changes(time_slot_counts)
+    if _tokens_enabled():
+        for pk, count in time_slot_counts.items():
+            transaction.on_commit(partial(_return_tokens, pk, count))
+
+    return sum(time_slot_counts.values())
+
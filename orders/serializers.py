@@ -7,7 +7,9 @@ from menu.serializers import TimeSlotSerializer
 from rest_framework import serializers
 from django.db import transaction
 from .models import Reservation
+from .seats import allocate_seat, SeatUnavailable
 from menu.models import TimeSlot
+from menu.schedule import has_ended, has_started
 from datetime import datetime
 from django.utils import timezone
 import pytz
@@ -57,9 +59,8 @@ class CreateReservationSerializer(serializers.ModelSerializer):
         if time_slot.capacity <= 0:
             raise serializers.ValidationError("The selected time slot is full. Please choose a different slot.")
 
-        # Ensure the end_time of the time slot hasn't passed
-        current_time = datetime.now().time()
-        if reserved_date == datetime.today().date() and time_slot.end_time <= current_time:
+        # Ensure the time slot hasn't ended
+        if has_ended(time_slot):
             raise serializers.ValidationError("The selected time slot has already ended. Please choose a future time slot.")
 
         # Prevent duplicate reservations for the same student, date, and meal type, except those in cancelled or pending_payment state
@@ -72,33 +73,50 @@ class CreateReservationSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """
-        Override create() to handle safe time slot capacity updates.
-        Also updates daily menu item capacity and availability status.
+        Override create() to take the seat atomically before inserting.
+        Time slot and daily menu item capacity are decremented together by the seat allocator.
         """
         with transaction.atomic():  # Prevents race conditions
             time_slot = validated_data['time_slot']
-            daily_menu_item = time_slot.daily_menu_item
 
-            # Double-check time slot capacity inside the transaction
-            if time_slot.capacity <= 0:
-                raise serializers.ValidationError("The selected time slot is full. Please choose a different slot.")
-
-            # Double-check daily menu item capacity inside the transaction
-            if daily_menu_item.daily_capacity <= 0 or not daily_menu_item.is_available:
-                raise serializers.ValidationError("This menu item is no longer available. Please choose a different item.")
-
-            # Ensure the end_time hasn't passed again inside transaction
-            # Get current time in Iran timezone
-            iran_now = timezone.now().astimezone(IRAN_TZ)
-            current_iran_time = iran_now.time()
-            
-            if validated_data['reserved_date'] == datetime.today().date() and time_slot.start_time <= current_iran_time:
+            # Ensure the time slot hasn't started, again inside the transaction
+            if has_started(time_slot):
                 raise serializers.ValidationError("The selected time slot has already ended. Please choose a future time slot.")
 
-            return super().create(validated_data)
+            # Take the seat with a conditional UPDATE so concurrent orders can't oversell
+            try:
+                allocate_seat(time_slot)
+            except SeatUnavailable as e:
+                raise serializers.ValidationError(str(e))
+
+            reservation = Reservation(**validated_data)
+            reservation._seat_allocated = True
+            reservation.save()
+            return reservation
 
         
 
+class BulkReservationItemSerializer(serializers.Serializer):
+    """
+    One entry of a bulk placement request.
+
+    Only the shape of each entry is checked here; rules that need the database
+    (menu, capacity, duplicates) are checked for the whole batch at once by
+    orders.placement.
+    """
+    food = serializers.IntegerField()
+    time_slot = serializers.IntegerField()
+    reserved_date = serializers.DateField()
+    meal_type = serializers.ChoiceField(choices=['lunch', 'dinner'])
+    has_voucher = serializers.BooleanField(required=False, default=False)
+    has_extra_voucher = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        if data['has_extra_voucher'] and not data['has_voucher']:
+            raise serializers.ValidationError("Cannot use extra voucher without a regular voucher")
+        return data
+
+
 class UserLessSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -3,8 +3,10 @@ from django.dispatch import receiver
 from django.utils import timezone
 from django.db import transaction, models
 from .models import Reservation
-from menu.models import DailyMenuItem
-from users.utils import SMSService
+from .seats import allocate_seat, release_seats
+from django.conf import settings
+from notifications.models import SMSOutbox
+from notifications.outbox import queue_many
 import logging
 from django.db.models import F
 
@@ -18,57 +20,41 @@ def handle_reservation_status_change(sender, instance, **kwargs):
     - Send notification when reservation status changes from 'preparing' to 'ready_to_pickup'
     - Update capacity when a new reservation is created
     - Restore capacity when status changes to 'cancelled'
+    - Update the student's trust score
+
+    The previous status comes from the instance's tracked fields, so no extra
+    query is needed. Reservation.save() runs this inside its transaction.
     """
     try:
-        with transaction.atomic():
-            # Handle new reservation creation
-            if not instance.pk:
-                # Update capacity
-                instance.time_slot.capacity -= 1
-                instance.time_slot.save()
-                
-                # Update daily menu item capacity
-                daily_menu_item = instance.time_slot.daily_menu_item
-                daily_menu_item.daily_capacity -= 1
-                
-                # If capacity reaches zero, mark as unavailable
-                if daily_menu_item.daily_capacity <= 0:
-                    daily_menu_item.is_available = False
-                daily_menu_item.save()
-            
-            # Get the old instance if it exists
-            old_instance = None
-            if instance.pk:
-                old_instance = Reservation.objects.get(pk=instance.pk)
-                
-                # Handle cancelled status change
-                if old_instance.status == 'pending_payment' and instance.status == 'cancelled':
-                    # Restore capacity
-                    instance.time_slot.capacity += 1
-                    instance.time_slot.save()
-                    
-                    # Restore daily menu item capacity
-                    daily_menu_item = instance.time_slot.daily_menu_item
-                    daily_menu_item.daily_capacity += 1
-                    
-                    # If capacity was zero, mark as available again
-                    if daily_menu_item.daily_capacity > 0 and not daily_menu_item.is_available:
-                        daily_menu_item.is_available = True
-                    daily_menu_item.save()
-                    
-                # Check if status is changing from 'preparing' to 'ready_to_pickup'
-                elif old_instance.status == 'preparing' and instance.status == 'ready_to_pickup':
-                    # Update the updated_at timestamp
-                    instance.updated_at = timezone.now()
-                    # Send notification to the student
-                    send_ready_pickup_notification(instance)
-                
-                # Handle trust score updates for status changes
-                if old_instance.status != instance.status:
-                    update_trust_score(instance, old_instance.status)
-                    
-    except Reservation.DoesNotExist:
-        pass  # This is a new reservation, no status change
+        # Handle new reservation creation
+        if instance._state.adding:
+            if instance.time_slot_id and not getattr(instance, '_seat_allocated', False):
+                # Take the seat atomically unless the caller already did
+                allocate_seat(instance.time_slot)
+                instance._seat_allocated = True
+            return
+
+        old_status = instance.original_value('status')
+        if old_status == instance.status:
+            return
+        instance.status_changed_at = timezone.now()
+
+        # Handle cancelled status change
+        if old_status == 'pending_payment' and instance.status == 'cancelled':
+            # Restore capacity
+            if instance.time_slot_id:
+                release_seats({instance.time_slot_id: 1})
+
+        # Check if status is changing from 'preparing' to 'ready_to_pickup'
+        elif old_status == 'preparing' and instance.status == 'ready_to_pickup':
+            # Update the updated_at timestamp
+            instance.updated_at = timezone.now()
+            # Send notification to the student
+            send_ready_pickup_notification(instance)
+
+        # Handle trust score updates for status changes
+        update_trust_score(instance, old_status)
+
     except Exception as e:
         logger.error(f"Error handling reservation status change: {str(e)}")
         raise  # Re-raise the exception to trigger transaction rollback
@@ -86,28 +72,35 @@ def update_trust_score(reservation, old_status):
         raise
 
 
+def ready_pickup_message(reservation_id, phone_number, name, delivery_code):
+    """Build the outbox message telling a student their order is ready for pickup."""
+    return SMSOutbox(
+        phone_number=phone_number,
+        template_id=str(settings.RESERVATION_READY_TEMPLATE_ID),
+        parameters={"name": name, "delivery_code": delivery_code},
+        dedupe_key=f"reservation-ready:{reservation_id}",
+    )
+
+
 def send_ready_pickup_notification(reservation):
     """
-    Sends a notification to the student that their order is ready for pickup.
-    
-    Uses the SMSService class to send an SMS notification to the student's phone number.
+    Queues a notification to the student that their order is ready for pickup.
+
+    The SMS is written to the outbox in the caller's transaction and sent by
+    the drain_sms_outbox task after commit.
     """
     student = reservation.student
-    delivery_code = reservation.delivery_code
-    phone_number = student.phone_number
-    name = student.first_name
+    if not student:
+        return
     
     # Log the notification
-    logger.info(f"Sending pickup notification to {phone_number} for reservation {reservation.id}")
+    logger.info(f"Queueing pickup notification to {student.phone_number} for reservation {reservation.id}")
     
-    # Send the SMS using SMSService
-    result = SMSService.send_notification(phone_number, name, delivery_code)
-    
-    # Log the result
-    if result["status"] == "success":
-        logger.info(f"Successfully sent pickup notification to {phone_number}")
-    else:
-        logger.error(f"Failed to send pickup notification to {phone_number}: {result['message']}")
-        
-    # Return the result of the SMS sending operation
-    return result
\ No newline at end of file
+    queue_many([ready_pickup_message(reservation.id, student.phone_number, student.first_name, reservation.delivery_code)])
+
+
+@receiver(post_save, sender=Reservation)
+def refresh_pickup_cache(sender, instance, **kwargs):
+    """Keep the pickup counter's copy of a saved reservation current."""
+    from .pickup import refresh
+    refresh([instance.pk])
@@ -0,0 +1,159 @@
+"""
+Sync protocol for offline-capable pickup stations.
+
+A pickup station keeps its own copy of a meal's reservations and records
+deliveries locally, so a scan never waits on the server:
+
+- ``snapshot`` gives the station every reservation of the meal, or with
+  ``since`` only those created or changed after its last download. Rows are
+  columnar and sorted by id, with ids delta-encoded and foods, time slots and
+  statuses sent once as lookup tables, which keeps a full meal small enough
+  to download over a poor connection.
+- ``apply_batch`` applies the deliveries a station recorded, in bulk through
+  ``transition``, exactly like ``DeliverOrderView`` does for one order.
+  Stations retry an upload until it is answered, so every batch is stored
+  with its results and uploading it again returns the stored results.
+
+Two stations can hand out the same order while offline. The first upload
+delivers it; later ones get ``already_picked_up`` with the time of the
+original pickup, so counter staff can follow it up.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.logging_utils import get_logger
+
+from .models import PickupSyncBatch, Reservation
+from .transitions import transition
+
+logger = get_logger(__name__)
+
+STATUSES = [code for code, _ in Reservation.STATUS_CHOICES]
+COLUMNS = ['id', 'delivery_code', 'status', 'student', 'food', 'time_slot']
+
+# Results of an uploaded delivery
+DELIVERED = 'delivered'
+ALREADY_PICKED_UP = 'already_picked_up'
+NOT_READY = 'not_ready'
+UNKNOWN = 'unknown'
+
+
+def snapshot(date, meal_type, since=None):
+    """
+    Get a meal's reservations for a pickup station.
+
+    Without ``since`` every reservation that can still reach the counter is
+    returned. With ``since`` (the ``as_of`` of the station's previous
+    download) only reservations created or changed after it are, including
+    cancelled ones so the station can drop them. The window reaches back
+    PICKUP_SYNC_OVERLAP seconds so changes committed while the previous
+    download ran aren't missed; rows seen twice simply replace each other.
+
+    Args:
+        date: Reservation date
+        meal_type: 'lunch' or 'dinner'
+        since: Optional datetime of the previous download
+
+    Returns:
+        dict: ``as_of``, ``full``, the lookup tables ``statuses``, ``foods``
+        and ``slots``, and ``rows`` in ``columns`` order, where ``id`` is the
+        difference to the previous row's id and ``status`` an index into
+        ``statuses``
+    """
+    as_of = timezone.now()
+    reservations = Reservation.objects.filter(reserved_date=date, meal_type=meal_type)
+    if since is None:
+        reservations = reservations.exclude(status__in=['pending_payment', 'cancelled'])
+    else:
+        cutoff = since - timedelta(seconds=settings.PICKUP_SYNC_OVERLAP)
+        reservations = reservations.filter(
+            Q(status_changed_at__gt=cutoff) | Q(created_at__gt=cutoff)
+        ).exclude(status='pending_payment')
+
+    status_index = {code: index for index, code in enumerate(STATUSES)}
+    foods, slots, rows = {}, {}, []
+    previous_id = 0
+    for (pk, delivery_code, status, first_name, last_name, food_id, food_name,
+         slot_id, start_time, end_time) in reservations.order_by('id').values_list(
+            'id', 'delivery_code', 'status', 'student__first_name', 'student__last_name',
+            'food_id', 'food__name', 'time_slot_id', 'time_slot__start_time', 'time_slot__end_time'):
+        if food_id is not None:
+            foods[food_id] = food_name
+        if slot_id is not None:
+            slots[slot_id] = f"{start_time:%H:%M}-{end_time:%H:%M}"
+        name = ' '.join(part for part in (first_name, last_name) if part)
+        rows.append([pk - previous_id, delivery_code, status_index[status], name, food_id, slot_id])
+        previous_id = pk
+
+    return {
+        'as_of': as_of.isoformat(),
+        'full': since is None,
+        'columns': COLUMNS,
+        'statuses': STATUSES,
+        'foods': foods,
+        'slots': slots,
+        'rows': rows,
+    }
+
+
+def apply_batch(station_id, batch_id, reservation_ids, user=None):
+    """
+    Deliver the orders a pickup station handed out.
+
+    Args:
+        station_id: Identifier of the uploading station
+        batch_id: Identifier the station gave this batch, unique per station
+        reservation_ids: Ids of the delivered reservations, in scan order
+        user: The uploading user
+
+    Returns:
+        tuple: (results, replayed) where results holds one dict per distinct
+        id with its ``id`` and ``result``, and replayed tells whether the
+        batch had already been applied
+    """
+    stored = PickupSyncBatch.objects.filter(station_id=station_id, batch_id=batch_id).first()
+    if stored is not None:
+        return stored.results, True
+
+    reservation_ids = list(dict.fromkeys(reservation_ids))
+    try:
+        with transaction.atomic():
+            outcome = transition(reservation_ids, 'picked_up', from_statuses=['ready_to_pickup'])
+            results = _results(reservation_ids, outcome)
+            PickupSyncBatch.objects.create(
+                station_id=station_id, batch_id=batch_id, uploaded_by=user, results=results
+            )
+    except IntegrityError:
+        # The same batch was uploaded concurrently and won; ours was rolled back
+        return PickupSyncBatch.objects.get(station_id=station_id, batch_id=batch_id).results, True
+
+    conflicts = sum(1 for result in results if result['result'] == ALREADY_PICKED_UP)
+    logger.info(
+        f"Station {station_id} batch {batch_id}: delivered {len(outcome.updated)} "
+        f"of {len(reservation_ids)}, {conflicts} already picked up"
+    )
+    return results, False
+
+
+def _results(reservation_ids, outcome):
+    delivered = {reservation.pk for reservation in outcome.updated}
+    picked_up = {reservation.pk: reservation.status_changed_at for reservation in outcome.unchanged}
+    results = []
+    for pk in reservation_ids:
+        if pk in delivered:
+            results.append({'id': pk, 'result': DELIVERED})
+        elif pk in picked_up:
+            results.append({
+                'id': pk,
+                'result': ALREADY_PICKED_UP,
+                'picked_up_at': picked_up[pk].isoformat() if picked_up[pk] else None,
+            })
+        elif pk in outcome.skipped:
+            results.append({'id': pk, 'result': NOT_READY, 'status': outcome.skipped[pk]})
+        else:
+            results.append({'id': pk, 'result': UNKNOWN})
+    return results
@@ -0,0 +1,121 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from notifications.models import SMSOutbox
+from orders.models import Reservation
+
+User = get_user_model()
+
+
+class BatchAdvanceTestMixin:
+    def setUp(self):
+        self.food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        self.date = timezone.now().date() + timedelta(days=1)
+        daily_menu = DailyMenu.objects.create(date=self.date, meal_type='lunch')
+        item = DailyMenuItem.objects.create(
+            daily_menu=daily_menu, food=self.food, start_time='12:00', end_time='14:00',
+            time_slot_count=2, time_slot_capacity=1000, daily_capacity=2000,
+        )
+        self.slots = [
+            TimeSlot.objects.create(daily_menu_item=item, start_time=start, end_time=end, capacity=1000)
+            for start, end in (('12:00', '13:00'), ('13:00', '14:00'))
+        ]
+        self.student = User.objects.create_user(
+            phone_number='09120000050', password='x', role='student', first_name='Sara'
+        )
+        receiver = User.objects.create_user(phone_number='09120000051', password='x', role='receiver')
+        self.client = APIClient()
+        self.client.force_authenticate(receiver)
+
+    def reserve(self, count, status, slot=None):
+        slot = slot or self.slots[0]
+        created = Reservation.objects.bulk_create([
+            Reservation(
+                student=self.student, food=self.food, time_slot=slot, meal_type='lunch',
+                reserved_date=self.date, price=Decimal('100000.00'), status=status,
+                reservation_number=i + 1, delivery_code=f'{i + 1:04d}00',
+            )
+            for i in range(count)
+        ])
+        return [reservation.pk for reservation in created]
+
+    def advance(self, payload):
+        return self.client.post(reverse('batch_advance_orders'), payload, format='json')
+
+
+@patch('notifications.tasks.drain_sms_outbox.delay')
+class BatchAdvanceOrdersTestCase(BatchAdvanceTestMixin, TestCase):
+    def test_advance_time_slot_to_ready(self, drain_sms_outbox):
+        ready = self.reserve(5, 'preparing')
+        other_slot = self.reserve(2, 'preparing', slot=self.slots[1])
+        self.reserve(1, 'pending_payment')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.advance({
+                'status': 'ready_to_pickup', 'reserved_date': self.date.isoformat(),
+                'meal_type': 'lunch', 'time_slot': self.slots[0].pk,
+            })
+
+        self.assertEqual(resp.status_code, 200, resp.data)
+        self.assertEqual(sorted(resp.data['ids']), ready)
+        self.assertEqual(Reservation.objects.filter(status='ready_to_pickup', updated_at__isnull=False).count(), 5)
+        self.assertEqual(Reservation.objects.filter(pk__in=other_slot, status='preparing').count(), 2)
+        self.assertEqual(
+            sorted(SMSOutbox.objects.values_list('dedupe_key', flat=True)),
+            sorted(f'reservation-ready:{pk}' for pk in ready)
+        )
+        drain_sms_outbox.assert_called_once()
+
+    def test_advance_by_ids_skips_illegal_sources(self, drain_sms_outbox):
+        waiting = self.reserve(3, 'waiting')
+        picked_up = self.reserve(1, 'picked_up')
+
+        resp = self.advance({'status': 'preparing', 'ids': waiting + picked_up})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['updated'], 3)
+        self.assertEqual(Reservation.objects.get(pk=picked_up[0]).status, 'picked_up')
+        self.assertFalse(SMSOutbox.objects.exists())
+
+    def test_query_count_is_constant(self, drain_sms_outbox):
+        self.reserve(200, 'preparing')
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.advance({'status': 'ready_to_pickup', 'reserved_date': self.date.isoformat(), 'meal_type': 'lunch'})
+
+        self.assertEqual(resp.data['updated'], 200)
+        # Savepoint, the UPDATE ... RETURNING, load contact details, one outbox INSERT, release savepoint
+        self.assertEqual(len(queries), 5)
+
+    def test_rejects_statuses_with_side_effects(self, drain_sms_outbox):
+        resp = self.advance({'status': 'picked_up', 'ids': self.reserve(1, 'ready_to_pickup')})
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_rejects_malformed_ids(self, drain_sms_outbox):
+        self.reserve(1, 'preparing')
+        date = self.date.isoformat()
+
+        for payload in (
+            {'status': 'ready_to_pickup', 'ids': [True]},
+            {'status': 'ready_to_pickup', 'reserved_date': date, 'meal_type': 'lunch', 'time_slot': 'first'},
+            {'status': 'ready_to_pickup', 'reserved_date': date, 'meal_type': 'lunch', 'time_slot': True},
+        ):
+            self.assertEqual(self.advance(payload).status_code, 400, payload)
+        self.assertFalse(Reservation.objects.filter(status='ready_to_pickup').exists())
+
+    def test_requires_a_selection(self, drain_sms_outbox):
+        resp = self.advance({'status': 'preparing', 'meal_type': 'lunch'})
+
+        self.assertEqual(resp.status_code, 400)
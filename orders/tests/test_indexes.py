@@ -0,0 +1,110 @@
+import json
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from menu.models import DailyMenu
+from orders.models import Reservation
+from users.models import OTP
+
+User = get_user_model()
+
+HISTORY_STATUSES = ['picked_up'] * 8 + ['not_picked_up', 'cancelled']
+ACTIVE_STATUSES = ['pending_payment', 'waiting', 'preparing', 'ready_to_pickup']
+
+
+def scans(queryset):
+    """Get the (node type, relation, index) of every scan in the query's plan."""
+    found = []
+
+    def walk(node):
+        if 'Scan' in node['Node Type']:
+            found.append((node['Node Type'], node.get('Relation Name'), node.get('Index Name')))
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(json.loads(queryset.explain(format='json'))[0]['Plan'])
+    return found
+
+
+class HotQueryPlanTestCase(TestCase):
+    """The hot order, menu and OTP lookups must use an index once the tables are large."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        first_day = date(2026, 1, 1)
+        cls.today = first_day + timedelta(days=89)
+        cls.students = User.objects.bulk_create([
+            User(phone_number=f"0912{n:07d}", role='student') for n in range(400)
+        ])
+
+        reservations = []
+        for day in range(90):
+            reserved_date = first_day + timedelta(days=day)
+            for meal_type in ('lunch', 'dinner'):
+                for number in range(1, 251):
+                    reservations.append(Reservation(
+                        student=rng.choice(cls.students),
+                        meal_type=meal_type,
+                        reserved_date=reserved_date,
+                        price=Decimal('100000.00'),
+                        status=rng.choice(ACTIVE_STATUSES if reserved_date == cls.today else HISTORY_STATUSES),
+                        reservation_number=number,
+                        delivery_code=f"{number:04d}{rng.randint(0, 99):02d}",
+                    ))
+        Reservation.objects.bulk_create(reservations, batch_size=5000)
+
+        DailyMenu.objects.bulk_create([
+            DailyMenu(date=first_day + timedelta(days=day), meal_type=meal_type)
+            for day in range(1000) for meal_type in ('lunch', 'dinner')
+        ])
+        OTP.objects.bulk_create([OTP(phone_number=f"0935{n:07d}", otp=f"{n % 999999:06d}") for n in range(10000)])
+
+        with connection.cursor() as cursor:
+            for table in ('orders_reservation', 'menu_dailymenu', 'users_otp'):
+                cursor.execute(f"ANALYZE {table}")
+
+    def assertUsesIndex(self, queryset, table, indexes):
+        found = [scan for scan in scans(queryset) if scan[1] == table]
+        self.assertTrue(found, f"No scan of {table}")
+        for node_type, _, index in found:
+            self.assertNotEqual(node_type, 'Seq Scan', f"Sequential scan of {table}")
+            self.assertIn(index, indexes)
+
+    def test_meal_day_queries(self):
+        meal_day = Reservation.objects.filter(reserved_date=self.today, meal_type='lunch')
+        self.assertUsesIndex(meal_day, 'orders_reservation', {'res_date_meal_status_idx', 'res_active_date_meal_idx'})
+        self.assertUsesIndex(
+            meal_day.filter(status='ready_to_pickup'),
+            'orders_reservation', {'res_date_meal_status_idx', 'res_active_date_meal_idx'},
+        )
+
+    def test_student_meal_check(self):
+        taken = Reservation.objects.filter(
+            student=self.students[0], reserved_date=self.today, meal_type='lunch'
+        ).exclude(status__in=['cancelled', 'pending_payment'])
+        self.assertUsesIndex(taken, 'orders_reservation', {'res_student_date_meal_idx'})
+
+    def test_delivery_code_lookup(self):
+        pickup = Reservation.objects.filter(delivery_code='012345', meal_type='lunch', reserved_date=self.today)
+        self.assertUsesIndex(pickup, 'orders_reservation', {'res_delivery_code_idx'})
+
+    def test_pending_payment_expiry(self):
+        expired = Reservation.objects.filter(
+            status='pending_payment', created_at__lt=timezone.now() - timedelta(minutes=10)
+        )
+        self.assertUsesIndex(expired, 'orders_reservation', {'res_pending_created_idx'})
+
+    def test_daily_menu_and_otp_lookups(self):
+        self.assertUsesIndex(
+            DailyMenu.objects.filter(date=date(2026, 6, 1), meal_type='lunch'), 'menu_dailymenu', {'unique_daily_menu'}
+        )
+        self.assertUsesIndex(
+            OTP.objects.filter(phone_number='09350000042', otp='000042'), 'users_otp', {'otp_phone_otp_idx'}
+        )
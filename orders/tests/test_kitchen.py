@@ -0,0 +1,80 @@
+import csv
+import io
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from orders.kitchen import TRAY_COLUMNS
+from orders.models import Reservation
+
+User = get_user_model()
+
+
+class KitchenSheetTestCase(TestCase):
+    def setUp(self):
+        self.date = timezone.now().date()
+        self.kebab = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        self.rice = Food.objects.create(name='Rice', price=Decimal('80000.00'))
+        menu = DailyMenu.objects.create(date=self.date, meal_type='lunch')
+        item = DailyMenuItem.objects.create(
+            daily_menu=menu, food=self.kebab, start_time='12:00', end_time='14:00',
+            time_slot_count=2, time_slot_capacity=100, daily_capacity=200,
+        )
+        self.early = TimeSlot.objects.create(daily_menu_item=item, start_time='12:00', end_time='13:00', capacity=100)
+        self.late = TimeSlot.objects.create(daily_menu_item=item, start_time='13:00', end_time='14:00', capacity=100)
+        students = User.objects.bulk_create([
+            User(phone_number=f"0912000{n:04d}", student_number=f"40{n:04d}", first_name='Student', role='student')
+            for n in range(10)
+        ])
+        # (food, slot, status) per student
+        orders = (
+            [(self.kebab, self.early, 'waiting')] * 4
+            + [(self.rice, self.early, 'preparing')] * 2
+            + [(self.kebab, self.late, 'ready_to_pickup')] * 2
+            + [(self.kebab, self.late, 'cancelled'), (self.rice, self.late, 'pending_payment')]
+        )
+        Reservation.objects.bulk_create([
+            Reservation(
+                student=student, food=food, time_slot=slot, meal_type='lunch', reserved_date=self.date,
+                price=Decimal('60000.00'), status=status_, reservation_number=n + 1,
+                delivery_code=f"{n + 1:04d}00",
+            )
+            for n, (student, (food, slot, status_)) in enumerate(zip(students, orders))
+        ])
+        chef = User.objects.create_user(phone_number='09129999999', password='x', role='chef')
+        self.client = APIClient()
+        self.client.force_authenticate(chef)
+        self.params = {'date': str(self.date), 'meal_type': 'lunch'}
+
+    def test_counts_per_food_and_slot(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('kitchen_sheet'), self.params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 8)
+        self.assertEqual(
+            [(entry['food_name'], entry['slot'], entry['count']) for entry in response.data['counts']],
+            [('Kebab', '12:00-13:00', 4), ('Rice', '12:00-13:00', 2), ('Kebab', '13:00-14:00', 2)],
+        )
+
+    def test_tray_list_is_streamed_as_csv(self):
+        response = self.client.get(reverse('kitchen_tray_list'), self.params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], TRAY_COLUMNS)
+        self.assertEqual([row[0] for row in rows[1:]], [str(n) for n in range(1, 9)])
+        self.assertEqual(rows[1], ['1', '000100', '12:00-13:00', 'Kebab', '400000', 'Student', '', '0', '0', 'waiting'])
+
+    def test_requires_date_and_meal(self):
+        self.assertEqual(self.client.get(reverse('kitchen_sheet'), {'date': str(self.date)}).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse('kitchen_tray_list'), {**self.params, 'meal_type': 'breakfast'}).status_code, 400
+        )
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from orders.models import Reservation
+from orders.serializers import ReservationSerializer
+
+User = get_user_model()
+
+
+class OrderListingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.date = timezone.now().date() + timedelta(days=1)
+        food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        menu = DailyMenu.objects.create(date=cls.date, meal_type='lunch')
+        item = DailyMenuItem.objects.create(
+            daily_menu=menu, food=food, start_time='12:00', end_time='14:00',
+            time_slot_count=2, time_slot_capacity=2000, daily_capacity=4000,
+        )
+        slots = [
+            TimeSlot.objects.create(daily_menu_item=item, start_time=start, end_time=end, capacity=2000)
+            for start, end in (('12:00', '13:00'), ('13:00', '14:00'))
+        ]
+        students = User.objects.bulk_create([
+            User(phone_number=f"0912{n:07d}", first_name='Student', role='student') for n in range(300)
+        ])
+        cls.student = students[0]
+        statuses = ['waiting', 'ready_to_pickup', 'picked_up']
+        Reservation.objects.bulk_create([
+            Reservation(
+                student=students[n % 300], food=food, time_slot=slots[n % 2], meal_type='lunch',
+                reserved_date=cls.date, price=Decimal('60000.00'), status=statuses[n % 3],
+                reservation_number=n + 1, delivery_code=f"{n + 1:04d}00",
+            )
+            for n in range(3000)
+        ])
+        cls.receiver = User.objects.create_user(phone_number='09129999999', password='x', role='receiver')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.receiver)
+
+    def test_lunch_list_pages_in_one_query_each(self):
+        url = reverse('receiver_orders')
+        params = {'reserved_date': str(self.date), 'meal_type': 'lunch', 'limit': 1000}
+        ids = []
+        pages = 0
+        while True:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids += [order['id'] for order in response.data['results']]
+            pages += 1
+            if not response.data['next']:
+                break
+            params['cursor'] = response.data['next']
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, sorted(Reservation.objects.values_list('id', flat=True)))
+
+    def test_rows_match_the_serializer(self):
+        response = self.client.get(reverse('receiver_orders'), {
+            'reserved_date': str(self.date), 'meal_type': 'lunch', 'limit': 5,
+        })
+        expected = ReservationSerializer(Reservation.objects.order_by('id')[:5], many=True).data
+        self.assertEqual(response.data['results'], expected)
+
+    def test_every_listing_has_a_constant_query_budget(self):
+        lists = [
+            ('pending_orders', {}),
+            ('picked_up_orders', {'reserved_date': str(self.date), 'meal_type': 'lunch'}),
+            ('ready_to_pickup_orders', {'reserved_date': str(self.date), 'meal_type': 'lunch'}),
+        ]
+        for name, params in lists:
+            with self.subTest(name), self.assertNumQueries(1):
+                response = self.client.get(reverse(name), {**params, 'limit': 1000})
+            self.assertEqual(len(response.data['results']), 1000)
+
+        self.client.force_authenticate(self.student)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('student_orders'))
+        # Newest first
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertGreater(response.data['results'][0]['id'], response.data['results'][-1]['id'])
+
+    def test_invalid_page_parameters(self):
+        for params in ({'cursor': '!!'}, {'limit': 0}, {'limit': 'all'}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get(reverse('pending_orders'), params).status_code, 400)
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from orders.models import Reservation
+from orders.serializers import ReservationSerializer
+from orders.transitions import advance, transition
+from university_food_system.tasks.background_tasks import preload_pickup_sessions
+
+User = get_user_model()
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pickup-tests'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class PickupCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.date = timezone.now().date()
+        food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        menu = DailyMenu.objects.create(date=self.date, meal_type='lunch')
+        item = DailyMenuItem.objects.create(
+            daily_menu=menu, food=food, start_time='12:00', end_time='14:00',
+            time_slot_count=1, time_slot_capacity=100, daily_capacity=100,
+        )
+        self.slot = TimeSlot.objects.create(daily_menu_item=item, start_time='12:00', end_time='14:00', capacity=100)
+        students = User.objects.bulk_create([
+            User(phone_number=f"0912000{n:04d}", first_name='Student', role='student') for n in range(50)
+        ])
+        self.reservations = Reservation.objects.bulk_create([
+            Reservation(
+                student=student, food=food, time_slot=self.slot, meal_type='lunch', reserved_date=self.date,
+                price=Decimal('60000.00'), status='preparing', reservation_number=n + 1,
+                delivery_code=f"{n + 1:04d}00",
+            )
+            for n, student in enumerate(students)
+        ])
+        receiver = User.objects.create_user(phone_number='09129999999', password='x', role='receiver')
+        self.client = APIClient()
+        self.client.force_authenticate(receiver)
+
+    def scan(self, code):
+        return self.client.post(
+            reverse('retrieve_by_delivery_code'),
+            {'delivery_code': code, 'meal_type': 'lunch', 'date': str(self.date)},
+        )
+
+    def test_scans_after_the_first_skip_the_database(self):
+        first = self.scan('000100')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data, ReservationSerializer(Reservation.objects.get(pk=self.reservations[0].pk)).data)
+
+        with self.assertNumQueries(0):
+            for n in range(2, 51):
+                self.assertEqual(self.scan(f"{n:04d}00").data['reservation_number'], n)
+
+        self.assertEqual(self.scan('999900').status_code, 404)
+
+    def test_status_changes_reach_the_cache(self):
+        self.scan('000100')
+        first, second = self.reservations[:2]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            advance([first.pk, second.pk], 'ready_to_pickup')
+        with self.captureOnCommitCallbacks(execute=True):
+            transition([first.pk], 'picked_up')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scan('000100').data['status'], 'picked_up')
+            self.assertEqual(self.scan('000200').data['status'], 'ready_to_pickup')
+
+    def test_orders_placed_after_loading_are_found(self):
+        self.scan('000100')
+        late = Reservation.objects.bulk_create([Reservation(
+            student=None, time_slot=self.slot, meal_type='lunch', reserved_date=self.date,
+            price=Decimal('60000.00'), status='waiting', reservation_number=51, delivery_code='005100',
+        )])[0]
+
+        self.assertEqual(self.scan('005100').data['id'], late.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scan('005100').data['id'], late.pk)
+
+    def test_falls_back_to_the_database_without_a_cache(self):
+        with patch('orders.pickup.cache.get', side_effect=ConnectionError):
+            response = self.scan('000300')
+        self.assertEqual(response.data['id'], self.reservations[2].pk)
+
+    def test_preload_loads_meals_about_to_be_served(self):
+        now = self.slot.starts_at - timedelta(minutes=10)
+        with patch('university_food_system.tasks.background_tasks.timezone.now', return_value=now):
+            self.assertEqual(preload_pickup_sessions(), "1 pickup sessions loaded.")
+            self.assertEqual(preload_pickup_sessions(), "0 pickup sessions loaded.")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.scan('000100').status_code, 200)
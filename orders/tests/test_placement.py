@@ -0,0 +1,153 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Voucher
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from orders.models import Reservation
+from orders.seats import allocate_seats
+
+User = get_user_model()
+
+
+class BulkPlaceOrderTestCase(TestCase):
+    def setUp(self):
+        Voucher.objects.create(id=1, price=Decimal('40000.00'))
+        self.food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        self.student = User.objects.create_user(phone_number='09120000030', password='x', role='student')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        today = timezone.now().date()
+        self.slots = [self.create_slot(today + timedelta(days=day)) for day in range(1, 8)]
+
+    def create_slot(self, date, meal_type='lunch', capacity=5, daily_capacity=50):
+        daily_menu = DailyMenu.objects.create(date=date, meal_type=meal_type)
+        item = DailyMenuItem.objects.create(
+            daily_menu=daily_menu, food=self.food, start_time='12:00', end_time='14:00',
+            time_slot_count=1, time_slot_capacity=capacity, daily_capacity=daily_capacity,
+        )
+        return TimeSlot.objects.create(daily_menu_item=item, start_time='12:00', end_time='14:00', capacity=capacity)
+
+    def entry(self, slot, **kwargs):
+        daily_menu = slot.daily_menu_item.daily_menu
+        return {
+            'food': self.food.pk,
+            'time_slot': slot.pk,
+            'reserved_date': daily_menu.date.isoformat(),
+            'meal_type': daily_menu.meal_type,
+            **kwargs,
+        }
+
+    def place(self, entries):
+        return self.client.post(reverse('bulk_place_order'), {'reservations': entries}, format='json')
+
+    def test_books_a_whole_week(self):
+        resp = self.place([self.entry(slot, has_voucher=True) for slot in self.slots])
+
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual(resp.data['created'], 7)
+        self.assertTrue(all(result['success'] for result in resp.data['results']))
+        reservation = resp.data['results'][0]['reservation']
+        self.assertEqual(Decimal(reservation['price']), Decimal('60000.00'))
+        self.assertEqual(reservation['reservation_number'], 1)
+        self.assertTrue(reservation['delivery_code'].startswith('0001'))
+        self.assertEqual(reservation['status'], 'pending_payment')
+        for slot in self.slots:
+            slot.refresh_from_db()
+            self.assertEqual(slot.capacity, 4)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.place([self.entry(self.slots[0])])
+        Reservation.objects.all().delete()
+        with CaptureQueriesContext(connection) as large:
+            self.place([self.entry(slot) for slot in self.slots[1:]])
+
+        # Only the per-day number reservation grows with the number of days
+        self.assertLessEqual(len(large), len(small) + 5)
+        self.assertEqual(Reservation.objects.count(), 6)
+
+    def test_failures_are_reported_per_entry(self):
+        Reservation.objects.create(
+            student=self.student, food=self.food, time_slot=self.slots[1], meal_type='lunch',
+            reserved_date=self.slots[1].daily_menu_item.daily_menu.date, price=Decimal('100000.00'),
+            status='waiting',
+        )
+        TimeSlot.objects.filter(pk=self.slots[2].pk).update(capacity=0)
+
+        resp = self.place([
+            self.entry(self.slots[0]),
+            self.entry(self.slots[1]),
+            self.entry(self.slots[2]),
+            self.entry(self.slots[3], reserved_date=self.slots[4].daily_menu_item.daily_menu.date.isoformat()),
+            self.entry(self.slots[5]),
+            self.entry(self.slots[5]),
+            {'food': self.food.pk},
+        ])
+
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual(resp.data['created'], 2)
+        self.assertEqual([r['success'] for r in resp.data['results']], [True, False, False, False, True, False, False])
+        errors = [r.get('errors', {}) for r in resp.data['results']]
+        self.assertIn('already have a reservation', str(errors[1]))
+        self.assertIn('full', str(errors[2]))
+        self.assertIn('not on the menu', str(errors[3]))
+        self.assertIn('already have a reservation', str(errors[5]))
+        self.assertIn('time_slot', errors[6])
+
+    def test_all_failed_returns_bad_request(self):
+        TimeSlot.objects.filter(pk=self.slots[0].pk).update(capacity=0)
+
+        resp = self.place([self.entry(self.slots[0])])
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.data['created'], 0)
+
+    def test_rejects_oversized_batch(self):
+        resp = self.place([self.entry(self.slots[0])] * 50)
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_free_orders_cancel_pending_payments(self):
+        Voucher.objects.filter(id=1).update(price=Decimal('100000.00'))
+        pending = Reservation.objects.create(
+            student=self.student, food=self.food, time_slot=self.slots[0], meal_type='lunch',
+            reserved_date=self.slots[0].daily_menu_item.daily_menu.date, price=Decimal('100000.00'),
+        )
+
+        resp = self.place([self.entry(self.slots[0], has_voucher=True)])
+
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual(resp.data['results'][0]['reservation']['status'], 'waiting')
+        pending.refresh_from_db(); self.slots[0].refresh_from_db()
+        self.assertEqual(pending.status, 'cancelled')
+        self.assertEqual(self.slots[0].capacity, 4)
+
+
+class AllocateSeatsTestCase(TestCase):
+    def test_slots_share_item_daily_capacity(self):
+        food = Food.objects.create(name='Stew', price=Decimal('80000.00'))
+        daily_menu = DailyMenu.objects.create(date=timezone.now().date() + timedelta(days=1), meal_type='dinner')
+        item = DailyMenuItem.objects.create(
+            daily_menu=daily_menu, food=food, start_time='19:00', end_time='21:00',
+            time_slot_count=2, time_slot_capacity=3, daily_capacity=4,
+        )
+        first = TimeSlot.objects.create(daily_menu_item=item, start_time='19:00', end_time='20:00', capacity=3)
+        second = TimeSlot.objects.create(daily_menu_item=item, start_time='20:00', end_time='21:00', capacity=3)
+
+        granted = allocate_seats({first.pk: 3, second.pk: 3})
+
+        self.assertEqual(granted, {first.pk: 3, second.pk: 1})
+        first.refresh_from_db(); second.refresh_from_db(); item.refresh_from_db()
+        self.assertEqual((first.capacity, second.capacity), (0, 2))
+        self.assertEqual(item.daily_capacity, 0)
+        self.assertFalse(item.is_available)
@@ -0,0 +1,239 @@
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Voucher
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from orders.models import Reservation
+from orders.seats import SeatUnavailable, allocate_seat, release_seats
+from orders.serializers import CreateReservationSerializer
+
+User = get_user_model()
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_slot(capacity, daily_capacity, food_name='Kebab'):
+    food = Food.objects.create(name=food_name, price=Decimal('100000.00'))
+    daily_menu = DailyMenu.objects.create(date=timezone.now().date() + timedelta(days=1), meal_type='lunch')
+    item = DailyMenuItem.objects.create(
+        daily_menu=daily_menu,
+        food=food,
+        start_time='12:00',
+        end_time='14:00',
+        time_slot_count=1,
+        time_slot_capacity=capacity,
+        daily_capacity=daily_capacity,
+    )
+    slot = TimeSlot.objects.create(daily_menu_item=item, start_time='12:00', end_time='14:00', capacity=capacity)
+    return food, item, slot
+
+
+class SeatAllocatorTestCase(TestCase):
+    def setUp(self):
+        self.food, self.item, self.slot = create_slot(capacity=2, daily_capacity=2)
+
+    def test_allocate_decrements_slot_and_item(self):
+        allocate_seat(self.slot)
+
+        self.assertEqual(self.slot.capacity, 1)
+        self.slot.refresh_from_db(); self.item.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 1)
+        self.assertEqual(self.item.daily_capacity, 1)
+        self.assertTrue(self.item.is_available)
+
+    def test_last_seat_marks_item_unavailable(self):
+        allocate_seat(self.slot)
+        allocate_seat(self.slot)
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.daily_capacity, 0)
+        self.assertFalse(self.item.is_available)
+        with self.assertRaises(SeatUnavailable):
+            allocate_seat(self.slot)
+
+    def test_full_item_rolls_back_slot(self):
+        DailyMenuItem.objects.filter(pk=self.item.pk).update(daily_capacity=0, is_available=False)
+
+        with self.assertRaises(SeatUnavailable):
+            allocate_seat(self.slot)
+
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 2)
+
+    def test_release_restores_capacity_and_availability(self):
+        allocate_seat(self.slot)
+        allocate_seat(self.slot)
+
+        self.assertEqual(release_seats({self.slot.pk: 2}), 2)
+
+        self.slot.refresh_from_db(); self.item.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 2)
+        self.assertEqual(self.item.daily_capacity, 2)
+        self.assertTrue(self.item.is_available)
+
+    def test_release_keeps_manually_disabled_item_off(self):
+        allocate_seat(self.slot)
+        DailyMenuItem.objects.filter(pk=self.item.pk).update(is_available=False)
+
+        release_seats({self.slot.pk: 1})
+
+        self.item.refresh_from_db()
+        self.assertFalse(self.item.is_available)
+
+    def test_cancelling_pending_reservation_releases_seat(self):
+        student = User.objects.create_user(phone_number='09120000010', password='x', role='student')
+        reservation = Reservation.objects.create(
+            student=student, food=self.food, time_slot=self.slot, meal_type='lunch',
+            reserved_date=self.item.daily_menu.date, price=Decimal('100000.00'),
+        )
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 1)
+
+        reservation.status = 'cancelled'
+        reservation.save(update_fields=['status'])
+
+        self.slot.refresh_from_db(); self.item.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 2)
+        self.assertEqual(self.item.daily_capacity, 2)
+
+    def test_free_order_cancels_other_pending_and_releases_their_seats(self):
+        Voucher.objects.create(id=1, price=Decimal('100000.00'))
+        student = User.objects.create_user(phone_number='09120000011', password='x', role='student')
+        pending = Reservation.objects.create(
+            student=student, food=self.food, time_slot=self.slot, meal_type='lunch',
+            reserved_date=self.item.daily_menu.date, price=Decimal('100000.00'),
+        )
+
+        client = APIClient()
+        client.force_authenticate(student)
+        resp = client.post(reverse('place_order'), {
+            'food': self.food.pk,
+            'time_slot': self.slot.pk,
+            'reserved_date': self.item.daily_menu.date.isoformat(),
+            'meal_type': 'lunch',
+            'has_voucher': True,
+        }, format='json')
+
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual(resp.data['status'], 'waiting')
+        pending.refresh_from_db(); self.slot.refresh_from_db()
+        self.assertEqual(pending.status, 'cancelled')
+        self.assertEqual(self.slot.capacity, 1)
+
+    @override_settings(SEAT_TOKENS_ENABLED=True, CACHES=LOCMEM_CACHE)
+    def test_sold_out_slot_rejected_from_token_store(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            allocate_seat(self.slot)
+            allocate_seat(self.slot)
+
+        with self.assertNumQueries(0):
+            with self.assertRaises(SeatUnavailable):
+                allocate_seat(self.slot)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_seats({self.slot.pk: 1})
+        allocate_seat(self.slot)
+
+    @override_settings(SEAT_TOKENS_ENABLED=True, CACHES=LOCMEM_CACHE)
+    def test_rolled_back_allocation_keeps_its_token(self):
+        class Failed(Exception):
+            pass
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(Failed):
+                with transaction.atomic():
+                    allocate_seat(self.slot)
+                    allocate_seat(self.slot)
+                    raise Failed
+
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            allocate_seat(self.slot)
+            allocate_seat(self.slot)
+        self.assertEqual(self.slot.capacity, 0)
+
+
+class SeatAllocatorConcurrencyTestCase(TransactionTestCase):
+    """Stress tests that race real database connections against the same slot."""
+
+    def _race(self, workers, target):
+        barrier = threading.Barrier(workers)
+        results = []
+        lock = threading.Lock()
+
+        def run(index):
+            try:
+                barrier.wait()
+                outcome = target(index)
+            except Exception as e:
+                outcome = e
+            finally:
+                connection.close()
+            with lock:
+                results.append(outcome)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_allocator_never_oversells(self):
+        _, item, slot = create_slot(capacity=10, daily_capacity=10)
+
+        def take_seat(index):
+            allocate_seat(TimeSlot.objects.get(pk=slot.pk))
+            return True
+
+        results = self._race(40, take_seat)
+
+        self.assertEqual(sum(1 for r in results if r is True), 10)
+        self.assertTrue(all(r is True or isinstance(r, SeatUnavailable) for r in results))
+        slot.refresh_from_db(); item.refresh_from_db()
+        self.assertEqual(slot.capacity, 0)
+        self.assertEqual(item.daily_capacity, 0)
+        self.assertFalse(item.is_available)
+
+    def test_place_order_never_oversells(self):
+        food, item, slot = create_slot(capacity=5, daily_capacity=50)
+        students = [
+            User.objects.create_user(phone_number=f'0912100{i:04d}', password='x', role='student')
+            for i in range(20)
+        ]
+
+        def place_order(index):
+            serializer = CreateReservationSerializer(
+                data={
+                    'food': food.pk,
+                    'time_slot': slot.pk,
+                    'reserved_date': item.daily_menu.date.isoformat(),
+                    'meal_type': 'lunch',
+                    'has_voucher': False,
+                },
+                context={'request': SimpleNamespace(user=students[index])},
+            )
+            # Validation may already see the slot as full; either way no seat is taken
+            if not serializer.is_valid():
+                return False
+            serializer.save(student=students[index])
+            return True
+
+        results = self._race(len(students), place_order)
+
+        self.assertEqual(sum(1 for r in results if r is True), 5)
+        self.assertEqual(Reservation.objects.filter(time_slot=slot).count(), 5)
+        slot.refresh_from_db(); item.refresh_from_db()
+        self.assertEqual(slot.capacity, 0)
+        self.assertEqual(item.daily_capacity, 45)
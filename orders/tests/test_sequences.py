@@ -0,0 +1,119 @@
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from food.models import Food
+from orders.models import Reservation, ReservationSequence
+
+User = get_user_model()
+
+
+class ReservationSequenceTestCase(TestCase):
+    def setUp(self):
+        self.food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        self.date = timezone.now().date() + timedelta(days=1)
+        self.student = User.objects.create_user(phone_number='09120000020', password='x', role='student')
+
+    def reserve(self, meal_type='lunch', **kwargs):
+        return Reservation.objects.create(
+            student=self.student, food=self.food, meal_type=meal_type,
+            reserved_date=self.date, price=Decimal('100000.00'), **kwargs
+        )
+
+    def test_numbers_are_sequential_per_meal_and_day(self):
+        numbers = [self.reserve().reservation_number for _ in range(3)]
+
+        self.assertEqual(numbers, [1, 2, 3])
+        self.assertEqual(
+            ReservationSequence.objects.get(meal_type='lunch', reserved_date=self.date).last_number, 3
+        )
+
+    def test_meals_have_independent_sequences(self):
+        self.reserve('lunch')
+        self.reserve('lunch')
+
+        self.assertEqual(self.reserve('dinner').reservation_number, 1)
+
+    def test_delivery_code_starts_with_reservation_number(self):
+        reservation = self.reserve()
+
+        self.assertTrue(reservation.delivery_code.startswith('0001'))
+
+    def test_next_numbers_reserves_a_block(self):
+        self.reserve()
+
+        block = ReservationSequence.objects.next_numbers('lunch', self.date, 5)
+
+        self.assertEqual(list(block), [2, 3, 4, 5, 6])
+        self.assertEqual(self.reserve().reservation_number, 7)
+
+    def test_repair_command_fixes_duplicates_and_missing_numbers(self):
+        first = self.reserve()
+        second = self.reserve()
+        Reservation.objects.filter(pk=second.pk).update(reservation_number=first.reservation_number)
+        third = self.reserve()
+        Reservation.objects.filter(pk=third.pk).update(reservation_number=None)
+        ReservationSequence.objects.all().delete()
+
+        call_command('repair_reservation_numbers', stdout=StringIO())
+
+        numbers = list(
+            Reservation.objects.filter(reserved_date=self.date).order_by('id').values_list('reservation_number', flat=True)
+        )
+        self.assertEqual(numbers, [1, 2, 3])
+        second.refresh_from_db()
+        self.assertTrue(second.delivery_code.startswith('0002'))
+        self.assertEqual(self.reserve().reservation_number, 4)
+
+    def test_repair_command_dry_run_changes_nothing(self):
+        first = self.reserve()
+        second = self.reserve()
+        Reservation.objects.filter(pk=second.pk).update(reservation_number=first.reservation_number)
+
+        out = StringIO()
+        call_command('repair_reservation_numbers', '--dry-run', stdout=out)
+
+        second.refresh_from_db()
+        self.assertEqual(second.reservation_number, first.reservation_number)
+        self.assertIn('Would renumber 1', out.getvalue())
+
+
+class ReservationSequenceConcurrencyTestCase(TransactionTestCase):
+    def test_concurrent_orders_get_unique_numbers(self):
+        food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        date = timezone.now().date() + timedelta(days=1)
+        students = [
+            User.objects.create_user(phone_number=f'0912200{i:04d}', password='x', role='student')
+            for i in range(20)
+        ]
+        barrier = threading.Barrier(len(students))
+        errors = []
+
+        def reserve(student):
+            try:
+                barrier.wait()
+                Reservation.objects.create(
+                    student=student, food=food, meal_type='lunch',
+                    reserved_date=date, price=Decimal('100000.00'),
+                )
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve, args=(student,)) for student in students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        numbers = sorted(Reservation.objects.values_list('reservation_number', flat=True))
+        self.assertEqual(numbers, list(range(1, len(students) + 1)))
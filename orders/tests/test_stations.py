@@ -0,0 +1,134 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from orders.models import PickupSyncBatch, Reservation
+from orders.stations import STATUSES
+from orders.transitions import transition
+
+User = get_user_model()
+
+
+class PickupStationSyncTestCase(TestCase):
+    def setUp(self):
+        self.date = timezone.now().date()
+        self.food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        menu = DailyMenu.objects.create(date=self.date, meal_type='lunch')
+        item = DailyMenuItem.objects.create(
+            daily_menu=menu, food=self.food, start_time='12:00', end_time='14:00',
+            time_slot_count=1, time_slot_capacity=100, daily_capacity=100,
+        )
+        self.slot = TimeSlot.objects.create(daily_menu_item=item, start_time='12:00', end_time='14:00', capacity=100)
+        students = User.objects.bulk_create([
+            User(phone_number=f"0912000{n:04d}", first_name='Student', last_name=str(n), role='student')
+            for n in range(6)
+        ])
+        statuses = ['ready_to_pickup', 'ready_to_pickup', 'ready_to_pickup', 'preparing', 'cancelled', 'pending_payment']
+        self.reservations = Reservation.objects.bulk_create([
+            Reservation(
+                student=student, food=self.food, time_slot=self.slot, meal_type='lunch', reserved_date=self.date,
+                price=Decimal('60000.00'), status=status_, reservation_number=n + 1,
+                delivery_code=f"{n + 1:04d}00",
+            )
+            for n, (student, status_) in enumerate(zip(students, statuses))
+        ])
+        self.receiver = User.objects.create_user(phone_number='09129999999', password='x', role='receiver')
+        self.client = APIClient()
+        self.client.force_authenticate(self.receiver)
+
+    def download(self, **params):
+        return self.client.get(reverse('pickup_station_sync'), {'date': str(self.date), 'meal_type': 'lunch', **params})
+
+    def upload(self, batch_id, deliveries, station_id='counter-1'):
+        return self.client.post(
+            reverse('pickup_station_sync'),
+            {'station_id': station_id, 'batch_id': batch_id, 'deliveries': deliveries},
+            format='json',
+        )
+
+    def decode(self, data):
+        """Turn a download back into {id: {column: value}}."""
+        rows, previous_id = {}, 0
+        for row in data['rows']:
+            previous_id += row[0]
+            decoded = dict(zip(data['columns'][1:], row[1:]))
+            decoded['status'] = data['statuses'][decoded['status']]
+            rows[previous_id] = decoded
+        return rows
+
+    def test_snapshot_is_delta_encoded(self):
+        with self.assertNumQueries(1):
+            response = self.download()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['full'])
+        self.assertEqual(data['foods'], {str(self.food.pk): 'Kebab'})
+        self.assertEqual(data['slots'], {str(self.slot.pk): '12:00-14:00'})
+
+        rows = self.decode(data)
+        self.assertEqual(sorted(rows), [reservation.pk for reservation in self.reservations[:4]])
+        first = self.reservations[0]
+        self.assertEqual(rows[first.pk], {
+            'delivery_code': '000100', 'status': 'ready_to_pickup', 'student': 'Student 0',
+            'food': self.food.pk, 'time_slot': self.slot.pk,
+        })
+        self.assertEqual(STATUSES[data['rows'][3][2]], 'preparing')
+
+    def test_delta_returns_only_changes(self):
+        as_of = self.download().json()['as_of']
+        Reservation.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+        with self.settings(PICKUP_SYNC_OVERLAP=0):
+            self.assertEqual(self.download(since=as_of).json()['rows'], [])
+            transition([self.reservations[3].pk], 'ready_to_pickup')
+            data = self.download(since=as_of).json()
+
+        self.assertFalse(data['full'])
+        self.assertEqual(self.decode(data), {
+            self.reservations[3].pk: {
+                'delivery_code': '000400', 'status': 'ready_to_pickup', 'student': 'Student 3',
+                'food': self.food.pk, 'time_slot': self.slot.pk,
+            }
+        })
+        self.assertEqual(self.download(since='yesterday').status_code, 400)
+
+    def test_batches_are_applied_once(self):
+        ready, other, _, preparing = self.reservations[:4]
+        deliveries = [ready.pk, preparing.pk, 999999, ready.pk]
+
+        response = self.upload('b1', deliveries)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['replayed'])
+        self.assertEqual(response.data['results'], [
+            {'id': ready.pk, 'result': 'delivered'},
+            {'id': preparing.pk, 'result': 'not_ready', 'status': 'preparing'},
+            {'id': 999999, 'result': 'unknown'},
+        ])
+        ready.refresh_from_db()
+        self.assertEqual(ready.status, 'picked_up')
+
+        retry = self.upload('b1', deliveries)
+        self.assertTrue(retry.data['replayed'])
+        self.assertEqual(retry.data['results'], response.data['results'])
+        self.assertEqual(PickupSyncBatch.objects.get().uploaded_by, self.receiver)
+
+        # Another station handed out the same order while offline
+        conflict = self.upload('b1', [ready.pk, other.pk], station_id='counter-2')
+        self.assertFalse(conflict.data['replayed'])
+        self.assertEqual(conflict.data['results'][0]['result'], 'already_picked_up')
+        self.assertEqual(conflict.data['results'][0]['picked_up_at'], ready.status_changed_at.isoformat())
+        self.assertEqual(conflict.data['results'][1], {'id': other.pk, 'result': 'delivered'})
+
+    def test_invalid_uploads_are_rejected(self):
+        self.assertEqual(self.upload('', [1]).status_code, 400)
+        self.assertEqual(self.upload('b1', ['1']).status_code, 400)
+        with self.settings(PICKUP_SYNC_MAX_BATCH=2):
+            self.assertEqual(self.upload('b1', [1, 2, 3]).status_code, 400)
+        self.assertFalse(PickupSyncBatch.objects.exists())
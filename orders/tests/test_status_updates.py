@@ -0,0 +1,95 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from notifications.models import SMSOutbox
+from orders.models import Reservation
+
+User = get_user_model()
+
+
+class ReservationStatusUpdateTestCase(TestCase):
+    def setUp(self):
+        food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        daily_menu = DailyMenu.objects.create(date=timezone.now().date() + timedelta(days=1), meal_type='lunch')
+        item = DailyMenuItem.objects.create(
+            daily_menu=daily_menu, food=food, start_time='12:00', end_time='14:00',
+            time_slot_count=1, time_slot_capacity=5, daily_capacity=5,
+        )
+        self.slot = TimeSlot.objects.create(daily_menu_item=item, start_time='12:00', end_time='14:00', capacity=5)
+        self.student = User.objects.create_user(phone_number='09120000040', password='x', role='student')
+        self.reservation = Reservation.objects.create(
+            student=self.student, food=food, time_slot=self.slot, meal_type='lunch',
+            reserved_date=daily_menu.date, price=Decimal('100000.00'), status='preparing',
+        )
+        receiver = User.objects.create_user(phone_number='09120000041', password='x', role='receiver')
+        self.client = APIClient()
+        self.client.force_authenticate(receiver)
+
+    def update_status(self, new_status):
+        return self.client.patch(
+            reverse('update_order_status', args=[self.reservation.pk]), {'status': new_status}, format='json'
+        )
+
+    @patch('notifications.tasks.drain_sms_outbox.delay')
+    def test_ready_to_pickup_query_count(self, drain_sms_outbox):
+        # Savepoint, lock and load the order, update, queue the SMS, release savepoint
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(5):
+                resp = self.update_status('ready_to_pickup')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['status'], 'ready_to_pickup')
+        message = SMSOutbox.objects.get()
+        self.assertEqual(message.phone_number, self.student.phone_number)
+        self.assertEqual(message.parameters['delivery_code'], self.reservation.delivery_code)
+        drain_sms_outbox.assert_called_once()
+
+    def test_illegal_transition_is_rejected(self):
+        resp = self.update_status('pending_payment')
+
+        self.assertEqual(resp.status_code, 400)
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'preparing')
+
+    def test_picked_up_updates_trust_score_once(self):
+        Reservation.objects.filter(pk=self.reservation.pk).update(status='ready_to_pickup')
+
+        # As above, plus the trust score UPDATE
+        with self.assertNumQueries(5):
+            resp = self.update_status('picked_up')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['trust_score'], 20)
+        self.assertEqual(resp.data['trust_score_impact'], 10)
+        self.student.refresh_from_db(); self.reservation.refresh_from_db()
+        self.assertEqual(self.student.trust_score, 20)
+        self.assertEqual(self.reservation.trust_score_impact, 10)
+
+    def test_saving_without_status_change_skips_side_effects(self):
+        reservation = Reservation.objects.select_related('student', 'food').get(pk=self.reservation.pk)
+        reservation.delivery_code = '000199'
+
+        with self.assertNumQueries(1):
+            reservation.save()
+
+    def test_tracker_follows_update_fields(self):
+        reservation = Reservation.objects.get(pk=self.reservation.pk)
+        reservation.status = 'ready_to_pickup'
+        reservation.time_slot = None
+
+        reservation.save(update_fields=['status', 'updated_at'])
+
+        self.assertFalse(reservation.has_changed('status'))
+        self.assertTrue(reservation.has_changed('time_slot_id'))
+        self.assertEqual(reservation.original_value('time_slot_id'), self.slot.pk)
+        # Saves outside the transition engine queue the pickup SMS from the signal
+        self.assertTrue(SMSOutbox.objects.filter(dedupe_key=f'reservation-ready:{reservation.pk}').exists())
@@ -0,0 +1,146 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from food.models import Food
+from menu.models import DailyMenu, DailyMenuItem, TimeSlot
+from notifications.models import SMSOutbox
+from orders.admin import ReservationAdmin
+from orders.models import Reservation
+from orders.transitions import can_transition, expire_pending, transition
+
+User = get_user_model()
+
+
+class TransitionEngineTestCase(TestCase):
+    def setUp(self):
+        self.food = Food.objects.create(name='Kebab', price=Decimal('100000.00'))
+        daily_menu = DailyMenu.objects.create(date=timezone.now().date() + timedelta(days=1), meal_type='lunch')
+        self.item = DailyMenuItem.objects.create(
+            daily_menu=daily_menu, food=self.food, start_time='12:00', end_time='14:00',
+            time_slot_count=1, time_slot_capacity=100, daily_capacity=100,
+        )
+        self.slot = TimeSlot.objects.create(daily_menu_item=self.item, start_time='12:00', end_time='14:00', capacity=100)
+        self.students = [
+            User.objects.create_user(phone_number=f'0912300{i:04d}', password='x', role='student')
+            for i in range(3)
+        ]
+
+    def reserve(self, count, status, **kwargs):
+        reservations = [
+            Reservation.objects.create(
+                student=self.students[i % len(self.students)], food=self.food, time_slot=self.slot,
+                meal_type='lunch', reserved_date=self.item.daily_menu.date, price=Decimal('100000.00'), **kwargs
+            )
+            for i in range(count)
+        ]
+        Reservation.objects.filter(pk__in=[r.pk for r in reservations]).update(status=status)
+        return [r.pk for r in reservations]
+
+    def test_legal_edges(self):
+        self.assertTrue(can_transition('preparing', 'ready_to_pickup'))
+        self.assertTrue(can_transition('cancelled', 'waiting'))
+        self.assertFalse(can_transition('picked_up', 'waiting'))
+        self.assertFalse(can_transition('pending_payment', 'picked_up'))
+        with self.assertRaises(ValueError):
+            transition([], 'eaten')
+
+    @patch('notifications.tasks.drain_sms_outbox.delay')
+    def test_bulk_ready_to_pickup_uses_constant_queries(self, drain_sms_outbox):
+        ids = self.reserve(30, 'preparing')
+        stale = self.reserve(1, 'picked_up')
+
+        # Savepoint, lock and load, one UPDATE, one outbox INSERT, release savepoint
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(5):
+                result = transition(ids + stale, 'ready_to_pickup')
+
+        self.assertEqual(len(result.updated), 30)
+        self.assertEqual(result.skipped, {stale[0]: 'picked_up'})
+        self.assertEqual(Reservation.objects.filter(status='ready_to_pickup', updated_at__isnull=False).count(), 30)
+        self.assertEqual(SMSOutbox.objects.count(), 30)
+        drain_sms_outbox.assert_called_once()
+
+    def test_trust_score_deltas_are_aggregated_per_student(self):
+        picked = self.reserve(6, 'ready_to_pickup')
+        missed = self.reserve(3, 'ready_to_pickup', has_voucher=True)
+
+        transition(picked, 'picked_up')
+        transition(missed, 'not_picked_up')
+
+        for student in self.students:
+            student.refresh_from_db()
+            # Two pickups at +10 each, one voucher no-show at -10
+            self.assertEqual(student.trust_score, 10 + 20 - 10)
+        self.assertEqual(set(Reservation.objects.filter(pk__in=picked).values_list('trust_score_impact', flat=True)), {10})
+        self.assertEqual(set(Reservation.objects.filter(pk__in=missed).values_list('trust_score_impact', flat=True)), {-10})
+
+    def test_cancel_and_reactivate_move_seats(self):
+        ids = self.reserve(4, 'pending_payment')
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 96)
+
+        transition(Reservation.objects.filter(pk__in=ids), 'cancelled')
+        self.slot.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 100)
+
+        transition(ids[:1], 'waiting')
+        self.slot.refresh_from_db(); self.item.refresh_from_db()
+        self.assertEqual(self.slot.capacity, 99)
+        self.assertEqual(self.item.daily_capacity, 99)
+
+    def test_expire_pending_is_set_based(self):
+        expired = self.reserve(20, 'pending_payment')
+        recent = self.reserve(5, 'pending_payment')
+        paid = self.reserve(2, 'waiting')
+        cutoff = timezone.now() - timedelta(minutes=10)
+        Reservation.objects.filter(pk__in=expired + paid).update(created_at=cutoff - timedelta(minutes=1))
+        self.slot.refresh_from_db()
+        self.item.refresh_from_db()
+        slot_capacity, item_capacity = self.slot.capacity, self.item.daily_capacity
+
+        with CaptureQueriesContext(connection) as queries:
+            rows = expire_pending(cutoff)
+
+        # UPDATE ... RETURNING plus the grouped seat release, whatever the batch size
+        self.assertEqual(len([q for q in queries.captured_queries if q['sql'].startswith('UPDATE')]), 3)
+        self.assertEqual(sorted(row[0] for row in rows), sorted(expired))
+        self.assertEqual(Reservation.objects.filter(status='cancelled').count(), 20)
+        self.assertFalse(Reservation.objects.filter(pk__in=recent + paid, status='cancelled').exists())
+        self.slot.refresh_from_db()
+        self.item.refresh_from_db()
+        self.assertEqual(self.slot.capacity, slot_capacity + 20)
+        self.assertEqual(self.item.daily_capacity, item_capacity + 20)
+
+        # A second run finds nothing left to cancel
+        self.assertEqual(expire_pending(cutoff), [])
+
+    def test_from_statuses_restricts_edges(self):
+        ids = self.reserve(1, 'cancelled')
+
+        result = transition(ids, 'waiting', from_statuses=['pending_payment'])
+
+        self.assertEqual(result.updated, [])
+        self.assertEqual(result.skipped, {ids[0]: 'cancelled'})
+
+    def test_admin_action_applies_side_effects(self):
+        ids = self.reserve(2, 'ready_to_pickup')
+        admin_user = User.objects.create_user(phone_number='09123009999', password='x', role='admin')
+        request = RequestFactory().post('/')
+        request.user = admin_user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+
+        ReservationAdmin(Reservation, AdminSite()).mark_as_picked_up(request, Reservation.objects.filter(pk__in=ids))
+
+        self.assertEqual(Reservation.objects.filter(pk__in=ids, status='picked_up', trust_score_impact=10).count(), 2)
+        self.students[0].refresh_from_db()
+        self.assertEqual(self.students[0].trust_score, 20)
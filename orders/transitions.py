@@ -0,0 +1,295 @@
+"""
+Reservation status transitions.
+
+``TRANSITIONS`` declares which status changes are legal. ``transition``
+applies one status change to any number of reservations with a fixed number
+of queries: the rows are locked and read once, written with one UPDATE per
+distinct trust score impact, and the side effects are applied in aggregate:
+
+- seats held by cancelled reservations are released in one grouped update,
+  and taken again if a cancelled reservation is reactivated
+- trust score changes are summed per student and applied in one UPDATE
+- pickup notifications are written to the SMS outbox in the same transaction
+
+``advance`` is the set-based fast path for kitchen statuses (preparing,
+ready to pickup), which have no seat or trust score side effects: a single
+``UPDATE ... RETURNING`` moves every matching reservation. ``expire_pending``
+does the same for unpaid reservations, followed by one grouped seat release.
+
+Code that changes a reservation's status should go through ``transition``
+rather than ``queryset.update()``, which skips all of the above.
+"""
+from collections import Counter, defaultdict, namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db import connections, models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from core.logging_utils import get_logger
+from notifications.outbox import queue_many
+
+from . import pickup
+from .models import Reservation
+from .seats import allocate_seats, release_seats
+from .signals import ready_pickup_message
+
+User = get_user_model()
+logger = get_logger(__name__)
+
+# Legal status changes, keyed by the current status
+TRANSITIONS = {
+    'pending_payment': {'waiting', 'cancelled'},
+    'waiting': {'preparing', 'ready_to_pickup', 'cancelled'},
+    'preparing': {'ready_to_pickup'},
+    'ready_to_pickup': {'picked_up', 'not_picked_up'},
+    'picked_up': set(),
+    'not_picked_up': set(),
+    # A payment found to be successful after all reactivates its reservation
+    'cancelled': {'waiting'},
+}
+
+# Statuses advance() can move reservations to without loading them
+ADVANCE_STATUSES = ('preparing', 'ready_to_pickup')
+
+TransitionResult = namedtuple('TransitionResult', ['updated', 'unchanged', 'skipped'])
+TransitionResult.__doc__ = """
+Outcome of a bulk transition.
+
+``updated`` and ``unchanged`` hold the reservations (with student, food and
+time slot loaded) that were moved or were already in the target status;
+``skipped`` maps the ids of the others to the status that kept them from
+moving.
+"""
+
+
+def can_transition(old_status, new_status):
+    """Check whether a reservation may move from ``old_status`` to ``new_status``."""
+    return new_status in TRANSITIONS.get(old_status, ())
+
+
+def transition(reservations, new_status, from_statuses=None):
+    """
+    Move reservations to ``new_status`` and apply the side effects.
+
+    Reservations whose current status can't legally move to ``new_status``
+    (or isn't in ``from_statuses``) are skipped, not failed, so one stale row
+    doesn't block a whole batch.
+
+    Args:
+        reservations: Queryset of reservations or iterable of reservation ids
+        new_status: Status to move to
+        from_statuses: Optional statuses to restrict the change to, for
+            callers that only act on a subset of the legal edges
+
+    Returns:
+        TransitionResult: The moved, unchanged and skipped reservations
+
+    Raises:
+        ValueError: If ``new_status`` is not a reservation status
+    """
+    if new_status not in dict(Reservation.STATUS_CHOICES):
+        raise ValueError(f"Invalid reservation status: {new_status}")
+
+    if isinstance(reservations, models.QuerySet):
+        selection = reservations.values('pk')
+    else:
+        selection = list(reservations)
+
+    with transaction.atomic():
+        rows = list(
+            Reservation.objects.select_for_update(of=('self',))
+            .select_related('student', 'food', 'time_slot')
+            .filter(pk__in=selection)
+            .order_by('pk')
+        )
+
+        moving, unchanged, skipped = [], [], {}
+        for reservation in rows:
+            if reservation.status == new_status:
+                unchanged.append(reservation)
+            elif can_transition(reservation.status, new_status) and (
+                from_statuses is None or reservation.status in from_statuses
+            ):
+                moving.append(reservation)
+            else:
+                skipped[reservation.pk] = reservation.status
+
+        if moving:
+            _apply(moving, new_status)
+
+    if moving:
+        logger.info(f"Moved {len(moving)} reservations to {new_status}, skipped {len(skipped)}")
+    return TransitionResult(moving, unchanged, skipped)
+
+
+def _apply(reservations, new_status):
+    now = timezone.now()
+
+    impacts = {}
+    trust_deltas = Counter()
+    for reservation in reservations:
+        if not reservation.student_id or reservation.student.role != 'student':
+            continue
+        impact = Reservation.trust_impact(
+            new_status, reservation.price, reservation.has_voucher, reservation.has_extra_voucher
+        )
+        if impact is not None:
+            impacts[reservation.pk] = impact
+            trust_deltas[reservation.student_id] += impact
+
+    # One UPDATE per distinct trust score impact
+    by_impact = defaultdict(list)
+    for reservation in reservations:
+        by_impact[impacts.get(reservation.pk)].append(reservation.pk)
+    fields = {'status': new_status, 'status_changed_at': now}
+    if new_status == 'ready_to_pickup':
+        fields['updated_at'] = now
+    for impact, ids in by_impact.items():
+        extra = {'trust_score_impact': impact} if impact is not None else {}
+        Reservation.objects.filter(pk__in=ids).update(**fields, **extra)
+
+    if trust_deltas:
+        User.all_objects.filter(pk__in=trust_deltas.keys()).update(
+            trust_score=F('trust_score') + Case(
+                *[When(pk=pk, then=Value(delta)) for pk, delta in trust_deltas.items()],
+                default=Value(0),
+            ),
+            trust_score_updated_at=now,
+        )
+
+    if new_status == 'cancelled':
+        release_seats(Counter(r.time_slot_id for r in reservations if r.time_slot_id))
+    elif new_status == 'waiting':
+        # Reactivated reservations need their seats back
+        reactivated = Counter(r.time_slot_id for r in reservations if r.status == 'cancelled' and r.time_slot_id)
+        granted = allocate_seats(reactivated)
+        for slot_id, count in reactivated.items():
+            if granted[slot_id] < count:
+                logger.warning(
+                    f"Time slot {slot_id} had no capacity left for {count - granted[slot_id]} reactivated reservations"
+                )
+
+    # Keep the returned instances in step with the database
+    for reservation in reservations:
+        reservation.status = new_status
+        reservation.updated_at = fields.get('updated_at', reservation.updated_at)
+        reservation.status_changed_at = now
+        if reservation.pk in impacts:
+            reservation.trust_score_impact = impacts[reservation.pk]
+            reservation.student.trust_score += trust_deltas[reservation.student_id]
+            reservation.student.trust_score_updated_at = now
+        reservation._snapshot_tracked_fields()
+    pickup.refresh(r.pk for r in reservations)
+
+    if new_status == 'ready_to_pickup':
+        queue_many([
+            ready_pickup_message(r.pk, r.student.phone_number, r.student.first_name, r.delivery_code)
+            for r in reservations if r.student_id
+        ])
+
+
+def advance(reservations, new_status):
+    """
+    Move reservations to a kitchen status with a single set-based UPDATE.
+
+    Only reservations whose current status legally leads to ``new_status``
+    are changed; the status check is part of the UPDATE, so rows changed
+    concurrently are re-checked by the database rather than overwritten.
+
+    Args:
+        reservations: Queryset of reservations or iterable of reservation ids
+        new_status: One of ADVANCE_STATUSES
+
+    Returns:
+        list: Ids of the reservations that were moved
+
+    Raises:
+        ValueError: If ``new_status`` has side effects and needs transition()
+    """
+    if new_status not in ADVANCE_STATUSES:
+        raise ValueError(f"Use transition() to move reservations to {new_status}")
+
+    if not isinstance(reservations, models.QuerySet):
+        reservations = Reservation.objects.filter(pk__in=list(reservations))
+    sources = [old for old, targets in TRANSITIONS.items() if new_status in targets]
+
+    with transaction.atomic(using=reservations.db):
+        ids = [row[0] for row in _update_status(reservations, new_status, sources)]
+        if ids and new_status == 'ready_to_pickup':
+            notify_ready(ids)
+        pickup.refresh(ids)
+
+    logger.info(f"Advanced {len(ids)} reservations to {new_status}")
+    return ids
+
+
+def expire_pending(created_before):
+    """
+    Cancel reservations that are still awaiting payment.
+
+    The expired rows are claimed with ``FOR UPDATE SKIP LOCKED`` and cancelled
+    by a single ``UPDATE ... RETURNING``, and their seats are given back with
+    one grouped update per table. Rows another transaction holds (a payment
+    callback, or an overlapping run of this job) are left for the next run.
+
+    Args:
+        created_before: Reservations created before this time are cancelled
+
+    Returns:
+        list: (id, student_id, time_slot_id) of each cancelled reservation
+    """
+    with transaction.atomic():
+        expired = Reservation.objects.select_for_update(skip_locked=True).filter(
+            status='pending_payment', created_at__lt=created_before
+        )
+        rows = _update_status(expired, 'cancelled', ['pending_payment'], returning=('id', 'student_id', 'time_slot_id'))
+        release_seats(Counter(slot_id for _, _, slot_id in rows if slot_id))
+        pickup.refresh(reservation_id for reservation_id, _, _ in rows)
+
+    logger.info(f"Cancelled {len(rows)} reservations with expired payments")
+    return rows
+
+
+def _update_status(reservations, new_status, sources, returning=('id',)):
+    """
+    Set the status of the reservations in ``sources`` statuses with one ``UPDATE ... RETURNING``.
+
+    The status check is part of the UPDATE, so rows changed concurrently are
+    re-checked by the database rather than overwritten. Must be called in a
+    transaction.
+
+    Returns:
+        list: One tuple of the ``returning`` columns per updated row
+    """
+    connection = connections[reservations.db]
+    quote = connection.ops.quote_name
+    table = quote(Reservation._meta.db_table)
+    pk = quote(Reservation._meta.pk.column)
+    selection, params = reservations.values('pk').query.sql_with_params()
+    now = timezone.now()
+    assignments, values = 'status = %s, status_changed_at = %s', [new_status, now]
+    if new_status == 'ready_to_pickup':
+        assignments += ', updated_at = %s'
+        values.append(now)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {assignments} "
+            f"WHERE {pk} IN ({selection}) AND status = ANY(%s) "
+            f"RETURNING {', '.join(quote(column) for column in returning)}",
+            [*values, *params, list(sources)],
+        )
+        return cursor.fetchall()
+
+
+def notify_ready(reservation_ids):
+    """Queue pickup notifications for reservations in the SMS outbox, in the current transaction."""
+    if not reservation_ids:
+        return
+    queue_many([
+        ready_pickup_message(*row)
+        for row in Reservation.objects.filter(pk__in=list(reservation_ids), student__isnull=False).values_list(
+            'id', 'student__phone_number', 'student__first_name', 'delivery_code'
+        )
+    ])
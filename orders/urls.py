@@ -2,11 +2,16 @@ from django.urls import path
 from .views import (
     ReceiverOrdersView,
     UpdateOrderStatusView,
+    BatchAdvanceOrdersView,
     PlaceOrderView,
+    BulkPlaceOrderView,
     PendingOrdersView,
     DeliverOrderView,
     StudentOrdersView,
     RetrieveReservationByDeliveryCodeView,
+    PickupStationSyncView,
+    KitchenSheetView,
+    KitchenTrayListView,
     PickedUpOrdersView,
     ReadyToPickupOrdersView,
     NotPickedUpOrdersView,
@@ -16,11 +21,16 @@ from .views import (
 urlpatterns = [
     path('receiver/', ReceiverOrdersView.as_view(), name='receiver_orders'),
     path('<int:id>/status/', UpdateOrderStatusView.as_view(), name='update_order_status'),
+    path('status/batch/', BatchAdvanceOrdersView.as_view(), name='batch_advance_orders'),
     path('place/', PlaceOrderView.as_view(), name='place_order'),
+    path('place/bulk/', BulkPlaceOrderView.as_view(), name='bulk_place_order'),
     path('pending/', PendingOrdersView.as_view(), name='pending_orders'),
     path('<int:id>/deliver/', DeliverOrderView.as_view(), name='deliver_order'),
     path('student/', StudentOrdersView.as_view(), name='student_orders'),
     path('delivery-code/', RetrieveReservationByDeliveryCodeView.as_view(), name='retrieve_by_delivery_code'),
+    path('pickup/sync/', PickupStationSyncView.as_view(), name='pickup_station_sync'),
+    path('kitchen/sheet/', KitchenSheetView.as_view(), name='kitchen_sheet'),
+    path('kitchen/sheet/trays/', KitchenTrayListView.as_view(), name='kitchen_tray_list'),
     path('picked-up/', PickedUpOrdersView.as_view(), name='picked_up_orders'),
     path('ready-to-pickup/', ReadyToPickupOrdersView.as_view(), name='ready_to_pickup_orders'),
     path('<int:id>/not-picked-up/', NotPickedUpOrdersView.as_view(), name='not_picked_up_orders'),
@@ -4,16 +4,32 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from .models import Reservation, TimeSlot
 from .serializers import ReservationSerializer, CreateReservationSerializer
+from . import kitchen, pickup, stations
+from .listing import keyset_page
+from .placement import place_reservations
+from .transitions import ADVANCE_STATUSES, advance, transition
 from university_food_system.permissions import (
     IsStudentOrAdmin,
     IsChefOrReceiverOrAdmin,
     IsReceiverOrAdmin,
     HasValidTrustScoreForVoucher,
 )
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.db.models import Q
 from django.db import transaction
 import pytz
 from datetime import datetime
+from django.utils.dateparse import parse_datetime
+
+
+def _paged_orders(request, orders, descending=False):
+    """Respond with one keyset page of orders; see orders.listing."""
+    try:
+        return Response(keyset_page(request, orders, descending=descending), status=status.HTTP_200_OK)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
 
 class ReceiverOrdersView(APIView):
     permission_classes = [IsAuthenticated, IsReceiverOrAdmin]
@@ -27,8 +43,7 @@ class ReceiverOrdersView(APIView):
             return Response({"error": "Both date and meal_type are required."}, status=status.HTTP_400_BAD_REQUEST)
         
         orders = Reservation.objects.filter(Q(reserved_date=reserved_date) & Q(meal_type=meal_type))
-        serializer = ReservationSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return _paged_orders(request, orders)
 
 
 class UpdateOrderStatusView(APIView):
@@ -36,21 +51,75 @@ class UpdateOrderStatusView(APIView):
 
     def patch(self, request, id):
         """Update the status of an order."""
-        try:
-            order = Reservation.objects.get(id=id)
-        except Reservation.DoesNotExist:
-            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
-
         status_update = request.data.get('status')
         if status_update not in dict(Reservation.STATUS_CHOICES):
             return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
 
-        order.status = status_update
-        order.save()
-        serializer = ReservationSerializer(order)
+        result = transition([id], status_update)
+        if id in result.skipped:
+            return Response(
+                {"error": f"Cannot change order status from {result.skipped[id]} to {status_update}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        orders = result.updated + result.unchanged
+        if not orders:
+            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = ReservationSerializer(orders[0])
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class BatchAdvanceOrdersView(APIView):
+    permission_classes = [IsAuthenticated, IsReceiverOrAdmin]
+
+    def post(self, request):
+        """
+        Move a batch of orders to preparing or ready_to_pickup in one statement.
+
+        Orders are picked either by an explicit ``ids`` list or by
+        ``reserved_date`` and ``meal_type`` (optionally narrowed to one
+        ``time_slot``). Orders whose status doesn't lead to the requested one
+        are left alone. Pickup notifications are sent in the background.
+        """
+        status_update = request.data.get('status')
+        if status_update not in ADVANCE_STATUSES:
+            return Response(
+                {"error": f"status must be one of: {', '.join(ADVANCE_STATUSES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+                return Response({"error": "ids must be a list of order ids."}, status=status.HTTP_400_BAD_REQUEST)
+            orders = Reservation.objects.filter(id__in=ids)
+        else:
+            reserved_date = request.data.get('reserved_date')
+            meal_type = request.data.get('meal_type')
+            if not reserved_date or not meal_type:
+                return Response(
+                    {"error": "Either ids or both reserved_date and meal_type are required."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                reserved_date = datetime.strptime(reserved_date, '%Y-%m-%d').date()
+            except ValueError:
+                return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+            orders = Reservation.objects.filter(reserved_date=reserved_date, meal_type=meal_type)
+            time_slot = request.data.get('time_slot')
+            if time_slot is not None:
+                try:
+                    if isinstance(time_slot, bool):
+                        raise ValueError
+                    time_slot = int(time_slot)
+                except (TypeError, ValueError):
+                    return Response({"error": "time_slot must be a time slot id."}, status=status.HTTP_400_BAD_REQUEST)
+                orders = orders.filter(time_slot_id=time_slot)
+
+        updated = advance(orders, status_update)
+        return Response({"status": status_update, "updated": len(updated), "ids": updated}, status=status.HTTP_200_OK)
+
+
 class PlaceOrderView(APIView):
     permission_classes = [IsAuthenticated, IsStudentOrAdmin, HasValidTrustScoreForVoucher]
 
@@ -87,13 +156,15 @@ class PlaceOrderView(APIView):
                 
                 # After successful reservation, cancel any other pending payments for the same user, date, and meal type
                 if reservation.status == 'waiting':  # Only if the reservation was successful
-                    Reservation.objects.filter(
-                        student=request.user,
-                        reserved_date=reservation.reserved_date,
-                        meal_type=reservation.meal_type,
-                        status='pending_payment',
-                        id__ne=reservation.id  # Exclude the current reservation
-                    ).update(status='cancelled')
+                    transition(
+                        Reservation.objects.filter(
+                            student=request.user,
+                            reserved_date=reservation.reserved_date,
+                            meal_type=reservation.meal_type,
+                            status='pending_payment',
+                        ).exclude(id=reservation.id),  # Exclude the current reservation
+                        'cancelled',
+                    )
                 
                 # Get the full reservation data for response
                 response_data = ReservationSerializer(reservation).data
@@ -113,14 +184,60 @@ class PlaceOrderView(APIView):
             )
 
 
+class BulkPlaceOrderView(APIView):
+    permission_classes = [IsAuthenticated, IsStudentOrAdmin]
+
+    def post(self, request):
+        """
+        Place several orders at once, e.g. a whole week of meals.
+
+        Expects ``{"reservations": [...]}`` where each entry has the same
+        fields as a single order. Every entry gets its own result, so a full
+        slot only fails that entry.
+        """
+        entries = request.data.get('reservations')
+        if not isinstance(entries, list) or not entries:
+            return Response({"error": "reservations must be a non-empty list."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(entries) > settings.BULK_RESERVATION_LIMIT:
+            return Response(
+                {"error": f"A maximum of {settings.BULK_RESERVATION_LIMIT} reservations can be placed at once."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = place_reservations(request.user, entries)
+
+        created = 0
+        for result in results:
+            reservation = result.pop('reservation', None)
+            result['success'] = reservation is not None
+            if reservation is not None:
+                created += 1
+                result['reservation'] = ReservationSerializer(reservation).data
+
+        return Response(
+            {
+                "created": created,
+                "failed": len(results) - created,
+                "trust_score": request.user.trust_score,
+                "results": results,
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+        )
+
+
 class PendingOrdersView(APIView):
     permission_classes = [IsAuthenticated, IsReceiverOrAdmin]
 
     def get(self, request):
-        """Retrieve all pending orders."""
+        """Retrieve pending orders, optionally only those of one date and meal type."""
         orders = Reservation.objects.filter(status='waiting')
-        serializer = ReservationSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        reserved_date = request.query_params.get('reserved_date')
+        meal_type = request.query_params.get('meal_type')
+        if reserved_date:
+            orders = orders.filter(reserved_date=reserved_date)
+        if meal_type:
+            orders = orders.filter(meal_type=meal_type)
+        return _paged_orders(request, orders)
 
 
 class DeliverOrderView(APIView):
@@ -128,17 +245,13 @@ class DeliverOrderView(APIView):
 
     def patch(self, request, id):
         """Mark an order as delivered."""
-        try:
-            order = Reservation.objects.get(id=id)
-        except Reservation.DoesNotExist:
-            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        if order.status != 'ready_to_pickup':
+        result = transition([id], 'picked_up', from_statuses=['ready_to_pickup'])
+        if result.unchanged or id in result.skipped:
             return Response({"error": "Order is not ready for delivery"}, status=status.HTTP_400_BAD_REQUEST)
+        if not result.updated:
+            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        order.status = 'picked_up'
-        order.save()
-        serializer = ReservationSerializer(order)
+        serializer = ReservationSerializer(result.updated[0])
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -148,8 +261,7 @@ class StudentOrdersView(APIView):
     def get(self, request):
         """Retrieve all orders for the current student."""
         orders = Reservation.objects.filter(student=request.user)
-        serializer = ReservationSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return _paged_orders(request, orders, descending=True)
 
 class RetrieveReservationByDeliveryCodeView(APIView):
     permission_classes = [IsAuthenticated, IsReceiverOrAdmin]
@@ -190,18 +302,115 @@ class RetrieveReservationByDeliveryCodeView(APIView):
             return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
             
         
+        # Served from the pickup session cache; see orders.pickup
+        data = pickup.lookup(parsed_date, meal_type, delivery_code)
+        if data is None:
+            return Response({"error": "Invalid or unknown delivery code"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(data, status=status.HTTP_200_OK)
+
+def _meal_params(request):
+    """Read and validate the ``date`` and ``meal_type`` query parameters."""
+    date = request.query_params.get('date')
+    meal_type = request.query_params.get('meal_type')
+    if not date or not meal_type:
+        raise ValueError("Both date and meal_type are required.")
+    if meal_type not in ['lunch', 'dinner']:
+        raise ValueError("meal_type must be either 'lunch' or 'dinner'")
+    try:
+        return datetime.strptime(date, '%Y-%m-%d').date(), meal_type
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+
+
+class KitchenSheetView(APIView):
+    permission_classes = [IsAuthenticated, IsChefOrReceiverOrAdmin]
+
+    def get(self, request):
+        """Retrieve the portions of each food per time slot for a meal."""
+        try:
+            reserved_date, meal_type = _meal_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(kitchen.meal_counts(reserved_date, meal_type), status=status.HTTP_200_OK)
+
+
+class KitchenTrayListView(APIView):
+    permission_classes = [IsAuthenticated, IsChefOrReceiverOrAdmin]
+
+    def get(self, request):
+        """Stream the tray list of a meal as CSV."""
+        try:
+            reserved_date, meal_type = _meal_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(kitchen.tray_csv(reserved_date, meal_type), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="trays-{reserved_date}-{meal_type}.csv"'
+        return response
+
+
+class PickupStationSyncView(APIView):
+    permission_classes = [IsAuthenticated, IsReceiverOrAdmin]
+
+    def get(self, request):
+        """
+        Download a meal's reservations for an offline pickup station.
+
+        ``date`` and ``meal_type`` are required. With ``since`` (the
+        ``as_of`` of the previous download) only the changes are returned;
+        see orders.stations.
+        """
         try:
-            # Build query with all required filters
-            reservation = Reservation.objects.get(
-                delivery_code=delivery_code,
-                meal_type=meal_type,
-                reserved_date=parsed_date
+            parsed_date, meal_type = _meal_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        since = request.query_params.get('since')
+        if since:
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is None or since.tzinfo is None:
+                return Response(
+                    {"error": "since must be the as_of of a previous download."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        return Response(stations.snapshot(parsed_date, meal_type, since=since or None), status=status.HTTP_200_OK)
+
+    def post(self, request):
+        """
+        Upload the deliveries a pickup station recorded offline.
+
+        Expects ``station_id``, ``batch_id`` and ``deliveries``, the ids of
+        the handed-out orders. Uploading the same batch again returns the
+        results of the first upload without applying it twice.
+        """
+        station_id = request.data.get('station_id')
+        batch_id = request.data.get('batch_id')
+        deliveries = request.data.get('deliveries')
+        for name, value in (('station_id', station_id), ('batch_id', batch_id)):
+            if not isinstance(value, str) or not 0 < len(value) <= 64:
+                return Response(
+                    {"error": f"{name} must be a string of at most 64 characters."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        if not isinstance(deliveries, list) or not all(
+            isinstance(pk, int) and not isinstance(pk, bool) for pk in deliveries
+        ):
+            return Response({"error": "deliveries must be a list of order ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(deliveries) > settings.PICKUP_SYNC_MAX_BATCH:
+            return Response(
+                {"error": f"A batch can hold at most {settings.PICKUP_SYNC_MAX_BATCH} deliveries."},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            data = ReservationSerializer(reservation).data        
-            return Response(data, status=status.HTTP_200_OK)
-            
-        except Reservation.DoesNotExist:
-            return Response({"error": "Invalid or unknown delivery code"}, status=status.HTTP_404_NOT_FOUND)
+
+        results, replayed = stations.apply_batch(station_id, batch_id, deliveries, user=request.user)
+        return Response(
+            {"station_id": station_id, "batch_id": batch_id, "replayed": replayed, "results": results},
+            status=status.HTTP_200_OK
+        )
+
 
 class PickedUpOrdersView(APIView):
     permission_classes = [IsAuthenticated, IsReceiverOrAdmin]
@@ -220,8 +429,7 @@ class PickedUpOrdersView(APIView):
         orders = Reservation.objects.filter(
             Q(status='picked_up') & Q(reserved_date=reserved_date) & Q(meal_type=meal_type)
         )
-        serializer = ReservationSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return _paged_orders(request, orders)
 
 
 class ReadyToPickupOrdersView(APIView):
@@ -241,9 +449,7 @@ class ReadyToPickupOrdersView(APIView):
         orders = Reservation.objects.filter(
             Q(status='ready_to_pickup') & Q(reserved_date=reserved_date) & Q(meal_type=meal_type)
         )
-        print(orders)
-        serializer = ReservationSerializer(orders, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return _paged_orders(request, orders)
 
 
 class NotPickedUpOrdersView(APIView):
@@ -251,17 +457,13 @@ class NotPickedUpOrdersView(APIView):
 
     def patch(self, request, id):
         """Mark an order as not picked up."""
-        try:
-            order = Reservation.objects.get(id=id)
-        except Reservation.DoesNotExist:
-            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        if order.status != 'ready_to_pickup':
+        result = transition([id], 'not_picked_up', from_statuses=['ready_to_pickup'])
+        if result.unchanged or id in result.skipped:
             return Response({"error": "Order is not ready for pickup"}, status=status.HTTP_400_BAD_REQUEST)
+        if not result.updated:
+            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        order.status = 'not_picked_up'
-        order.save()
-        serializer = ReservationSerializer(order)
+        serializer = ReservationSerializer(result.updated[0])
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -275,12 +477,12 @@ class CancelReservationView(APIView):
         except Reservation.DoesNotExist:
             return Response({"error": "Reservation not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        if reservation.student != request.user:
+        if reservation.student_id != request.user.id:
             return Response({"error": "You can only cancel your own reservation."}, status=status.HTTP_403_FORBIDDEN)
 
         if reservation.status != 'pending_payment':
             return Response({"error": "Reservation can only be cancelled if status is pending_payment."}, status=status.HTTP_400_BAD_REQUEST)
 
-        reservation.status = 'cancelled'
-        reservation.save(update_fields=["status"])
+        if not transition([reservation.id], 'cancelled', from_statuses=['pending_payment']).updated:
+            return Response({"error": "Reservation can only be cancelled if status is pending_payment."}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"success": "Reservation cancelled."}, status=status.HTTP_200_OK)
\ No newline at end of file
@@ -1,7 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
-from .models import Payment
+from .models import Payment, PaymentEvent
 from orders.models import Reservation
 
 @admin.register(Payment)
@@ -51,14 +52,39 @@ class PaymentAdmin(admin.ModelAdmin):
 
     @admin.action(description='Mark selected payments as paid')
     def mark_as_paid(self, request, queryset):
-        updated = queryset.update(status='paid')
+        updated = self._set_status(queryset, Payment.STATUS_PAID)
         self.message_user(request, f'Successfully marked {updated} payments as paid.')
 
     @admin.action(description='Mark selected payments as failed')
     def mark_as_failed(self, request, queryset):
-        updated = queryset.update(status='failed')
+        updated = self._set_status(queryset, Payment.STATUS_FAILED)
         self.message_user(request, f'Successfully marked {updated} payments as failed.')
 
+    @transaction.atomic
+    def _set_status(self, queryset, new_status):
+        """Update the payments' status in one statement and log the changes."""
+        # Locked, so a payment settled meanwhile can't be logged with a stale from_status
+        changed = dict(
+            queryset.select_for_update(of=('self',)).exclude(status=new_status).values_list('id', 'status')
+        )
+        Payment.objects.filter(pk__in=changed).update(status=new_status)
+        PaymentEvent.log([
+            PaymentEvent(payment_id=pk, from_status=old_status, to_status=new_status)
+            for pk, old_status in changed.items()
+        ])
+        return len(changed)
+
     def get_queryset(self, request):
         """Optimize the queryset to avoid multiple database queries."""
-        return super().get_queryset(request).select_related('user', 'reservation')
\ No newline at end of file
+        return super().get_queryset(request).select_related('user', 'reservation')
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'payment', 'from_status', 'to_status', 'created_at')
+    list_filter = ('to_status', 'created_at')
+    search_fields = ('payment__id', 'payment__authority')
+    list_select_related = ('payment',)
+    date_hierarchy = 'created_at'
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -10,3 +10,4 @@ class PaymentsConfig(AppConfig):
         # Initialize logger when the app is ready
         self.logger = get_logger(self.name)
         self.logger.info(f"{self.verbose_name} app initialized")
+        import payments.signals  # Register signals
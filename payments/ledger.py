@@ -0,0 +1,177 @@
+"""
+Revenue ledger: daily payment totals per meal type and food.
+
+Finance reports read ``RevenueRollup`` rows, one per day, meal type and
+food, instead of scanning and summing payments, so a report costs O(days)
+however many payments there were.
+
+The rollups are kept current incrementally: every payment status change is
+logged as a PaymentEvent, and ``apply_events`` moves the payment's amount
+from the totals of its old status to those of its new one. All events of a
+write are applied with a single ``INSERT ... ON CONFLICT DO UPDATE`` that
+reads amounts, days and reservations in the same statement, so concurrent
+writers add to the totals without reading them first.
+
+``rebuild`` recomputes the rollups of a date range from the payments
+themselves, e.g. after payments were changed by hand; see the
+``rebuild_revenue_ledger`` command.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+from core.logging_utils import get_logger
+from menu.schedule import IRAN_TZ
+
+from .models import Payment, RevenueRollup
+
+logger = get_logger(__name__)
+
+# Statuses with their own totals; pending payments aren't counted anywhere
+LEDGER_STATUSES = (Payment.STATUS_PAID, Payment.STATUS_FAILED, Payment.STATUS_REVERSED)
+TOTAL_FIELDS = [f"{status}_{measure}" for status in LEDGER_STATUSES for measure in ('amount', 'count')]
+
+
+def apply_events(events):
+    """
+    Apply payment status events to the rollups.
+
+    Args:
+        events: PaymentEvents, saved or not, of payments that are saved
+    """
+    signs = defaultdict(lambda: dict.fromkeys(LEDGER_STATUSES, 0))
+    for event in events:
+        if event.from_status in LEDGER_STATUSES:
+            signs[event.payment_id][event.from_status] -= 1
+        if event.to_status in LEDGER_STATUSES:
+            signs[event.payment_id][event.to_status] += 1
+    signs = {pk: by_status for pk, by_status in signs.items() if any(by_status.values())}
+    if not signs:
+        return
+
+    rows = ', '.join(['(%s, %s, %s, %s)'] * len(signs))
+    params = [value for pk, by_status in signs.items() for value in (pk, *by_status.values())]
+    totals = ', '.join(
+        f"SUM(d.{status} * p.amount), SUM(d.{status})" for status in LEDGER_STATUSES
+    )
+    updates = ', '.join(f"{field} = r.{field} + EXCLUDED.{field}" for field in TOTAL_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {RevenueRollup._meta.db_table} AS r (day, meal_type, food_id, {', '.join(TOTAL_FIELDS)})
+            SELECT (p.created_at AT TIME ZONE %s)::date, COALESCE(res.meal_type, ''), res.food_id, {totals}
+            FROM (VALUES {rows}) AS d (payment_id, {', '.join(LEDGER_STATUSES)})
+            JOIN {Payment._meta.db_table} p ON p.id = d.payment_id
+            LEFT JOIN orders_reservation res ON res.id = p.reservation_id
+            GROUP BY 1, 2, 3
+            ON CONFLICT (day, meal_type, food_id) DO UPDATE SET {updates}
+            """,
+            [IRAN_TZ.zone, *params],
+        )
+
+
+def merge_food(food_id):
+    """
+    Move a food's rollups into the no-food bucket of their day and meal type.
+
+    Called before the food is deleted: its reservations lose their food, so
+    later events of their payments land in that bucket too, and the unique
+    ``(day, meal_type, food)`` key can't collide when several foods of one
+    meal are deleted.
+    """
+    totals = ', '.join(TOTAL_FIELDS)
+    updates = ', '.join(f"{field} = r.{field} + EXCLUDED.{field}" for field in TOTAL_FIELDS)
+    table = RevenueRollup._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS r (day, meal_type, food_id, {totals})
+            SELECT day, meal_type, NULL, {totals} FROM {table} WHERE food_id = %s
+            ON CONFLICT (day, meal_type, food_id) DO UPDATE SET {updates}
+            """,
+            [food_id],
+        )
+        cursor.execute(f"DELETE FROM {table} WHERE food_id = %s", [food_id])
+
+
+def _day_start(day):
+    return IRAN_TZ.localize(datetime.combine(day, time.min))
+
+
+@transaction.atomic
+def rebuild(start_date, end_date):
+    """
+    Recompute the rollups of a date range from the payments.
+
+    The rollup table is locked against concurrent increments meanwhile;
+    changes committed while the rebuild waits are part of what it reads,
+    and changes still in flight are applied on top once it's done.
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {RevenueRollup._meta.db_table} IN EXCLUSIVE MODE")
+    RevenueRollup.objects.filter(day__gte=start_date, day__lte=end_date).delete()
+
+    aggregates = {}
+    for status in LEDGER_STATUSES:
+        aggregates[f"{status}_amount"] = Coalesce(Sum('amount', filter=Q(status=status)), 0)
+        aggregates[f"{status}_count"] = Count('id', filter=Q(status=status))
+    rows = (
+        Payment.objects.filter(
+            status__in=LEDGER_STATUSES,
+            created_at__gte=_day_start(start_date),
+            created_at__lt=_day_start(end_date + timedelta(days=1)),
+        )
+        .annotate(
+            rollup_day=TruncDate('created_at', tzinfo=IRAN_TZ),
+            rollup_meal_type=Coalesce('reservation__meal_type', Value('')),
+        )
+        .values('rollup_day', 'rollup_meal_type', 'reservation__food')
+        .annotate(**aggregates)
+        .order_by()
+    )
+    rollups = RevenueRollup.objects.bulk_create([
+        RevenueRollup(
+            day=row['rollup_day'],
+            meal_type=row['rollup_meal_type'],
+            food_id=row['reservation__food'],
+            **{field: row[field] for field in TOTAL_FIELDS},
+        )
+        for row in rows
+    ])
+    logger.info(f"Rebuilt {len(rollups)} revenue rollups from {start_date} to {end_date}")
+    return len(rollups)
+
+
+def report(start_date, end_date, meal_type=None, food=None):
+    """
+    Sum the rollups of a date range.
+
+    Returns:
+        dict: ``totals``, and the same totals ``by_day``, ``by_meal_type``
+        and ``by_food``
+    """
+    rollups = RevenueRollup.objects.filter(day__gte=start_date, day__lte=end_date)
+    if meal_type:
+        rollups = rollups.filter(meal_type=meal_type)
+    if food:
+        rollups = rollups.filter(food_id=food)
+
+    sums = {field: Coalesce(Sum(field), 0) for field in TOTAL_FIELDS}
+
+    def grouped(*fields):
+        return list(rollups.values(*fields).annotate(**sums).order_by(*fields))
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'totals': rollups.aggregate(**sums),
+        'by_day': grouped('day'),
+        'by_meal_type': grouped('meal_type'),
+        'by_food': grouped('food', 'food__name'),
+    }
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.ledger import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily revenue rollups of a date range from the payments. "
+        "Use after payments were changed outside the application."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('start_date', help="First date (YYYY-MM-DD)")
+        parser.add_argument('end_date', help="Last date, inclusive (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        try:
+            start_date = datetime.strptime(options['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError("Invalid date format. Use YYYY-MM-DD")
+        if end_date < start_date:
+            raise CommandError("end_date must not be before start_date")
+
+        written = rebuild(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {written} revenue rollups from {start_date} to {end_date}."
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_payment_failure_details_alter_payment_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='callback_status',
+            field=models.CharField(blank=True, help_text='Status reported by the gateway callback (OK or NOK)', max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='verify_requested_at',
+            field=models.DateTimeField(blank=True, help_text='When verification of the callback was last queued', null=True),
+        ),
+    ]
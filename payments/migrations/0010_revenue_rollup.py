@@ -0,0 +1,55 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0003_food_supports_extra_voucher'),
+        ('payments', '0009_payment_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('meal_type', models.CharField(blank=True, default='', max_length=10)),
+                ('paid_amount', models.BigIntegerField(default=0)),
+                ('paid_count', models.IntegerField(default=0)),
+                ('failed_amount', models.BigIntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('reversed_amount', models.BigIntegerField(default=0)),
+                ('reversed_count', models.IntegerField(default=0)),
+                ('food', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='food.food')),
+            ],
+            options={
+                'ordering': ['day', 'meal_type', 'food'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'meal_type', 'food'), name='unique_revenue_rollup', nulls_distinct=False)],
+            },
+        ),
+        # Fill the ledger from the existing payments; later changes are applied as they happen
+        migrations.RunSQL(
+            """
+            INSERT INTO payments_revenuerollup (
+                day, meal_type, food_id, paid_amount, paid_count,
+                failed_amount, failed_count, reversed_amount, reversed_count
+            )
+            SELECT (p.created_at AT TIME ZONE 'Asia/Tehran')::date, COALESCE(r.meal_type, ''), r.food_id,
+                   COALESCE(SUM(p.amount) FILTER (WHERE p.status = 'paid'), 0),
+                   COUNT(*) FILTER (WHERE p.status = 'paid'),
+                   COALESCE(SUM(p.amount) FILTER (WHERE p.status = 'failed'), 0),
+                   COUNT(*) FILTER (WHERE p.status = 'failed'),
+                   COALESCE(SUM(p.amount) FILTER (WHERE p.status = 'reversed'), 0),
+                   COUNT(*) FILTER (WHERE p.status = 'reversed')
+            FROM payments_payment p
+            LEFT JOIN orders_reservation r ON r.id = p.reservation_id
+            WHERE p.status IN ('paid', 'failed', 'reversed')
+            GROUP BY 1, 2, 3
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
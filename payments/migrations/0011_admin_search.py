@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-17 03:53
+
+import django.contrib.postgres.indexes
+import django.db.models.fields.json
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+TRIGRAM_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['search_text'], name='payment_search_trgm_idx', opclasses=['gin_trgm_ops']
+)
+
+
+def add_trigram_index(apps, schema_editor):
+    # pg_trgm ships with postgres' contrib modules; without them search
+    # still works, only without the substring index
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.add_index(apps.get_model('payments', 'Payment'), TRIGRAM_INDEX)
+
+
+def remove_trigram_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX.name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_pickup_sync'),
+        ('payments', '0010_revenue_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='search_text',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Upper(django.db.models.functions.text.Concat('authority', models.Value(' '), 'ref_id', models.Value(' '), django.db.models.fields.json.KeyTextTransform('error_message', 'failure_details'), models.Value(' '), django.db.models.fields.json.KeyTextTransform('error_code', 'failure_details'), output_field=models.TextField())), output_field=models.TextField()),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created_at', 'id'], name='payment_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['authority'], name='payment_authority_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['ref_id'], name='payment_ref_id_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='payment', index=TRIGRAM_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_trigram_index, remove_trigram_index),
+            ],
+        ),
+    ]
@@ -1,12 +1,17 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.db.models import Value
+from django.db.models.fields.json import KT
+from django.db.models.functions import Concat, Upper
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from datetime import datetime as _dt, timezone as _pytz
 from orders.models import Reservation
+from core.tracking import FieldTrackerMixin
 from core.logging_utils import get_logger
 from django.db import transaction
 from django.core.serializers.json import DjangoJSONEncoder
 import json
+from contextlib import nullcontext
 
 User = get_user_model()
 logger = get_logger(__name__)
@@ -34,7 +39,7 @@ class PaymentManager(models.Manager):
     def failed(self):
         return self.get_queryset().failed()
 
-class Payment(models.Model):
+class Payment(FieldTrackerMixin, models.Model):
     STATUS_PENDING = 'pending'
     STATUS_PAID = 'paid'
     STATUS_FAILED = 'failed'
@@ -90,17 +95,48 @@ class Payment(models.Model):
         encoder=DjangoJSONEncoder,
         help_text="Stores error details if payment failed"
     )
+    callback_status = models.CharField(
+        max_length=10,
+        blank=True,
+        null=True,
+        help_text="Status reported by the gateway callback (OK or NOK)"
+    )
+    verify_requested_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When verification of the callback was last queued"
+    )
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Upper-cased authority, ref_id and failure reason, for the admin search (payments.search)
+    search_text = models.GeneratedField(
+        expression=Upper(Concat(
+            'authority', Value(' '), 'ref_id', Value(' '),
+            KT('failure_details__error_message'), Value(' '), KT('failure_details__error_code'),
+            output_field=models.TextField(),
+        )),
+        output_field=models.TextField(),
+        db_persist=True,
+    )
     
     objects = PaymentManager()
 
+    # Status changes are recorded as PaymentEvents without re-reading the row
+    tracked_fields = ('status',)
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['authority', 'status']),
             models.Index(fields=['ref_id']),
             models.Index(fields=['status', 'created_at']),
+            # Keyset pages of the admin list
+            models.Index(fields=['created_at', 'id'], name='payment_created_id_idx'),
+            # Prefix lookups and substring search of the admin list
+            models.Index(fields=['authority'], name='payment_authority_prefix_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['ref_id'], name='payment_ref_id_prefix_idx', opclasses=['varchar_pattern_ops']),
+            # Created only where pg_trgm is available; see migration 0011
+            GinIndex(fields=['search_text'], name='payment_search_trgm_idx', opclasses=['gin_trgm_ops']),
         ]
 
     def __str__(self):
@@ -108,28 +144,18 @@ class Payment(models.Model):
         return f"Payment {self.id} - {user_info} - {self.status}"
 
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        old_status = None
-        
-        if not is_new:
-            old_status = Payment.objects.get(pk=self.pk).status
-        # Guard against mocked or expression timestamps leaking into inserts/updates during tests
-        try:
-            if hasattr(self.created_at, 'resolve_expression') or not isinstance(self.created_at, _dt):
-                self.created_at = _dt.now(_pytz.utc)
-        except Exception:
-            self.created_at = _dt.now(_pytz.utc)
-        try:
-            if hasattr(self.updated_at, 'resolve_expression') or not isinstance(self.updated_at, _dt):
-                self.updated_at = _dt.now(_pytz.utc)
-        except Exception:
-            self.updated_at = _dt.now(_pytz.utc)
-        
-        super().save(*args, **kwargs)
-        
+        is_new = self._state.adding
+        old_status = self.original_value('status')
+        status_changed = self.has_changed('status')
+
+        # The write, its event and the ledger update succeed or fail together
+        with transaction.atomic(using=kwargs.get('using')) if status_changed else nullcontext():
+            super().save(*args, **kwargs)
+            if status_changed:
+                PaymentEvent.log([PaymentEvent(payment=self, from_status=old_status, to_status=self.status)])
         if is_new:
             logger.info(f"New payment created: {self.id} for user {getattr(self.user, 'id', 'unknown')}")
-        elif old_status != self.status:
+        elif status_changed:
             logger.info(f"Payment {self.id} status changed from {old_status} to {self.status}")
     
     @transaction.atomic
@@ -142,9 +168,7 @@ class Payment(models.Model):
         self.status = self.STATUS_PAID
         self.save()
         
-        if self.reservation and self.reservation.status == 'pending_payment':
-            self.reservation.status = 'waiting'
-            self.reservation.save()
+        self.transition_reservation('waiting', from_statuses=['pending_payment'])
         
         return True
     
@@ -165,9 +189,7 @@ class Payment(models.Model):
         self.save()
         
         # Only cancel the reservation if it's still in pending state
-        if self.reservation and self.reservation.status == 'pending_payment':
-            self.reservation.status = 'cancelled'
-            self.reservation.save()
+        self.transition_reservation('cancelled', from_statuses=['pending_payment'])
         
         logger.warning(
             f"Payment {self.id} marked as failed. "
@@ -191,9 +213,107 @@ class Payment(models.Model):
         self.save(update_fields=['status', 'failure_details', 'updated_at'])
         logger.info(f"Payment {self.id} marked as reversed")
         
-        if self.reservation and self.reservation.status == 'cancelled':
-            self.reservation.status = 'waiting'
-            self.reservation.save()
-            logger.info(f"Reactivated reservation {self.reservation.id} after payment reversal")
+        if self.transition_reservation('waiting', from_statuses=['cancelled']):
+            logger.info(f"Reactivated reservation {self.reservation_id} after payment reversal")
             
         return True
+
+    def transition_reservation(self, new_status, from_statuses=None):
+        """
+        Move the related reservation through the orders transition engine.
+
+        Returns:
+            bool: True if the reservation's status was changed
+        """
+        from orders.transitions import transition
+
+        if not self.reservation_id:
+            return False
+        result = transition([self.reservation_id], new_status, from_statuses=from_statuses)
+        if not result.updated:
+            return False
+        # Replace the cached reservation with the updated one
+        self.reservation = result.updated[0]
+        return True
+
+
+
+class PaymentEvent(models.Model):
+    """
+    Append-only log of payment status changes.
+
+    ``Payment.save`` records one event per status change; code that writes
+    payments in bulk builds its events with ``for_changes`` and saves them
+    with one ``log``, which also keeps the revenue ledger current.
+    ``from_status`` is empty for newly created payments.
+    """
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='events')
+    from_status = models.CharField(max_length=10, choices=Payment.STATUS_CHOICES, blank=True, null=True)
+    to_status = models.CharField(max_length=10, choices=Payment.STATUS_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['payment', 'created_at'], name='payment_event_payment_idx'),
+            models.Index(fields=['to_status', 'created_at'], name='payment_event_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Payment {self.payment_id}: {self.from_status} -> {self.to_status}"
+
+    @classmethod
+    def log(cls, events):
+        """Save unsaved events with one INSERT and apply them to the revenue ledger."""
+        from .ledger import apply_events
+
+        if not events:
+            return
+        cls.objects.bulk_create(events)
+        apply_events(events)
+
+    @classmethod
+    def for_changes(cls, payments):
+        """
+        Build unsaved events for the payments whose status changed in memory.
+
+        Call before writing the payments, while their tracked original
+        status is still the one in the database.
+        """
+        return [
+            cls(payment=payment, from_status=payment.original_value('status'), to_status=payment.status)
+            for payment in payments
+            if payment.has_changed('status')
+        ]
+
+
+class RevenueRollup(models.Model):
+    """
+    Payment totals of one day, meal type and food (see payments.ledger).
+
+    ``day`` is the Iran date the payment was started on. Each payment counts
+    in the bucket of its current status, so a payment that failed and was
+    later reversed moves from the failed to the reversed totals. Payments
+    without a reservation have an empty ``meal_type`` and no ``food``; so do
+    the rollups of deleted foods, which are merged into that bucket.
+    """
+    day = models.DateField()
+    meal_type = models.CharField(max_length=10, blank=True, default='')
+    food = models.ForeignKey('food.Food', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    paid_amount = models.BigIntegerField(default=0)
+    paid_count = models.IntegerField(default=0)
+    failed_amount = models.BigIntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    reversed_amount = models.BigIntegerField(default=0)
+    reversed_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['day', 'meal_type', 'food']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'meal_type', 'food'], name='unique_revenue_rollup', nulls_distinct=False
+            ),
+        ]
+
+    def __str__(self):
+        return f"Revenue {self.day} {self.meal_type or '-'} food {self.food_id}"
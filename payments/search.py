@@ -0,0 +1,142 @@
+"""
+Admin payment search.
+
+The admin payment list searches authorities, ref ids, failure reasons and
+user phone numbers. All of them are served by indexes:
+
+- terms shaped like an authority, a phone number or a ref id are first
+  tried as a prefix of that one field, using its ``varchar_pattern_ops``
+  index; when the prefix matches nothing the full search runs instead
+- the full search is a substring match on ``Payment.search_text`` (the
+  upper-cased authority, ref id and failure reason, kept by the database)
+  and on user phone numbers, both backed by pg_trgm GIN indexes
+
+Pages are cut by keyset on ``(created_at, id)``, so deep pages cost the
+same as the first. Counting stops at PAYMENT_SEARCH_EXACT_COUNT rows; larger
+results report the planner's estimate instead of counting every row.
+"""
+import base64
+import json
+import re
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from menu.schedule import IRAN_TZ
+
+User = get_user_model()
+
+AUTHORITY_PATTERN = re.compile(r'^[AS][0-9A-Za-z]{7,}$')
+PHONE_PATTERN = re.compile(r'^09\d{2,}$')
+REF_ID_PATTERN = re.compile(r'^\d{4,}$')
+
+
+def _phones(lookup, term):
+    # Payments of deleted users are searchable too
+    return Q(user__in=User.all_objects.filter(**{f'phone_number__{lookup}': term}).values('pk'))
+
+
+def _prefix(term):
+    if AUTHORITY_PATTERN.match(term):
+        return Q(authority__startswith=term)
+    if PHONE_PATTERN.match(term):
+        return _phones('startswith', term)
+    if REF_ID_PATTERN.match(term):
+        return Q(ref_id__startswith=term)
+    return None
+
+
+def search(queryset, term):
+    """Narrow payments to those matching a search term."""
+    term = term.strip()
+    if not term:
+        return queryset
+    prefix = _prefix(term)
+    if prefix is not None and queryset.filter(prefix).exists():
+        return queryset.filter(prefix)
+    return queryset.filter(Q(search_text__contains=term.upper()) | _phones('contains', term))
+
+
+def filter_payments(queryset, filters):
+    """
+    Apply the validated admin list filters (see PaymentFilterSerializer).
+
+    Dates are Iran days, matched as ranges of ``created_at`` so the
+    ``(status, created_at)`` index applies.
+    """
+    if 'user_id' in filters:
+        queryset = queryset.filter(user_id=filters['user_id'])
+    if 'status' in filters:
+        queryset = queryset.filter(status=filters['status'])
+    if 'min_amount' in filters:
+        queryset = queryset.filter(amount__gte=filters['min_amount'])
+    if 'max_amount' in filters:
+        queryset = queryset.filter(amount__lte=filters['max_amount'])
+    if 'start_date' in filters:
+        queryset = queryset.filter(created_at__gte=_day_start(filters['start_date']))
+    if 'end_date' in filters:
+        queryset = queryset.filter(created_at__lt=_day_start(filters['end_date'] + timedelta(days=1)))
+    if filters.get('search'):
+        queryset = search(queryset, filters['search'])
+    return queryset
+
+
+def _day_start(day):
+    return IRAN_TZ.localize(datetime.combine(day, time.min))
+
+
+def count(queryset):
+    """
+    Count payments, exactly up to PAYMENT_SEARCH_EXACT_COUNT.
+
+    Returns:
+        tuple: (count, estimated), where estimated tells whether the count
+        is the planner's estimate
+    """
+    limit = settings.PAYMENT_SEARCH_EXACT_COUNT
+    queryset = queryset.order_by()
+    exact = queryset.values('pk')[:limit + 1].count()
+    if exact <= limit:
+        return exact, False
+    plan = json.loads(queryset.explain(format='json'))
+    return max(int(plan[0]['Plan']['Plan Rows']), exact), True
+
+
+def _encode_cursor(payment):
+    return base64.urlsafe_b64encode(f"{payment.created_at.isoformat()}|{payment.pk}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+
+
+def keyset_page(queryset, limit, cursor=None, descending=True):
+    """
+    Get one page of payments ordered by ``(created_at, id)``.
+
+    Returns:
+        tuple: (payments, next cursor or None on the last page)
+
+    Raises:
+        ValueError: If the cursor is invalid
+    """
+    if cursor:
+        created_at, pk = _decode_cursor(cursor)
+        if descending:
+            after = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        else:
+            after = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        queryset = queryset.filter(after)
+
+    ordering = ['-created_at', '-id'] if descending else ['created_at', 'id']
+    # One extra row tells whether there is a next page without a COUNT
+    payments = list(queryset.order_by(*ordering)[:limit + 1])
+    has_next = len(payments) > limit
+    payments = payments[:limit]
+    return payments, _encode_cursor(payments[-1]) if has_next else None
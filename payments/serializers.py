@@ -23,7 +23,7 @@ class PaymentRequestSerializer(serializers.Serializer):
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = "__all__"
+        exclude = ['search_text']
     
     def create(self, validated_data):
         logger.info(f"Creating new payment: {validated_data}")
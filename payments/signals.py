@@ -0,0 +1,12 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from food.models import Food
+
+from . import ledger
+
+
+@receiver(pre_delete, sender=Food)
+def merge_revenue_of_deleted_food(sender, instance, **kwargs):
+    """Fold the food's revenue rollups into the no-food bucket before it goes."""
+    ledger.merge_food(instance.pk)
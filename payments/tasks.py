@@ -1,11 +1,19 @@
 """
 Celery tasks for payment processing.
 """
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from datetime import timedelta
-from .models import Payment
-from .utils import inquire_payment
+from orders.transitions import transition
+from .models import Payment, PaymentEvent
+from .utils import inquire_payment, verify_payment
+from .verification import settle
 from core.logging_utils import get_logger
 from university_food_system.tasks_with_logging import task_with_logging
 import logging
@@ -13,209 +21,245 @@ import logging
 # Get logger with the module's full name
 logger = logging.getLogger('payments.tasks')
 
-@shared_task
-@task_with_logging
-def check_and_reverse_failed_payments():
+
+def _keyset_chunks(queryset, chunk_size):
     """
-    Periodic reconciliation of failed and pending payments against ZarinPal.
+    Yield the rows of ``queryset`` in primary key order, ``chunk_size`` at a time.
 
-    Behavior
-    - Failed payments: If status in ZarinPal is PAID/VERIFIED and our record is FAILED,
-      attempt reversal and mark reservation appropriately. Also stamp failure_details.last_checked.
-    - Pending payments: Query ZarinPal and, if PAID/VERIFIED, mark as PAID and update
-      reservation. Always stamp failure_details.last_checked.
+    Each chunk is fetched with ``pk > last seen pk``, so the cost of a page
+    doesn't grow with how far into the result it is, and rows changed while
+    a chunk is processed can't shift later pages.
+    """
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
 
-    Time windows
-    - Failed: Only payments with updated_at <= now - 30 minutes are considered (older or equal).
-      Payments updated more recently are skipped (not counted as checked/processed).
-    - Pending: Only payments with created_at >= now - 30 minutes are considered (newer or equal).
 
-    Returns a summary dict with counts: total_checked, processed_count, reversed_count,
-    updated_count, failed_count, skipped_count, and a timestamp.
+def _submit_inquiries(executor, payments, inquiries):
     """
-    thirty_minutes_ago = timezone.now() - timedelta(minutes=30)
-    
-    # Log the current time and threshold for reference (debug only)
-    current_time = timezone.now()
-    logger.debug(f"[DEBUG] Current time: {current_time}, 30 mins ago: {thirty_minutes_ago}")
-    
-    # Get failed payments outside the last 30 minutes that haven't been reversed yet
-    logger.debug(f"[DEBUG] Querying for failed payments updated <= {thirty_minutes_ago}")
-    
-    # First, get all failed payments for debugging
-    all_failed = Payment.objects.filter(status=Payment.STATUS_FAILED).count()
-    logger.debug(f"[DEBUG] Total failed payments in DB: {all_failed}")
-    
-    # Get payments that match our criteria
-    failed_payments = Payment.objects.filter(
-        status=Payment.STATUS_FAILED,
-        updated_at__lte=thirty_minutes_ago,  # Changed from __gte to __lte to get older payments
-        failure_details__reversed=False  # Only process payments we haven't tried to reverse
-    ).select_related('reservation')
-    
-    # Log the raw SQL query for debugging
-    logger.debug(f"[DEBUG] SQL Query: {str(failed_payments.query)}")
-    
-    # Log the query and results for debugging
-    count = failed_payments.count()
-    logger.debug(f"[DEBUG] Found {count} failed payments to process")
-    
-    # Log all payments that match the criteria
-    for p in failed_payments:
-        logger.debug(f"[DEBUG] Matching Payment - ID: {p.id}, Status: {p.status}, Updated: {p.updated_at}, Details: {p.failure_details}")
-    
-    # If no payments found, log more details about what's in the DB
-    if count == 0:
-        logger.debug("[DEBUG] No payments matched the criteria. Checking all failed payments:")
-        all_payments = Payment.objects.filter(status=Payment.STATUS_FAILED)
-        for p in all_payments:
-            logger.debug(f"[DEBUG] All Failed Payment - ID: {p.id}, Status: {p.status}, Updated: {p.updated_at}, Details: {p.failure_details}")
-            
-            # Check why each payment doesn't match the criteria
-            if p.updated_at < thirty_minutes_ago:
-                logger.debug(f"[DEBUG]   - Payment {p.id} is too old (updated at {p.updated_at})")
-            if (p.failure_details or {}).get('reversed', False):
-                logger.debug(f"[DEBUG]   - Payment {p.id} is already reversed")
-                
-    # Log the time range we're querying for
-    logger.debug(f"[DEBUG] Query time range: {thirty_minutes_ago} to {current_time}")
-    
-    # Get pending payments from the last 30 minutes
-    pending_payments = Payment.objects.filter(
-        status=Payment.STATUS_PENDING,
-        created_at__gte=thirty_minutes_ago
-    ).select_related('reservation')
-    
-    logger.info(f"Found {len(failed_payments)} failed and {len(pending_payments)} pending payments to check")
-    
-    processed_count = 0
-    reversed_count = 0
-    updated_count = 0
-    failed_count = 0
-    
-    # Process failed payments
-    logger.debug(f"Starting to process {len(failed_payments)} failed payments")
-    for payment in failed_payments:
+    Start ZarinPal inquiries for the payments' authorities on the thread pool.
+
+    ``inquiries`` maps authority to its pending or finished inquiry and is
+    shared by the whole run, so every authority is inquired once.
+    """
+    for payment in payments:
+        if payment.authority not in inquiries:
+            inquiries[payment.authority] = executor.submit(inquire_payment, payment.authority)
+
+
+def _reconcile_failed(payments, executor, inquiries, counts):
+    """Reverse failed payments that ZarinPal reports as paid and stamp the rest as checked."""
+    # Only the HTTP calls run on the pool; all database work stays on this thread
+    _submit_inquiries(executor, payments, inquiries)
+
+    for payment in payments:
         try:
-            logger.debug(f"Processing payment {payment.id} with status {payment.status} and failure_details: {payment.failure_details}")
-            
-            # Skip if we've already tried to reverse this payment
-            if payment.failure_details and payment.failure_details.get('reversed', False):
-                logger.debug(f"Skipping payment {payment.id} - already reversed")
-                continue
-                
-            # Skip if the payment was updated too recently (less than 30 minutes ago)
-            thirty_minutes_ago = timezone.now() - timedelta(minutes=30)
-            logger.debug(f"Payment {payment.id} - updated_at: {payment.updated_at} (type: {type(payment.updated_at)}), thirty_minutes_ago: {thirty_minutes_ago} (type: {type(thirty_minutes_ago)})")
-            
-            # Convert to timezone-naive datetime for comparison if needed
-            updated_at_naive = payment.updated_at.replace(tzinfo=None) if payment.updated_at.tzinfo else payment.updated_at
-            thirty_minutes_ago_naive = thirty_minutes_ago.replace(tzinfo=None) if thirty_minutes_ago.tzinfo else thirty_minutes_ago
-            
-            if updated_at_naive > thirty_minutes_ago_naive:
-                logger.info(f"Skipping recently failed payment {payment.id} (updated at {payment.updated_at})")
-                continue
-                
-            # Mark this payment as being processed
-            processed_count += 1
-                
-            # Check payment status with ZarinPal
-            inquiry_result = inquire_payment(payment.authority)
-            
+            counts['processed_count'] += 1
+            inquiry_result = inquiries[payment.authority].result()
+
             # If payment is marked as PAID or VERIFIED in ZarinPal but failed in our system, reverse it
             if inquiry_result.get('success') and inquiry_result.get('status') in ['PAID', 'VERIFIED']:
                 logger.info(
                     f"Found successful payment for failed payment {payment.id}. "
                     f"Status: {inquiry_result.get('status')}. Reversing..."
                 )
-                
-                # Try to reverse the payment (this will handle both ZarinPal reversal and our DB update)
+
+                # Reuse the inquiry instead of asking ZarinPal again
                 from .utils import check_and_reverse_failed_payment
-                if check_and_reverse_failed_payment(payment):
-                    reversed_count += 1
+                if check_and_reverse_failed_payment(payment, inquiry_result=inquiry_result):
+                    counts['reversed_count'] += 1
                     logger.info(f"Successfully processed reversal for payment {payment.id}")
                 else:
                     logger.error(f"Failed to reverse payment {payment.id}")
-                    
-                    # Update failure details if available
-                    if hasattr(payment, 'failure_details') and payment.failure_details.get('reversal_error'):
-                        error_info = payment.failure_details['reversal_error']
-                        logger.error(f"Reversal error details: {error_info}")
-            
-            # Update failure details to indicate we've checked this payment
+                    if payment.failure_details and payment.failure_details.get('reversal_error'):
+                        logger.error(f"Reversal error details: {payment.failure_details['reversal_error']}")
+
             if not payment.failure_details:
                 payment.failure_details = {}
-            
-            # Update last_checked and save the payment
             payment.failure_details['last_checked'] = timezone.now().isoformat()
-            payment.save(update_fields=['failure_details'])
-            
-            # Log that we've checked this payment
             logger.info(f"Checked payment {payment.id} with status {payment.status}")
-                    
+
         except Exception as e:
             logger.error(f"Error processing failed payment {payment.id}: {str(e)}")
-            # Update failure details to indicate we've tried to process this
             if not payment.failure_details:
                 payment.failure_details = {}
             payment.failure_details['last_error'] = str(e)
-            payment.save(update_fields=['failure_details'])
-            failed_count += 1
-    
-    # Process pending payments
-    for payment in pending_payments:
+            counts['failed_count'] += 1
+
+    Payment.objects.bulk_update(payments, ['failure_details'])
+
+
+def _reconcile_pending(payments, executor, inquiries, counts):
+    """Mark pending payments that ZarinPal reports as paid and move their reservations on."""
+    # Skip payments checked within the last 5 minutes
+    recently = timezone.now() - timedelta(minutes=5)
+    due = []
+    for payment in payments:
+        last_checked = (payment.failure_details or {}).get('last_checked')
+        if last_checked and timezone.datetime.fromisoformat(last_checked) > recently:
+            continue
+        due.append(payment)
+
+    _submit_inquiries(executor, due, inquiries)
+
+    results, errors = {}, {}
+    for payment in due:
         try:
-            # Skip if we've checked this payment recently (within last 5 minutes)
-            if payment.failure_details and payment.failure_details.get('last_checked'):
-                last_checked = timezone.datetime.fromisoformat(payment.failure_details['last_checked'])
-                if timezone.now() - last_checked < timedelta(minutes=5):
-                    continue
-            
-            # Check payment status with ZarinPal
-            inquiry_result = inquire_payment(payment.authority)
-            
-            # Update payment status based on ZarinPal's response
-            if inquiry_result.get('success'):
-                status = inquiry_result.get('status')
-                
-                if status in ['PAID', 'VERIFIED'] and payment.status != Payment.STATUS_PAID:
-                    # Mark as paid if not already
+            inquiry_result = inquiries[payment.authority].result()
+        except Exception as e:
+            logger.error(f"Error processing pending payment {payment.id}: {str(e)}")
+            errors[payment.pk] = str(e)
+            counts['failed_count'] += 1
+            continue
+        results[payment.pk] = inquiry_result
+
+    if not results and not errors:
+        return
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Payment callbacks may have settled some of these while ZarinPal was being asked;
+        # only rows that are still pending are written
+        current = Payment.objects.select_for_update().filter(
+            pk__in=[*results, *errors], status=Payment.STATUS_PENDING
+        ).in_bulk()
+
+        paid_reservations = []
+        for pk, payment in current.items():
+            details = dict(payment.failure_details or {})
+            if pk in errors:
+                details['last_error'] = errors[pk]
+            else:
+                inquiry_result = results[pk]
+                if not inquiry_result.get('success'):
+                    # Answered, if not favourably: wait the usual 5 minutes before asking again
+                    details['last_error'] = inquiry_result.get('message') or 'Inquiry failed'
+                    counts['failed_count'] += 1
+                elif inquiry_result.get('status') in ['PAID', 'VERIFIED']:
                     payment.status = Payment.STATUS_PAID
                     payment.ref_id = inquiry_result.get('ref_id')
-                    payment.save()
-                    updated_count += 1
-                    processed_count += 1
+                    payment.updated_at = now
+                    counts['updated_count'] += 1
+                    counts['processed_count'] += 1
                     logger.info(f"Updated pending payment {payment.id} to PAID")
-                    
-                    # Update reservation status if needed
-                    if payment.reservation and payment.reservation.status == 'pending_payment':
-                        payment.reservation.status = 'waiting'
-                        payment.reservation.save()
-                        logger.info(f"Updated reservation {payment.reservation.id} to waiting")
-                
-                # Update last checked time
-                if not payment.failure_details:
-                    payment.failure_details = {}
-                payment.failure_details['last_checked'] = timezone.now().isoformat()
-                payment.save(update_fields=['failure_details'])
-                
-        except Exception as e:
-            logger.error(f"Error processing pending payment {payment.id}: {str(e)}")
-            if not payment.failure_details:
-                payment.failure_details = {}
-            payment.failure_details['last_error'] = str(e)
-            payment.save(update_fields=['failure_details'])
-            failed_count += 1
-    
-    total_checked = len(failed_payments) + len(pending_payments)
-    skipped_count = total_checked - processed_count  # Any payment not processed is considered skipped
-    
+                    if payment.reservation_id:
+                        paid_reservations.append(payment.reservation_id)
+                details['last_checked'] = now.isoformat()
+            payment.failure_details = details
+
+        events = PaymentEvent.for_changes(current.values())
+        Payment.objects.bulk_update(current.values(), ['status', 'ref_id', 'failure_details', 'updated_at'])
+        PaymentEvent.log(events)
+
+        if paid_reservations:
+            result = transition(paid_reservations, 'waiting', from_statuses=['pending_payment'])
+            logger.info(f"Updated {len(result.updated)} reservations of paid payments to waiting")
+
+
+@shared_task
+@task_with_logging
+def check_and_reverse_failed_payments():
+    """
+    Periodic reconciliation of failed and pending payments against ZarinPal.
+
+    Behavior
+    - Failed payments: If status in ZarinPal is PAID/VERIFIED and our record is FAILED,
+      attempt reversal and mark reservation appropriately. Also stamp failure_details.last_checked.
+    - Pending payments: Query ZarinPal and, if PAID/VERIFIED, mark as PAID and update
+      reservation. Stamp failure_details.last_checked whenever ZarinPal answered, also
+      when the inquiry was unsuccessful (recorded as last_error and in failed_count);
+      payments are re-inquired at most every 5 minutes. Inquiries that raised are
+      recorded as last_error and retried on the next run.
+
+    Time windows
+    - Failed: Only payments with updated_at <= now - 30 minutes are considered (older or equal).
+      Payments updated more recently are skipped (not counted as checked/processed).
+    - Pending: Only payments with created_at >= now - 30 minutes are considered (newer or equal).
+
+    Execution
+    - Candidates are read in keyset-paged chunks of PAYMENT_RECONCILE_CHUNK_SIZE.
+    - Inquiries for a chunk run concurrently on PAYMENT_RECONCILE_WORKERS threads, once per
+      authority, and results are written back with one bulk update per chunk.
+    - No new chunk is started after PAYMENT_RECONCILE_TIME_BUDGET seconds, so a run ends
+      before the next one is scheduled; the remaining payments are picked up next run.
+      Pending payments go first, since their students are waiting on them.
+
+    Returns a summary dict with counts: total_checked, processed_count, reversed_count,
+    updated_count, failed_count, skipped_count, and a timestamp.
+    """
+    started = time.monotonic()
+    thirty_minutes_ago = timezone.now() - timedelta(minutes=30)
+
+    pending_payments = Payment.objects.filter(
+        status=Payment.STATUS_PENDING,
+        created_at__gte=thirty_minutes_ago
+    )
+    # Failed payments outside the last 30 minutes that haven't been reversed yet
+    failed_payments = Payment.objects.filter(
+        status=Payment.STATUS_FAILED,
+        updated_at__lte=thirty_minutes_ago,
+        failure_details__reversed=False
+    )
+
+    counts = Counter()
+    inquiries = {}
+    with ThreadPoolExecutor(max_workers=settings.PAYMENT_RECONCILE_WORKERS) as executor:
+        for queryset, reconcile in ((pending_payments, _reconcile_pending), (failed_payments, _reconcile_failed)):
+            for chunk in _keyset_chunks(queryset, settings.PAYMENT_RECONCILE_CHUNK_SIZE):
+                if time.monotonic() - started > settings.PAYMENT_RECONCILE_TIME_BUDGET:
+                    logger.warning("Payment reconciliation ran out of time; the rest is left for the next run")
+                    break
+                counts['total_checked'] += len(chunk)
+                reconcile(chunk, executor, inquiries, counts)
+
+    logger.info(
+        f"Checked {counts['total_checked']} payments with {len(inquiries)} ZarinPal inquiries "
+        f"in {time.monotonic() - started:.1f}s"
+    )
+
     return {
-        'total_checked': total_checked,
-        'processed_count': processed_count,
-        'reversed_count': reversed_count,
-        'updated_count': updated_count,
-        'failed_count': failed_count,
-        'skipped_count': skipped_count,
+        'total_checked': counts['total_checked'],
+        'processed_count': counts['processed_count'],
+        'reversed_count': counts['reversed_count'],
+        'updated_count': counts['updated_count'],
+        'failed_count': counts['failed_count'],
+        # Any payment not processed is considered skipped
+        'skipped_count': counts['total_checked'] - counts['processed_count'],
         'timestamp': timezone.now().isoformat()
     }
+
+
+@shared_task(bind=True)
+@task_with_logging
+def verify_payment_callback(self, payment_id):
+    """
+    Verify a payment with ZarinPal after its gateway callback.
+
+    Runs on the PAYMENT_VERIFY_QUEUE queue. Gateway errors are retried up to
+    PAYMENT_VERIFY_MAX_RETRIES times with exponential backoff starting at
+    PAYMENT_VERIFY_RETRY_DELAY seconds; when they run out the payment fails
+    like a rejected one. Payments that are no longer pending are left alone,
+    so running the task twice for a payment is harmless.
+
+    Returns a dict with the payment id and its status afterwards.
+    """
+    payment = Payment.objects.filter(pk=payment_id).only('amount', 'authority', 'status').first()
+    if payment is None or payment.status != Payment.STATUS_PENDING:
+        return {'payment_id': payment_id, 'status': payment and payment.status}
+
+    try:
+        # One attempt per run; retries are spread out by the task instead
+        response = verify_payment(payment.amount, payment.authority, max_retries=1)
+    except Exception as e:
+        if self.request.retries < settings.PAYMENT_VERIFY_MAX_RETRIES:
+            logger.warning(f"Verification of payment {payment_id} failed, retrying: {str(e)}")
+            raise self.retry(exc=e, countdown=settings.PAYMENT_VERIFY_RETRY_DELAY * 2 ** self.request.retries)
+        return {'payment_id': payment_id, 'status': settle(payment_id, error=str(e))}
+
+    return {'payment_id': payment_id, 'status': settle(payment_id, response=response)}
@@ -0,0 +1,47 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from payments.models import Payment, PaymentEvent
+from payments.tasks import check_and_reverse_failed_payments
+
+User = get_user_model()
+
+
+class PaymentEventTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='09120000001', password='x', role='student')
+
+    def test_save_logs_status_changes_without_reading_the_row(self):
+        payment = Payment.objects.create(user=self.user, amount=50000, authority='AUTH1')
+
+        with self.assertNumQueries(1):
+            payment.ref_id = 'R1'
+            payment.save()
+        # The update, its event and the revenue ledger, in a savepoint
+        with self.assertNumQueries(5):
+            payment.status = Payment.STATUS_PAID
+            payment.save()
+
+        self.assertEqual(
+            list(payment.events.values_list('from_status', 'to_status')),
+            [(None, 'pending'), ('pending', 'paid')],
+        )
+
+    def test_reconciliation_logs_changes_in_bulk(self):
+        payments = [
+            Payment.objects.create(user=self.user, amount=50000, authority=f'AUTH{n}') for n in range(3)
+        ]
+        PaymentEvent.objects.all().delete()
+
+        def inquire(authority):
+            return {'success': True, 'status': 'PAID' if authority != 'AUTH2' else 'IN_BANK', 'ref_id': 'R'}
+
+        with patch('payments.tasks.inquire_payment', side_effect=inquire):
+            check_and_reverse_failed_payments()
+
+        self.assertEqual(
+            sorted(PaymentEvent.objects.values_list('payment_id', 'from_status', 'to_status')),
+            [(payments[0].pk, 'pending', 'paid'), (payments[1].pk, 'pending', 'paid')],
+        )
@@ -0,0 +1,126 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from food.models import Food
+from menu.schedule import IRAN_TZ
+from orders.models import Reservation
+from payments.admin import PaymentAdmin
+from payments.ledger import TOTAL_FIELDS
+from payments.models import Payment, RevenueRollup
+
+User = get_user_model()
+
+
+class RevenueLedgerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='09120000001', password='x', role='student')
+        self.today = timezone.now().astimezone(IRAN_TZ).date()
+        self.kebab = Food.objects.create(name='Kebab', price=Decimal('50000.00'))
+        self.rice = Food.objects.create(name='Rice', price=Decimal('30000.00'))
+
+    def pay(self, food, meal_type, amount):
+        reservation = Reservation.objects.create(
+            student=self.user, food=food, meal_type=meal_type, reserved_date=self.today,
+            price=Decimal(amount), status='pending_payment',
+        )
+        return Payment.objects.create(user=self.user, reservation=reservation, amount=amount, authority=f'A{amount}')
+
+    def rollups(self):
+        return {
+            (rollup.meal_type, rollup.food_id): {field: getattr(rollup, field) for field in TOTAL_FIELDS}
+            for rollup in RevenueRollup.objects.filter(day=self.today)
+        }
+
+    def totals(self, **values):
+        return {field: values.get(field, 0) for field in TOTAL_FIELDS}
+
+    def test_transitions_move_amounts_between_totals(self):
+        first = self.pay(self.kebab, 'lunch', 50000)
+        second = self.pay(self.kebab, 'lunch', 40000)
+        third = self.pay(self.rice, 'dinner', 30000)
+        self.assertEqual(RevenueRollup.objects.count(), 0)
+
+        for payment in (first, second):
+            payment.status = Payment.STATUS_PAID
+            payment.save()
+        third.mark_as_failed('cancelled by user', -51)
+        third.refresh_from_db()
+        third.mark_as_reversed()
+
+        self.assertEqual(self.rollups(), {
+            ('lunch', self.kebab.pk): self.totals(paid_amount=90000, paid_count=2),
+            ('dinner', self.rice.pk): self.totals(reversed_amount=30000, reversed_count=1),
+        })
+
+        # The admin action logs its bulk update too, reading the old statuses under a row lock
+        with CaptureQueriesContext(connection) as queries:
+            PaymentAdmin(Payment, None)._set_status(
+                Payment.objects.select_related('user', 'reservation').filter(pk=second.pk), Payment.STATUS_FAILED
+            )
+        self.assertIn('FOR UPDATE', queries[1]['sql'])
+        self.assertEqual(self.rollups()[('lunch', self.kebab.pk)], self.totals(
+            paid_amount=50000, paid_count=1, failed_amount=40000, failed_count=1,
+        ))
+
+    def test_rebuild_matches_incremental_totals(self):
+        for food, meal_type, amount in ((self.kebab, 'lunch', 50000), (self.rice, 'lunch', 30000)):
+            payment = self.pay(food, meal_type, amount)
+            payment.status = Payment.STATUS_PAID
+            payment.save()
+        incremental = self.rollups()
+
+        # A change made behind the application's back is picked up by a rebuild
+        Payment.objects.filter(amount=30000).update(status=Payment.STATUS_FAILED)
+        call_command('rebuild_revenue_ledger', str(self.today), str(self.today), stdout=None)
+
+        self.assertEqual(self.rollups()[('lunch', self.kebab.pk)], incremental[('lunch', self.kebab.pk)])
+        self.assertEqual(
+            self.rollups()[('lunch', self.rice.pk)], self.totals(failed_amount=30000, failed_count=1)
+        )
+
+    def test_deleting_foods_merges_their_rollups(self):
+        for food, amount in ((self.kebab, 50000), (self.rice, 30000)):
+            payment = self.pay(food, 'lunch', amount)
+            payment.status = Payment.STATUS_PAID
+            payment.save()
+
+        self.kebab.delete()
+        self.rice.delete()
+
+        self.assertEqual(self.rollups(), {('lunch', None): self.totals(paid_amount=80000, paid_count=2)})
+
+    def test_report_reads_the_rollups(self):
+        RevenueRollup.objects.bulk_create([
+            RevenueRollup(day=self.today - timedelta(days=day), meal_type=meal_type, food=food, paid_amount=1000, paid_count=1)
+            for day in range(3) for meal_type in ('lunch', 'dinner') for food in (self.kebab, self.rice)
+        ])
+        admin = User.objects.create_user(
+            phone_number='09120000002', password='x', role='admin', is_staff=True, is_superuser=True
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+        url = reverse('payments:admin-revenue-report')
+        params = {'start_date': str(self.today - timedelta(days=1)), 'end_date': str(self.today)}
+
+        with self.assertNumQueries(4):
+            response = client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['paid_amount'], 8000)
+        self.assertEqual([row['paid_count'] for row in response.data['by_day']], [4, 4])
+        self.assertEqual(
+            [(row['food__name'], row['paid_amount']) for row in response.data['by_food']],
+            [('Kebab', 4000), ('Rice', 4000)],
+        )
+
+        lunch = client.get(url, {**params, 'meal_type': 'lunch', 'food': self.kebab.pk})
+        self.assertEqual(lunch.data['totals']['paid_amount'], 2000)
+        self.assertEqual(client.get(url, {'start_date': str(self.today)}).status_code, 400)
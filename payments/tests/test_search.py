@@ -0,0 +1,98 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orders.tests.test_indexes import scans
+from payments import search
+from payments.models import Payment
+
+User = get_user_model()
+
+
+class AdminPaymentSearchTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(phone_number='09121110000', password='x', role='student')
+        self.bob = User.objects.create_user(phone_number='09352220000', password='x', role='student')
+        self.admin = User.objects.create_user(
+            phone_number='09120000009', password='x', role='admin', is_staff=True, is_superuser=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('payments:admin-payment-list')
+
+        self.paid = Payment.objects.create(
+            user=self.alice, amount=50000, authority='A00000000000000000000000000000123456',
+            ref_id='778899', status=Payment.STATUS_PAID,
+        )
+        self.failed = Payment.objects.create(user=self.bob, amount=30000, authority='A00000000000000000000000000000654321')
+        self.failed.mark_as_failed('Cancelled by user', -51)
+
+    def found(self, term):
+        return set(search.search(Payment.objects.all(), term).values_list('pk', flat=True))
+
+    def test_search_matches_every_field(self):
+        self.assertEqual(self.found('123456'), {self.paid.pk})
+        self.assertEqual(self.found('7788'), {self.paid.pk})
+        self.assertEqual(self.found('cancelled BY'), {self.failed.pk})
+        self.assertEqual(self.found('-51'), {self.failed.pk})
+        self.assertEqual(self.found('0935222'), {self.failed.pk})
+        self.assertEqual(self.found('2220000'), {self.failed.pk})
+        self.assertEqual(self.found('A0000000000'), {self.paid.pk, self.failed.pk})
+        self.assertEqual(self.found('nothing'), set())
+
+    def test_shaped_terms_try_a_prefix_first(self):
+        with patch.object(search, '_phones', wraps=search._phones) as phones:
+            self.assertEqual(self.found('0912111'), {self.paid.pk})
+        phones.assert_called_once_with('startswith', '0912111')
+
+        # A ref id shaped term that only occurs inside an authority falls back to the full search
+        self.assertEqual(self.found('654321'), {self.failed.pk})
+
+    def test_list_filters_pages_and_counts(self):
+        for n in range(5):
+            Payment.objects.create(user=self.alice, amount=1000, authority=f'S{n:07d}')
+        today = str(timezone.localdate())
+
+        response = self.client.get(self.url, {'limit': 3, 'start_date': today, 'end_date': today})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['count'], response.data['count_is_estimate']), (7, False))
+        seen = [payment['id'] for payment in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(self.url, {'limit': 3, 'cursor': response.data['next']})
+            seen += [payment['id'] for payment in response.data['results']]
+        self.assertEqual(seen, list(Payment.objects.order_by('-created_at', '-id').values_list('pk', flat=True)))
+
+        response = self.client.get(self.url, {'status': 'paid', 'ordering': 'created_at', 'search': '7788'})
+        self.assertEqual([payment['id'] for payment in response.data['results']], [self.paid.pk])
+
+        tomorrow = str(timezone.localdate() + timedelta(days=1))
+        self.assertEqual(self.client.get(self.url, {'start_date': tomorrow}).data['count'], 0)
+        self.assertEqual(self.client.get(self.url, {'end_date': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'nope'}).status_code, 400)
+
+        with override_settings(PAYMENT_SEARCH_EXACT_COUNT=2):
+            response = self.client.get(self.url)
+        self.assertTrue(response.data['count_is_estimate'])
+        self.assertGreaterEqual(response.data['count'], 3)
+
+    def test_substring_search_uses_the_trigram_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('pg_trgm is not available on this database server')
+        Payment.objects.bulk_create([
+            Payment(user=self.alice, amount=1000, authority=f'S{n:07d}', ref_id=str(n)) for n in range(3000)
+        ])
+        User.objects.bulk_create([User(phone_number=f'0913{n:07d}', role='student') for n in range(3000)])
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {Payment._meta.db_table}; ANALYZE {User._meta.db_table}')
+
+        indexes = {index for _, _, index in scans(search.search(Payment.objects.all(), 'cancelled'))}
+        self.assertIn('payment_search_trgm_idx', indexes)
+        self.assertIn('user_phone_trgm_idx', indexes)
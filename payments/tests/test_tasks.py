@@ -177,7 +177,7 @@ class PaymentTasksTestCase(TestCase):
         
         super().tearDown()
         
-    @patch('payments.utils.requests.post')
+    @patch('payments.utils.zarinpal.post')
     @patch('payments.utils.inquire_payment')
     def test_reverse_failed_payment_success(self, mock_inquire_payment, mock_post):
         """Test that a failed payment that is actually paid gets reversed."""
@@ -244,7 +244,7 @@ class PaymentTasksTestCase(TestCase):
         # Set up the mock for inquire_payment
         mock_inquire_payment.return_value = mock_inquiry_response
         
-        # Set up the mock for requests.post (for the reversal request)
+        # Set up the mock for zarinpal.post (for the reversal request)
         mock_response = mock.Mock()
         mock_response.json.return_value = mock_reversal_response
         mock_response.raise_for_status.return_value = None
@@ -281,8 +281,8 @@ class PaymentTasksTestCase(TestCase):
         mock_inquire_payment.assert_called_once_with('test_authority_123')
         
         # Verify the reversal call was made with the correct URL
-        # We expect one call to requests.post (for the reversal) since inquire_payment is mocked
-        self.assertEqual(mock_post.call_count, 1, "Expected exactly one call to requests.post for the reversal")
+        # We expect one call to zarinpal.post (for the reversal) since inquire_payment is mocked
+        self.assertEqual(mock_post.call_count, 1, "Expected exactly one call to zarinpal.post for the reversal")
         
         # Check that the reversal endpoint was called
         reversal_call_args, reversal_call_kwargs = mock_post.call_args
@@ -310,7 +310,7 @@ class PaymentTasksTestCase(TestCase):
         # Verify the function returned True indicating success
         self.assertTrue(result, "Expected check_and_reverse_failed_payment to return True")
     
-    @patch('payments.utils.requests.post')
+    @patch('payments.utils.zarinpal.post')
     @patch('payments.tasks.logger')
     def test_failed_payment_remains_failed(self, mock_logger, mock_post):
         """Test that a failed payment that is still failed in ZarinPal remains failed."""
@@ -469,7 +469,7 @@ class PaymentTasksTestCase(TestCase):
         def mock_reverse_side_effect(payment):
             print(f"[DEBUG] mock_reverse_side_effect called with payment: {payment.id}")
             # Call the real function but with our mocked requests
-            with patch('payments.utils.requests.post', mock_requests_post):
+            with patch('payments.utils.zarinpal.post', mock_requests_post):
                 result = real_reverse(payment)
                 print(f"[DEBUG] real_reverse result: {result}")
                 return result
@@ -571,7 +571,7 @@ class PaymentTasksTestCase(TestCase):
         
         # Skip strict logging assertions to avoid flakiness across environments
     
-    @patch('payments.utils.requests.post')
+    @patch('payments.utils.zarinpal.post')
     @patch('payments.tasks.inquire_payment')
     @patch('payments.tasks.timezone.now')
     @patch('payments.tasks.logger')
@@ -650,7 +650,7 @@ class PaymentTasksTestCase(TestCase):
         self.assertTrue(any('Checked payment' in str(call) for call in mock_logger.info.call_args_list),
                       "Expected log message 'Checked payment' not found in logs")
     
-    @patch('payments.utils.requests.post')
+    @patch('payments.utils.zarinpal.post')
     @patch('payments.tasks.inquire_payment')
     def test_check_recent_failed_payment_not_processed(self, mock_inquire, mock_post):
         """Test that a recently failed payment is not processed."""
@@ -735,7 +735,7 @@ class PaymentTasksTestCase(TestCase):
         self.assertIn('last_checked', payment.failure_details)
         # Already asserted above: processed_count=1, reversed_count=0, updated_count=0
 
-    @patch('payments.utils.requests.post')
+    @patch('payments.utils.zarinpal.post')
     @patch('payments.tasks.inquire_payment')
     def test_mixed_batch_minimal(self, mock_inquire, mock_post):
         """Minimal mixed-batch test: one failed-old reversed, one failed-recent skipped, one pending updated."""
@@ -866,3 +866,56 @@ class PaymentTasksTestCase(TestCase):
         self.assertEqual(result['processed_count'], 1)
         self.assertEqual(result['reversed_count'], 0)
         self.assertEqual(result['skipped_count'], 0)
+
+    @override_settings(PAYMENT_RECONCILE_CHUNK_SIZE=2)
+    @patch('payments.tasks.inquire_payment')
+    def test_reconciliation_inquires_each_authority_once(self, mock_inquire):
+        """Payments are read in chunks and payments sharing an authority cost one inquiry."""
+        now = datetime.now(datetime_timezone.utc)
+        authorities = ['D1', 'D2', 'DUP', 'DUP', 'D3']
+        payments = [
+            self.create_payment(status=Payment.STATUS_PENDING, created_time=now - timedelta(minutes=5), authority=authority)
+            for authority in authorities
+        ]
+        mock_inquire.side_effect = lambda authority: {'success': True, 'status': 'PAID', 'ref_id': f'R-{authority}'}
+
+        result = check_and_reverse_failed_payments()
+
+        self.assertEqual(sorted(call.args[0] for call in mock_inquire.call_args_list), ['D1', 'D2', 'D3', 'DUP'])
+        self.assertEqual(result['total_checked'], 5)
+        self.assertEqual(result['updated_count'], 5)
+        for payment in payments:
+            payment.refresh_from_db()
+            self.assertEqual(payment.status, Payment.STATUS_PAID)
+            self.assertEqual(payment.ref_id, f'R-{payment.authority}')
+            self.assertIn('last_checked', payment.failure_details)
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, 'waiting')
+
+    @patch('payments.tasks.inquire_payment')
+    def test_unsuccessful_pending_inquiry_is_stamped(self, mock_inquire):
+        """A pending payment whose inquiry fails is counted, stamped and not re-inquired within 5 minutes."""
+        payment = self.create_payment(status=Payment.STATUS_PENDING, created_minutes_ago=5, authority='U1')
+        mock_inquire.return_value = {'status': None, 'code': -9, 'message': 'Validation error', 'success': False}
+
+        result = check_and_reverse_failed_payments()
+
+        self.assertEqual(result['failed_count'], 1)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.STATUS_PENDING)
+        self.assertEqual(payment.failure_details['last_error'], 'Validation error')
+        self.assertIn('last_checked', payment.failure_details)
+
+        check_and_reverse_failed_payments()
+        mock_inquire.assert_called_once()
+
+    @override_settings(PAYMENT_RECONCILE_TIME_BUDGET=-1)
+    @patch('payments.tasks.inquire_payment')
+    def test_reconciliation_stops_at_time_budget(self, mock_inquire):
+        """No chunk is started once the time budget is spent."""
+        self.create_payment(status=Payment.STATUS_PENDING, created_minutes_ago=5, authority='T1')
+
+        result = check_and_reverse_failed_payments()
+
+        mock_inquire.assert_not_called()
+        self.assertEqual(result['total_checked'], 0)
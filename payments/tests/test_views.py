@@ -8,6 +8,7 @@ from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 
 from payments.models import Payment
+from payments.tasks import verify_payment_callback
 from orders.models import Reservation
 from food.models import Food
 from menu.models import DailyMenu, DailyMenuItem, TimeSlot
@@ -85,6 +86,44 @@ class PaymentsViewsTestCase(APITestCase):
         self.assertIn("redirect_url", resp.data)
         self.assertTrue(Payment.objects.filter(authority="AUTH123", user=self.user, reservation_id=reservation.id).exists())
 
+    @patch("payments.views.request_payment")
+    def test_payment_request_double_tap_reuses_payment(self, mock_request_payment):
+        reservation = self._create_reservation(price=Decimal("50000.00"))
+        mock_request_payment.return_value = {"data": {"code": 100, "authority": "AUTH123"}}
+
+        self.client.force_authenticate(self.user)
+        url = reverse("payments:payment-request")
+        payload = {"callback_url": "https://example.com/callback", "reservation_id": reservation.id}
+        first = self.client.post(url, data=payload, format="json")
+        # A retry with another callback url isn't a replay, but still finds the pending payment
+        payload["callback_url"] = "https://example.com/other"
+        second = self.client.post(url, data=payload, format="json")
+
+        self.assertEqual(mock_request_payment.call_count, 1)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data["redirect_url"], first.data["redirect_url"])
+        self.assertEqual(Payment.objects.filter(reservation_id=reservation.id).count(), 1)
+
+    @patch("payments.views.request_payment")
+    def test_payment_request_after_a_failed_payment_starts_a_new_one(self, mock_request_payment):
+        reservation = self._create_reservation(price=Decimal("50000.00"))
+        mock_request_payment.side_effect = [
+            {"data": {"code": 100, "authority": "AUTH1"}},
+            {"data": {"code": 100, "authority": "AUTH2"}},
+        ]
+
+        self.client.force_authenticate(self.user)
+        url = reverse("payments:payment-request")
+        payload = {"callback_url": "https://example.com/callback", "reservation_id": reservation.id}
+        first = self.client.post(url, data=payload, format="json")
+        Payment.objects.get(authority="AUTH1").mark_as_failed("cancelled by user", -51)
+        # The same request isn't replayed once the first payment has failed
+        second = self.client.post(url, data=payload, format="json")
+
+        self.assertEqual(mock_request_payment.call_count, 2)
+        self.assertNotEqual(second.data["redirect_url"], first.data["redirect_url"])
+        self.assertIn("AUTH2", second.data["redirect_url"])
+
     def test_payment_request_free_reservation_sets_waiting(self):
         reservation = self._create_reservation(price=Decimal("0.00"))
 
@@ -105,7 +144,14 @@ class PaymentsViewsTestCase(APITestCase):
         resp = self.client.post(url, data=payload, format="json")
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
 
-    @patch("payments.views.verify_payment")
+    def _callback(self, authority):
+        url = reverse("payments:payment-verify") + f"?Authority={authority}&Status=OK"
+        with patch("payments.tasks.verify_payment_callback.delay") as mock_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.get(url)
+        return resp, mock_delay
+
+    @patch("payments.tasks.verify_payment")
     def test_payment_verify_success(self, mock_verify):
         reservation = self._create_reservation(price=Decimal("50000.00"))
         payment = Payment.objects.create(
@@ -114,17 +160,42 @@ class PaymentsViewsTestCase(APITestCase):
         mock_verify.return_value = {"data": {"code": 100, "ref_id": "REF123"}}
 
         self.client.force_authenticate(self.user)
-        url = reverse("payments:payment-verify") + "?Authority=AUTH_OK&Status=OK"
-        resp = self.client.get(url)
+        resp, mock_delay = self._callback("AUTH_OK")
 
-        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        # The callback answers at once; the gateway is only asked by the task
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(resp.data.get("status"), "verifying")
+        mock_verify.assert_not_called()
+        mock_delay.assert_called_once_with(payment.id)
+        poll = self.client.get(resp.data["status_url"])
+        self.assertEqual(poll.data["status"], "verifying")
+
+        verify_payment_callback.apply(args=[payment.id])
         payment.refresh_from_db(); reservation.refresh_from_db()
         self.assertEqual(payment.status, "paid")
         self.assertEqual(payment.ref_id, "REF123")
+        self.assertEqual(payment.callback_status, "OK")
         self.assertEqual(reservation.status, "waiting")
-        self.assertTrue(resp.data.get("success"))
+        poll = self.client.get(resp.data["status_url"])
+        self.assertEqual(poll.data, {
+            "status": "paid", "payment_id": payment.id, "reservation_id": reservation.id, "ref_id": "REF123"
+        })
+        self.assertTrue(self._callback("AUTH_OK")[0].data.get("success"))
+
+    def test_payment_verify_is_queued_once_per_authority(self):
+        reservation = self._create_reservation(price=Decimal("50000.00"))
+        payment = Payment.objects.create(
+            user=self.user, reservation=reservation, amount=50000, authority="AUTH_TWICE", status="pending"
+        )
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self._callback("AUTH_TWICE")[1].call_count, 1)
+        self.assertEqual(self._callback("AUTH_TWICE")[1].call_count, 0)
+
+        # An attempt that went quiet is queued again
+        Payment.objects.filter(pk=payment.pk).update(verify_requested_at=timezone.now() - timezone.timedelta(hours=1))
+        self.assertEqual(self._callback("AUTH_TWICE")[1].call_count, 1)
 
-    @patch("payments.views.verify_payment")
+    @patch("payments.tasks.verify_payment")
     def test_payment_verify_already_paid_idempotent(self, mock_verify):
         reservation = self._create_reservation(price=Decimal("50000.00"))
         payment = Payment.objects.create(
@@ -142,7 +213,7 @@ class PaymentsViewsTestCase(APITestCase):
         payment.refresh_from_db()
         self.assertEqual(payment.ref_id, "R1")  # unchanged
 
-    @patch("payments.views.verify_payment")
+    @patch("payments.tasks.verify_payment")
     def test_payment_verify_failure_marks_failed_and_cancels(self, mock_verify):
         reservation = self._create_reservation(price=Decimal("50000.00"))
         payment = Payment.objects.create(
@@ -151,13 +222,30 @@ class PaymentsViewsTestCase(APITestCase):
         mock_verify.return_value = {"data": {"code": 102}}
 
         self.client.force_authenticate(self.user)
-        url = reverse("payments:payment-verify") + "?Authority=AUTH_FAIL&Status=OK"
-        resp = self.client.get(url)
+        resp, _ = self._callback("AUTH_FAIL")
+        verify_payment_callback.apply(args=[payment.id])
 
-        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
         payment.refresh_from_db(); reservation.refresh_from_db()
         self.assertEqual(payment.status, "failed")
         self.assertEqual(reservation.status, "cancelled")
+        poll = self.client.get(resp.data["status_url"])
+        self.assertEqual(poll.data["status"], "failed")
+        self.assertEqual(poll.data["error"], "Payment verification failed with code: 102")
+        self.assertEqual(self._callback("AUTH_FAIL")[0].status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch("payments.tasks.verify_payment")
+    def test_payment_verify_retries_gateway_errors(self, mock_verify):
+        reservation = self._create_reservation(price=Decimal("50000.00"))
+        payment = Payment.objects.create(
+            user=self.user, reservation=reservation, amount=50000, authority="AUTH_SLOW", status="pending"
+        )
+        mock_verify.side_effect = [Exception("timeout"), Exception("timeout"), {"data": {"code": 100, "ref_id": "R2"}}]
+
+        verify_payment_callback.apply(args=[payment.id])
+
+        self.assertEqual(mock_verify.call_count, 3)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, "paid")
 
     def test_payment_verify_payment_not_found(self):
         self.client.force_authenticate(self.user)
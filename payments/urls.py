@@ -1,8 +1,8 @@
 from django.urls import path
 from .views import (
-    PaymentRequestView, PaymentVerifyView, 
+    PaymentRequestView, PaymentVerifyView, PaymentVerifyStatusView,
     PaymentHistoryView, PaymentStartView,
-    AdminPaymentView, PaymentInquiryView
+    AdminPaymentView, PaymentInquiryView, AdminRevenueReportView
 )
 
 app_name = 'payments'
@@ -12,10 +12,12 @@ urlpatterns = [
     path("request/", PaymentRequestView.as_view(), name="payment-request"),
     path("start/<str:authority>/", PaymentStartView.as_view(), name="payment_start"),
     path("verify/", PaymentVerifyView.as_view(), name="payment-verify"),
+    path("verify/status/", PaymentVerifyStatusView.as_view(), name="payment-verify-status"),
     path("history/", PaymentHistoryView.as_view(), name="payment-history"),
     
     # Admin endpoints
     path("payments/", AdminPaymentView.as_view(), name="admin-payment-list"),
     path("payments/<int:pk>/", AdminPaymentView.as_view(), name="admin-payment-detail"),
+    path("revenue/", AdminRevenueReportView.as_view(), name="admin-revenue-report"),
     path("payments/inquire/<str:authority>/", PaymentInquiryView.as_view(), name="admin-payment-inquiry"),
 ]
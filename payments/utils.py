@@ -1,9 +1,17 @@
 import requests
 from django.conf import settings
+from core.http import CircuitOpenError, get_client
 from core.logging_utils import get_logger
 
 logger = get_logger(__name__)
 
+# Pooled, circuit-broken client shared by all ZarinPal calls in this process
+zarinpal = get_client(
+    'zarinpal',
+    connect_timeout=settings.ZARINPAL_CONNECT_TIMEOUT,
+    read_timeout=settings.ZARINPAL_READ_TIMEOUT,
+)
+
 ZARINPAL_REQUEST_URL = settings.ZARINPAL_REQUEST_URL
 ZARINPAL_VERIFY_URL = settings.ZARINPAL_VERIFY_URL
 ZARINPAL_INQUIRY_URL = settings.ZARINPAL_INQUIRY_URL
@@ -28,7 +36,7 @@ def request_payment(amount, callback_url, user):
     logger.debug(f"Payment request data: {data}")
     
     try:
-        response = requests.post(ZARINPAL_REQUEST_URL, json=data, timeout=10)
+        response = zarinpal.post(ZARINPAL_REQUEST_URL, endpoint='request', json=data)
         response.raise_for_status()
         logger.debug(f"Payment request response: {response.text}")
         return response.json()
@@ -62,11 +70,11 @@ def inquire_payment(authority):
     }
     
     try:
-        response = requests.post(
+        response = zarinpal.post(
             ZARINPAL_INQUIRY_URL,
+            endpoint='inquiry',
             json=data,
-            headers=headers,
-            timeout=10
+            headers=headers
         )
         response.raise_for_status()
         
@@ -134,11 +142,11 @@ def reverse_payment(authority):
     }
     
     try:
-        response = requests.post(
+        response = zarinpal.post(
             ZARINPAL_REVERSE_URL,
+            endpoint='reverse',
             json=data,
-            headers=headers,
-            timeout=10
+            headers=headers
         )
         response.raise_for_status()
         
@@ -173,12 +181,14 @@ def reverse_payment(authority):
             'message': error_msg
         }
 
-def check_and_reverse_failed_payment(payment):
+def check_and_reverse_failed_payment(payment, inquiry_result=None):
     """
     Check if a failed payment should be reversed and process the reversal if needed.
     
     Args:
         payment: Payment instance to check
+        inquiry_result: Result of inquire_payment() for the payment's authority,
+            if the caller already has it; otherwise ZarinPal is asked here
         
     Returns:
         bool: True if payment was reversed, False otherwise
@@ -210,7 +220,8 @@ def check_and_reverse_failed_payment(payment):
     try:
         logger.info(f"[DEBUG] Checking payment {payment.id} with ZarinPal, authority: {payment.authority}")
         # Check payment status with ZarinPal
-        inquiry_result = inquire_payment(payment.authority)
+        if inquiry_result is None:
+            inquiry_result = inquire_payment(payment.authority)
         logger.info(f"[DEBUG] Payment {payment.id} inquiry result: {inquiry_result}")
         
         # If payment is marked as PAID or VERIFIED in ZarinPal but failed in our system, reverse it
@@ -278,7 +289,12 @@ def check_and_reverse_failed_payment(payment):
 def verify_payment(amount, authority, max_retries=3):
     """
     Verify payment with ZarinPal with retry logic and idempotency.
-    
+
+    Retries go out immediately over the pooled connection rather than
+    sleeping on the request thread; verification is idempotent on ZarinPal's
+    side, and payments left unverified are picked up by the pending payment
+    check. No retries are made while the ZarinPal circuit breaker is open.
+
     Args:
         amount: The payment amount
         authority: The payment authority code from ZarinPal
@@ -305,16 +321,13 @@ def verify_payment(amount, authority, max_retries=3):
             logger.debug(f"Payment verification attempt {attempt + 1}/{max_retries}")
             logger.debug(f"Payment verification data: {data}")
             
-            response = requests.post(ZARINPAL_VERIFY_URL, json=data, timeout=10)
+            response = zarinpal.post(ZARINPAL_VERIFY_URL, endpoint='verify', json=data)
             
             # Handle 404 specifically - might be a temporary issue
             if response.status_code == 404:
                 logger.warning(f"Payment verification endpoint not found (404) for authority {authority}")
                 if attempt < max_retries - 1:
-                    wait_time = (2 ** attempt) + 1  # Exponential backoff
-                    logger.info(f"Retrying in {wait_time} seconds...")
-                    import time
-                    time.sleep(wait_time)
+                    logger.info("Retrying payment verification...")
                     continue
                 else:
                     raise Exception("Payment verification endpoint not available after multiple attempts")
@@ -346,24 +359,19 @@ def verify_payment(amount, authority, max_retries=3):
                 
                 # For other errors, retry if we have attempts left
                 if attempt < max_retries - 1 and result["data"]["code"] not in [51, 54]:
-                    wait_time = (2 ** attempt) + 1
-                    logger.info(f"Retrying in {wait_time} seconds...")
-                    import time
-                    time.sleep(wait_time)
+                    logger.info("Retrying payment verification...")
                     continue
                     
                 raise Exception(f"Payment verification failed with code: {result['data']['code']}")
                 
             return result
             
+        except CircuitOpenError as e:
+            last_exception = e
+            break
         except requests.RequestException as e:
             last_exception = e
             logger.warning(f"Payment verification attempt {attempt + 1} failed: {str(e)}")
-            if attempt < max_retries - 1:
-                wait_time = (2 ** attempt) + 1
-                logger.info(f"Retrying in {wait_time} seconds...")
-                import time
-                time.sleep(wait_time)
             continue
     
     # If we get here, all retries failed
@@ -0,0 +1,111 @@
+"""
+Deferred verification of payment callbacks.
+
+Verifying a payment with ZarinPal can take several timeouts when the gateway
+is slow, and doing it inside the callback request held a web worker thread
+for all of that time. Instead the callback only records what the gateway
+reported and queues verification (``request_verification``); the answer to
+the student is "verifying", and the client polls the cheap status endpoint
+until the ``verify_payment_callback`` task has settled the payment.
+
+Verification runs on its own Celery queue (PAYMENT_VERIFY_QUEUE), so a slow
+gateway can't hold up the other background tasks, and it is queued once per
+authority: repeated callbacks for a payment already being verified don't
+queue it again unless the earlier attempt has gone quiet for
+PAYMENT_VERIFY_REQUEUE_AFTER seconds. Payments whose verification couldn't
+be queued at all are still settled by the pending payment reconciliation.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.logging_utils import get_logger
+
+from .models import Payment
+
+logger = get_logger(__name__)
+
+# Gateway codes of a successful (100) or already verified (101) payment
+VERIFIED_CODES = (100, 101)
+
+
+def request_verification(payment, callback_status):
+    """
+    Record a gateway callback and queue the payment's verification.
+
+    Args:
+        payment: The pending payment the callback is for
+        callback_status: The ``Status`` the gateway sent with the callback
+
+    Returns:
+        bool: True if verification was queued, False if it already was
+    """
+    now = timezone.now()
+    claimed = Payment.objects.filter(pk=payment.pk, status=Payment.STATUS_PENDING).filter(
+        Q(verify_requested_at__isnull=True)
+        | Q(verify_requested_at__lt=now - timedelta(seconds=settings.PAYMENT_VERIFY_REQUEUE_AFTER))
+    ).update(callback_status=callback_status, verify_requested_at=now)
+    if not claimed:
+        return False
+
+    payment_id = payment.pk
+    transaction.on_commit(lambda: _enqueue(payment_id))
+    logger.info(f"Queued verification of payment {payment_id}")
+    return True
+
+
+def _enqueue(payment_id):
+    from .tasks import verify_payment_callback
+
+    try:
+        verify_payment_callback.delay(payment_id)
+    except Exception as e:
+        # The pending payment reconciliation settles the payment instead
+        logger.warning(f"Could not queue verification of payment {payment_id}: {str(e)}")
+
+
+def verification_state(payment):
+    """Get the state of a payment as reported to the polling client."""
+    if payment['status'] == Payment.STATUS_PENDING:
+        return 'verifying' if payment['verify_requested_at'] else 'pending'
+    return payment['status']
+
+
+@transaction.atomic
+def settle(payment_id, response=None, error=None):
+    """
+    Apply the outcome of a verification to a still pending payment.
+
+    Args:
+        payment_id: The verified payment
+        response: The gateway's verification response, if there was one
+        error: Why verification failed, if there was no usable response
+
+    Returns:
+        str: The payment's status afterwards, or None if it doesn't exist
+    """
+    payment = Payment.objects.select_for_update().filter(pk=payment_id).first()
+    if payment is None:
+        return None
+    if payment.status != Payment.STATUS_PENDING:
+        # Settled meanwhile, by an earlier attempt or the reconciliation
+        return payment.status
+
+    data = (response or {}).get('data') or {}
+    if data.get('code') in VERIFIED_CODES:
+        payment.ref_id = data.get('ref_id')
+        payment.status = Payment.STATUS_PAID
+        payment.save()
+        # Reactivate the reservation even if it expired while the payment was verified
+        payment.transition_reservation('waiting')
+        logger.info(f"Payment {payment.id} verified successfully with ref_id: {payment.ref_id}")
+    else:
+        error_code = data.get('code')
+        payment.mark_as_failed(
+            error_message=error or f"Payment verification failed with code: {error_code}",
+            error_code=error_code,
+        )
+    return payment.status
@@ -3,21 +3,28 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework import status, generics, filters
 from django.shortcuts import redirect, get_object_or_404
+from django.urls import reverse
+from django.utils.http import urlencode
 from django.core.paginator import Paginator
-from django.db.models import Q
 from django.utils import timezone
+from datetime import datetime
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Payment
 from .serializers import (
     PaymentRequestSerializer, 
     PaymentSerializer, 
     AdminPaymentSerializer,
+    PaymentFilterSerializer,
 )
-from .utils import request_payment, verify_payment, inquire_payment, ZARINPAL_STARTPAY_URL
+from .utils import request_payment, inquire_payment, ZARINPAL_STARTPAY_URL
+from .verification import request_verification, verification_state
+from . import ledger, search
 from django.conf import settings
 from orders.models import Reservation
+from orders.transitions import transition
 from core.logging_utils import get_logger
 from core.permissions import IsAdminOrReadOnly
+from core.idempotency import idempotent
 
 logger = get_logger(__name__)
 
@@ -25,6 +32,7 @@ class PaymentRequestView(APIView):
     """Request a new payment using ZarinPal REST API."""
     permission_classes = [IsAuthenticated]
 
+    @idempotent('payment-request')
     def post(self, request):
         serializer = PaymentRequestSerializer(data=request.data, context={'request': request})
         print(serializer.is_valid())
@@ -46,13 +54,27 @@ class PaymentRequestView(APIView):
             # If amount is zero (free reservation), mark as waiting
             if reservation.price <= 0:
                 logger.info(f"Free reservation {reservation_id} processed without payment")
-                reservation.status = 'waiting'
-                reservation.save()
+                transition([reservation.id], 'waiting', from_statuses=['pending_payment'])
                 return Response({
                     "message": "Reservation processed without payment",
                     "status": "waiting"
                     }, status=status.HTTP_200_OK)
 
+            # A payment already started for this reservation is reused instead of asking the gateway again
+            existing = Payment.objects.filter(
+                reservation_id=reservation_id,
+                user=request.user,
+                amount=reservation.price,
+                status=Payment.STATUS_PENDING,
+                created_at__gte=timezone.now() - timezone.timedelta(seconds=settings.PAYMENT_REUSE_WINDOW),
+            ).order_by('-created_at').first()
+            if existing:
+                logger.info(f"Reusing pending payment {existing.id} for reservation {reservation_id}")
+                return Response({
+                    "payment": PaymentSerializer(existing).data,
+                    "redirect_url": f"{ZARINPAL_STARTPAY_URL}{existing.authority}"
+                }, status=status.HTTP_200_OK)
+
             logger.info(f"Requesting payment for reservation {reservation_id} amount {reservation.price}")
             response = request_payment(reservation.price, callback_url, request.user)
 
@@ -87,12 +109,18 @@ class PaymentStartView(APIView):
         return redirect(f"{ZARINPAL_STARTPAY_URL}{authority}")
 
 
-from django.db import transaction
-
 class PaymentVerifyView(APIView):
-    """Verify a payment using ZarinPal REST API with idempotency and retry logic."""
+    """
+    Gateway callback: record the payment's outcome and queue its verification.
+
+    Verification with ZarinPal runs in the background (see
+    payments.verification); a pending payment is answered with 202 and a
+    ``verifying`` status, and the client polls ``status_url`` until it is
+    paid or failed.
+    """
     permission_classes = [IsAuthenticated]
 
+    @idempotent('payment-verify')
     def get(self, request):
         authority = request.query_params.get("Authority")
         status_query = request.query_params.get("Status")
@@ -101,115 +129,68 @@ class PaymentVerifyView(APIView):
             logger.error("Invalid payment verification request: missing authority or status")
             return Response({"error": "Invalid request"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            with transaction.atomic():
-                # Use select_for_update to lock the payment record and prevent race conditions
-                payment = Payment.objects.select_for_update().get(
-                    authority=authority, 
-                    user=request.user
-                )
-
-                logger.info(f"Verifying payment {payment.id} for user {request.user.id}")
-
-                # Check if payment is already processed
-                if payment.status == 'paid':
-                    logger.info(f"Payment {payment.id} already processed successfully")
-                    return self._handle_successful_payment(payment)
-                
-            if payment.status == 'failed':
-                logger.warning(f"Payment {payment.id} previously failed")
-                return Response({
-                    "error": "Payment verification previously failed",
-                    "status": "failed"
-                }, status=status.HTTP_400_BAD_REQUEST)
-
-            try:
-                # Verify payment with ZarinPal (with built-in retry logic)
-                response = verify_payment(payment.amount, authority)
-                logger.debug(f"Payment verification response: {response}")
-
-                if "data" in response and response["data"]["code"] in [100, 101]:
-                    # Update payment status and ref_id
-                    payment.ref_id = response["data"]["ref_id"]
-                    payment.status = 'paid'
-                    payment.save()
-                    
-                    # Update reservation status to 'waiting'
-                    payment.reservation.status = 'waiting'
-                    payment.reservation.save()
-                    
-                    logger.info(f"Payment {payment.id} verified successfully with ref_id: {payment.ref_id}")
-                    return self._handle_successful_payment(payment)
-                else:
-                    # Payment verification failed with a non-retryable error
-                    error_code = response.get("data", {}).get("code", "Unknown error")
-                    error_msg = f"Payment verification failed with code: {error_code}"
-                    logger.warning(error_msg)
-                    
-                    return self._handle_failed_payment(
-                        payment, 
-                        error_msg,
-                        error_code=error_code
-                    )
-
-            except Exception as e:
-                # Handle ZarinPal API errors and other exceptions
-                logger.error(f"Payment verification failed: {str(e)}")
-                return self._handle_failed_payment(payment, str(e))
-
-        except Payment.DoesNotExist:
+        payment = Payment.objects.filter(authority=authority, user=request.user).first()
+        if payment is None:
             logger.error(f"Payment record not found for authority: {authority}")
             return Response(
                 {"error": "Payment record not found"}, 
                 status=status.HTTP_404_NOT_FOUND
             )
-        except Exception as e:
-            logger.error(f"Unexpected error during payment verification: {str(e)}")
-            return Response(
-                {"error": "An unexpected error occurred"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+
+        # Check if payment is already processed
+        if payment.status == Payment.STATUS_PAID:
+            logger.info(f"Payment {payment.id} already processed successfully")
+            return self._handle_successful_payment(payment)
+
+        if payment.status != Payment.STATUS_PENDING:
+            logger.warning(f"Payment {payment.id} previously failed")
+            return Response({
+                "error": "Payment verification previously failed",
+                "status": payment.status
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        request_verification(payment, status_query[:10])
+        return Response({
+            "status": "verifying",
+            "payment_id": payment.id,
+            "reservation_id": payment.reservation_id,
+            "status_url": f"{reverse('payments:payment-verify-status')}?{urlencode({'Authority': authority})}",
+        }, status=status.HTTP_202_ACCEPTED)
     
     def _handle_successful_payment(self, payment):
         """Handle successful payment verification."""
         return Response({
             "success": True,
             "ref_id": payment.ref_id,
-            "reservation_id": payment.reservation.id,
+            "reservation_id": payment.reservation_id,
             "status": "paid"
         })
-    
-    def _handle_failed_payment(self, payment, error_message, error_code=None):
-        """Handle failed payment verification."""
-        from django.db import transaction
-        
-        try:
-            with transaction.atomic():
-                # Update payment status to failed
-                payment.status = 'failed'
-                payment.save()
-                
-                # Only cancel the reservation if it's still in pending state
-                if payment.reservation.status == 'pending_payment':
-                    payment.reservation.status = 'cancelled'
-                    payment.reservation.save()
-                    logger.info(f"Cancelled reservation {payment.reservation.id} due to payment failure")
-            
-            response_data = {
-                "error": error_message,
-                "status": "failed"
-            }
-            if error_code is not None:
-                response_data["code"] = error_code
-                
-            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
-            
-        except Exception as e:
-            logger.error(f"Error handling failed payment {payment.id}: {str(e)}")
-            return Response(
-                {"error": "Error processing payment failure"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+
+
+class PaymentVerifyStatusView(APIView):
+    """Report how verification of a payment is going; polled after the callback."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        authority = request.query_params.get("Authority")
+        if not authority:
+            return Response({"error": "Authority is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        payment = Payment.objects.filter(authority=authority, user=request.user).values(
+            'id', 'status', 'ref_id', 'reservation_id', 'verify_requested_at', 'failure_details'
+        ).first()
+        if payment is None:
+            return Response({"error": "Payment record not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        data = {
+            "status": verification_state(payment),
+            "payment_id": payment['id'],
+            "reservation_id": payment['reservation_id'],
+            "ref_id": payment['ref_id'],
+        }
+        if payment['status'] == Payment.STATUS_FAILED:
+            data["error"] = (payment['failure_details'] or {}).get('error_message')
+        return Response(data)
 
 
 class PaymentHistoryView(APIView):
@@ -242,102 +223,63 @@ class AdminPaymentView(APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
     serializer_class = AdminPaymentSerializer
     filter_backends = [filters.OrderingFilter, DjangoFilterBackend]
-    ordering_fields = ['created_at', 'updated_at', 'amount']
+    ordering_fields = ['created_at']
     ordering = ['-created_at']
     
-    def get_queryset(self):
-        """Return filtered queryset of payments."""
-        queryset = Payment.objects.select_related('user', 'reservation').order_by('-created_at')
-        
-        # Apply filters
-        params = self.request.query_params
-        
-        # Filter by user ID
-        if 'user_id' in params:
-            queryset = queryset.filter(user_id=params['user_id'])
-            
-        # Filter by status
-        if 'status' in params:
-            status = params['status'].lower()
-            if status == 'failed':
-                queryset = queryset.filter(status='failed')
-            else:
-                queryset = queryset.filter(status=status)
-            
-        # Filter by amount range
-        if 'min_amount' in params:
-            queryset = queryset.filter(amount__gte=params['min_amount'])
-        if 'max_amount' in params:
-            queryset = queryset.filter(amount__lte=params['max_amount'])
-            
-        # Filter by date range
-        if 'start_date' in params:
-            queryset = queryset.filter(created_at__date__gte=params['start_date'])
-        if 'end_date' in params:
-            # Add 1 day to include the entire end_date
-            end_date = params['end_date'] + timezone.timedelta(days=1)
-            queryset = queryset.filter(created_at__date__lt=end_date)
-            
-        # Search by authority, ref_id, or error details
-        if 'search' in params:
-            search = params['search']
-            queryset = queryset.filter(
-                Q(authority__icontains=search) | 
-                Q(ref_id__icontains=search) |
-                Q(user__phone_number__icontains=search) |
-                Q(failure_details__error_message__icontains=search) |
-                Q(failure_details__error_code__icontains=search)
-            )
-            
-        return queryset
+    def get_queryset(self, filters):
+        """Return payments matching the validated filters; see payments.search."""
+        queryset = Payment.objects.select_related('user', 'reservation')
+        return search.filter_payments(queryset, filters)
     
     def get(self, request):
         """
-        List all payments with optional filtering and pagination.
+        List all payments with optional filtering, one keyset page at a time.
         
         Query Parameters:
         - limit (int): Number of results per page (default: 20, max: 100)
-        - offset (int): Number of items to skip (default: 0)
+        - cursor (str): The 'next' cursor of the previous page (optional)
         - status (str): Filter by payment status (optional)
         - user_id (int): Filter by user ID (optional)
         - min_amount (int): Filter by minimum amount (optional)
         - max_amount (int): Filter by maximum amount (optional)
         - start_date (date): Filter by start date (YYYY-MM-DD) (optional)
         - end_date (date): Filter by end date (YYYY-MM-DD) (optional)
-        - search (str): Search in authority, ref_id, or user phone number (optional)
-        - ordering (str): Field to order by, prefix with - for descending (default: -created_at)
+        - search (str): Search in authority, ref_id, error details or user phone number (optional)
+        - ordering (str): created_at or -created_at (default: -created_at)
+        
+        'count' is exact up to PAYMENT_SEARCH_EXACT_COUNT payments and an
+        estimate beyond that, as told by 'count_is_estimate'.
         """
+        filter_serializer = PaymentFilterSerializer(data=request.query_params)
+        if not filter_serializer.is_valid():
+            return Response(filter_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        ordering = request.query_params.get('ordering', '-created_at')
+        if ordering not in ('created_at', '-created_at'):
+            return Response(
+                {"error": "ordering must be either 'created_at' or '-created_at'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         try:
-            # Parse and validate pagination parameters
-            limit = min(int(request.query_params.get('limit', 20)), 100)  # Max 100 items per page
-            offset = max(0, int(request.query_params.get('offset', 0)))
-            
-            # Get filtered and ordered queryset
-            queryset = self.get_queryset()
-            
-            # Get total count before pagination
-            total_count = queryset.count()
-            
-            # Apply pagination
-            paginated_payments = queryset[offset:offset + limit]
-            
-            # Serialize the results
-            serializer = self.serializer_class(paginated_payments, many=True)
-            
-            return Response({
-                'count': total_count,
-                'next': offset + limit < total_count,
-                'previous': offset > 0,
-                'offset': offset,
-                'limit': limit,
-                'results': serializer.data
-            })
-            
-        except (ValueError, TypeError) as e:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)  # Max 100 items per page
+            queryset = self.get_queryset(filter_serializer.validated_data)
+            payments, next_cursor = search.keyset_page(
+                queryset, limit, request.query_params.get('cursor'), descending=ordering.startswith('-')
+            )
+        except ValueError:
             return Response(
-                {"error": "Invalid parameters. 'limit' and 'offset' must be integers, and dates must be in YYYY-MM-DD format."},
+                {"error": "Invalid parameters. 'limit' must be an integer and 'cursor' one returned as 'next'."},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+        total_count, estimated = search.count(queryset)
+        return Response({
+            'count': total_count,
+            'count_is_estimate': estimated,
+            'next': next_cursor,
+            'limit': limit,
+            'results': self.serializer_class(payments, many=True).data
+        })
     
     def retrieve(self, request, pk=None):
         """Retrieve a specific payment with detailed information."""
@@ -369,6 +311,43 @@ class AdminPaymentView(APIView):
             )
 
 
+class AdminRevenueReportView(APIView):
+    """
+    Admin report of revenue per day, meal type and food, read from the
+    daily rollups of the revenue ledger (see payments.ledger).
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        """
+        Query Parameters:
+        - start_date (date): First day (YYYY-MM-DD)
+        - end_date (date): Last day, inclusive (YYYY-MM-DD)
+        - meal_type (str): Only this meal type (optional)
+        - food (int): Only this food (optional)
+        """
+        try:
+            start_date = datetime.strptime(request.query_params['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.query_params['end_date'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "start_date and end_date are required, in YYYY-MM-DD format."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end_date < start_date or (end_date - start_date).days >= settings.REVENUE_REPORT_MAX_DAYS:
+            return Response(
+                {"error": f"The range must be at most {settings.REVENUE_REPORT_MAX_DAYS} days, ending after it starts."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        food = request.query_params.get('food')
+        if food is not None and not food.isdigit():
+            return Response({"error": "food must be a food id."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(ledger.report(
+            start_date, end_date, meal_type=request.query_params.get('meal_type'), food=food
+        ))
+
+
 class PaymentInquiryView(APIView):
     """
     Admin API to inquire payment status from ZarinPal.
@@ -2,6 +2,9 @@
 ASGI config for university_food_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests to the live seat stream are served by ``menu.live.seat_stream``, which
+holds connections open without tying up a Django worker; everything else goes
+to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -13,4 +16,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'university_food_system.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, since it loads models
+from menu.live import seat_stream  # noqa: E402
+
+SEAT_STREAM_PATH = '/api/menu/live/'
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == SEAT_STREAM_PATH:
+        return await seat_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -3,6 +3,7 @@ from __future__ import absolute_import, unicode_literals
 import os
 from datetime import timedelta
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
 from celery.schedules import crontab
 
 # Set the default Django settings module for the 'celery' program.
@@ -27,6 +28,8 @@ app.conf.update(
 app.autodiscover_tasks([
     'users.tasks',
     'payments.tasks',
+    'notifications.tasks',
+    'menu.tasks',
     'university_food_system.tasks.background_tasks',
     # Add other task modules here as needed
 ])
@@ -47,12 +50,38 @@ app.conf.beat_schedule = {
         'task': 'university_food_system.tasks.background_tasks.cancel_pending_payment_reservations',
         'schedule': timedelta(minutes=1),
     },
+    'preload-pickup-sessions': {
+        'task': 'university_food_system.tasks.background_tasks.preload_pickup_sessions',
+        'schedule': timedelta(minutes=5),
+    },
+    'purge-idempotency-records': {
+        'task': 'university_food_system.tasks.background_tasks.purge_idempotency_records',
+        'schedule': timedelta(hours=1),
+    },
     'check-and-reverse-failed-payments': {
         'task': 'payments.tasks.check_and_reverse_failed_payments',
         'schedule': timedelta(minutes=1),
     },
+    # Notification tasks
+    'drain-sms-outbox': {
+        'task': 'notifications.tasks.drain_sms_outbox',
+        'schedule': timedelta(seconds=30),  # Safety net; new messages kick off a drain on commit
+    },
 }
 
+# Worker metrics (core.metrics): served by the main process, written by every pool process
+@worker_init.connect
+def serve_worker_metrics(**kwargs):
+    from core.metrics import serve_worker_metrics
+    serve_worker_metrics()
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    from core.metrics import mark_process_dead
+    mark_process_dead(pid)
+
+
 # Debug task
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
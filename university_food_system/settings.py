@@ -40,6 +40,39 @@ ZARINPAL_INQUIRY_URL = os.environ.get('ZARINPAL_INQUIRY_URL', 'https://sandbox.z
 ZARINPAL_REVERSE_URL = os.environ.get('ZARINPAL_REVERSE_URL', 'https://sandbox.zarinpal.com/pg/v4/payment/reverse.json')
 ZARINPAL_STARTPAY_URL = os.environ.get('ZARINPAL_STARTPAY_URL', 'https://sandbox.zarinpal.com/pg/StartPay/')
 
+ZARINPAL_CONNECT_TIMEOUT = float(os.environ.get('ZARINPAL_CONNECT_TIMEOUT', '3.05'))
+ZARINPAL_READ_TIMEOUT = float(os.environ.get('ZARINPAL_READ_TIMEOUT', '10'))
+
+# Outside gateway clients (core.http)
+GATEWAY_CONNECT_TIMEOUT = float(os.environ.get('GATEWAY_CONNECT_TIMEOUT', '3.05'))
+GATEWAY_READ_TIMEOUT = float(os.environ.get('GATEWAY_READ_TIMEOUT', '10'))
+GATEWAY_POOL_SIZE = int(os.environ.get('GATEWAY_POOL_SIZE', '10'))  # Keep-alive connections per host and process
+GATEWAY_BREAKER_THRESHOLD = int(os.environ.get('GATEWAY_BREAKER_THRESHOLD', '5'))  # Consecutive failures that open the circuit
+GATEWAY_BREAKER_RESET_TIMEOUT = int(os.environ.get('GATEWAY_BREAKER_RESET_TIMEOUT', '30'))  # Seconds before a trial call
+
+# Prometheus metrics (core.metrics); set PROMETHEUS_MULTIPROC_DIR in the environment to merge worker processes
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]  # Addresses or networks that may scrape /metrics/
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Bearer token that may scrape /metrics/ from anywhere
+CELERY_METRICS_PORT = int(os.environ.get('CELERY_METRICS_PORT', '9808'))  # Port of Celery workers' metrics; 0 to disable
+
+# Payment reconciliation (payments.tasks.check_and_reverse_failed_payments)
+PAYMENT_RECONCILE_CHUNK_SIZE = int(os.environ.get('PAYMENT_RECONCILE_CHUNK_SIZE', '500'))
+PAYMENT_RECONCILE_WORKERS = int(os.environ.get('PAYMENT_RECONCILE_WORKERS', '10'))  # Concurrent ZarinPal inquiries
+PAYMENT_RECONCILE_TIME_BUDGET = int(os.environ.get('PAYMENT_RECONCILE_TIME_BUDGET', '50'))  # Seconds; the task runs every minute
+
+# Deferred verification of payment callbacks (payments.verification)
+PAYMENT_VERIFY_QUEUE = os.environ.get('PAYMENT_VERIFY_QUEUE', 'payments')  # Celery queue of the verification task
+PAYMENT_VERIFY_MAX_RETRIES = int(os.environ.get('PAYMENT_VERIFY_MAX_RETRIES', '5'))
+PAYMENT_VERIFY_RETRY_DELAY = int(os.environ.get('PAYMENT_VERIFY_RETRY_DELAY', '5'))  # Seconds before the first retry, doubled after each
+PAYMENT_VERIFY_REQUEUE_AFTER = int(os.environ.get('PAYMENT_VERIFY_REQUEUE_AFTER', '300'))  # Seconds before a repeated callback queues again
+PAYMENT_REUSE_WINDOW = int(os.environ.get('PAYMENT_REUSE_WINDOW', '900'))  # Seconds a pending payment is reused for its reservation
+REVENUE_REPORT_MAX_DAYS = int(os.environ.get('REVENUE_REPORT_MAX_DAYS', '366'))  # Longest range of one revenue report
+PAYMENT_SEARCH_EXACT_COUNT = int(os.environ.get('PAYMENT_SEARCH_EXACT_COUNT', '10000'))  # Admin payment lists count exactly up to this many rows, then estimate
+
+# Idempotent endpoints (core.idempotency)
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '600'))  # Seconds a response is replayed to retries
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', '60'))  # Seconds a request in progress holds its key
+
 if ZARINPAL_MERCHANT_ID == 'placeholder_merchant_id':
     warnings.warn("Using placeholder ZARINPAL_MERCHANT_ID. Please replace with a valid merchant ID.", RuntimeWarning)
 print(f"Loaded ZARINPAL_MERCHANT_ID: {ZARINPAL_MERCHANT_ID}")  # Debug print
@@ -49,6 +82,17 @@ SMS_API_URL = os.environ.get('SMS_API_URL', 'https://api.sms.ir/v1/send/verify')
 SMS_API_KEY = os.environ.get('SMS_API_KEY', '')
 SMS_TEMPLATE_ID = os.environ.get('SMS_TEMPLATE_ID', '123456')
 
+RESERVATION_READY_TEMPLATE_ID = os.environ.get('RESERVATION_READY_TEMPLATE_ID', '849510')
+
+# SMS Outbox Settings
+SMS_OUTBOX_BATCH_SIZE = int(os.environ.get('SMS_OUTBOX_BATCH_SIZE', '100'))  # Messages claimed per drain batch
+SMS_OUTBOX_LEASE = int(os.environ.get('SMS_OUTBOX_LEASE', '120'))  # Seconds before an unfinished claim is retried
+SMS_MAX_ATTEMPTS = int(os.environ.get('SMS_MAX_ATTEMPTS', '5'))
+SMS_RETRY_BASE_DELAY = int(os.environ.get('SMS_RETRY_BASE_DELAY', '30'))  # Seconds, doubled on every retry
+SMS_RATE_LIMIT_PER_SECOND = int(os.environ.get('SMS_RATE_LIMIT_PER_SECOND', '10'))  # Per provider, across workers
+SMS_CONNECT_TIMEOUT = float(os.environ.get('SMS_CONNECT_TIMEOUT', '3.05'))
+SMS_READ_TIMEOUT = float(os.environ.get('SMS_READ_TIMEOUT', '10'))
+
 # Validate SMS configuration
 if not SMS_API_KEY:
     warnings.warn("SMS_API_KEY is not set. SMS functionality will not work.", RuntimeWarning)
@@ -62,11 +106,42 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Tehran'
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 CELERY_BEAT_SYNC_EVERY = 1  # Synchronize the schedule every second
+CELERY_TASK_ROUTES = {
+    'payments.tasks.verify_payment_callback': {'queue': PAYMENT_VERIFY_QUEUE},
+}
 
 # Trust Score Recovery Settings
 TRUST_SCORE_RECOVERY_RATE = 2  # Points to recover per day
 TRUST_SCORE_RECOVERY_INTERVAL = 86400  # 24 hours in seconds
 
+# Seat Allocation Settings
+# Optional cache-backed token counters in front of the conditional capacity UPDATEs
+SEAT_TOKENS_ENABLED = os.environ.get('SEAT_TOKENS_ENABLED', 'False').lower() == 'true'
+SEAT_TOKEN_TTL = int(os.environ.get('SEAT_TOKEN_TTL', '60'))  # Seconds before counters re-seed from the database
+MENU_CACHE_TTL = int(os.environ.get('MENU_CACHE_TTL', '3600'))  # Seconds; cached menus are also invalidated on change
+MENU_PLAN_CHUNK_DAYS = int(os.environ.get('MENU_PLAN_CHUNK_DAYS', '31'))  # Days of menus written per transaction
+MENU_PLAN_MAX_DAYS = int(os.environ.get('MENU_PLAN_MAX_DAYS', '400'))  # Longest range one planning job accepts
+
+# Live seat availability stream (menu.live), published over Redis pub/sub
+SEAT_STREAM_ENABLED = os.environ.get('SEAT_STREAM_ENABLED', 'False').lower() == 'true'  # Needs an ASGI server for /api/menu/live/
+SEAT_STREAM_REDIS_URL = os.environ.get('SEAT_STREAM_REDIS_URL', os.environ.get('REDIS_URL', 'redis://redis:6379/1'))
+SEAT_STREAM_WINDOW = float(os.environ.get('SEAT_STREAM_WINDOW', '0.25'))  # Seconds of changes merged into one publish and one capacity read
+
+# Order listings are returned in keyset pages (orders.listing)
+ORDER_LIST_PAGE_SIZE = int(os.environ.get('ORDER_LIST_PAGE_SIZE', '100'))
+ORDER_LIST_MAX_PAGE_SIZE = int(os.environ.get('ORDER_LIST_MAX_PAGE_SIZE', '1000'))
+
+# Pickup counter cache (orders.pickup)
+PICKUP_CACHE_TTL = int(os.environ.get('PICKUP_CACHE_TTL', str(6 * 3600)))  # Seconds a loaded meal stays cached
+PICKUP_PRELOAD_LEAD = int(os.environ.get('PICKUP_PRELOAD_LEAD', '1800'))  # Seconds before service a meal is loaded
+
+# Offline pickup station sync (orders.stations)
+PICKUP_SYNC_OVERLAP = int(os.environ.get('PICKUP_SYNC_OVERLAP', '60'))  # Seconds a delta download reaches back
+PICKUP_SYNC_MAX_BATCH = int(os.environ.get('PICKUP_SYNC_MAX_BATCH', '1000'))  # Deliveries accepted per uploaded batch
+
+# Maximum number of entries accepted by the bulk order placement endpoint
+BULK_RESERVATION_LIMIT = int(os.environ.get('BULK_RESERVATION_LIMIT', '14'))
+
 print(f"Loaded SMS_API_URL: {SMS_API_URL}")  # Debug print
 
 # SECURITY WARNING: keep the secret key used in production secret!
@@ -103,6 +178,7 @@ INSTALLED_APPS = [
     'orders',
     'reports',
     'payments',
+    'notifications',
     'whitenoise',
 ]
 
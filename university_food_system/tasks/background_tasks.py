@@ -14,49 +14,85 @@ logger = get_logger('tasks.background_tasks')
 @task_with_logging
 def cancel_pending_payment_reservations():
     """
-    Background task to cancel reservations that have been in pending_payment status for more than 10 minutes
+    Background task to cancel reservations that have been in pending_payment status for more than 10 minutes.
+
+    Cancellation is set-based (see orders.transitions.expire_pending) and
+    skips rows that are locked, so overlapping runs never cancel a
+    reservation twice or wait on each other.
     """
-    from orders.models import Reservation
+    from orders.transitions import expire_pending
     
     # Find reservations older than 10 minutes that are still in pending_payment
     expiration_time = timezone.now() - timedelta(minutes=10)
     logger.info(f"Checking for pending payment reservations older than {expiration_time}")
     
-    expired_reservations = Reservation.objects.filter(
-        status='pending_payment', 
-        created_at__lt=expiration_time
-    )
-    
-    total_expired = expired_reservations.count()
-    logger.info(f"Found {total_expired} reservations to cancel")
-    
-    if total_expired == 0:
+    cancelled = expire_pending(expiration_time)
+    if not cancelled:
         logger.info("No reservations to cancel")
         return
     
-    # Cancel expired reservations
-    for reservation in expired_reservations:
-        try:
-            logger.info(f"Cancelling reservation {reservation.id} for student {reservation.student_id}")
-            reservation.status = 'cancelled'
-            reservation.save()
-            
-            # Audit log for reservation cancellation
-            create_audit_log(
-                reservation.student, 
-                'reservation_payment_expired', 
-                {
-                    'reservation_id': reservation.id,
-                    'original_status': 'pending_payment'
-                }
-            )
-            logger.info(f"Successfully cancelled reservation {reservation.id}")
-        except Exception as e:
-            logger.error(
-                f'Failed to cancel reservation {reservation.id}',
-                exc_info=True,
-                extra={'reservation_id': reservation.id}
-            )
+    try:
+        # One audit record for the whole batch
+        create_audit_log(
+            None,
+            'reservation_payment_expired',
+            {
+                'original_status': 'pending_payment',
+                'reservations': [
+                    {'reservation_id': reservation_id, 'student_id': student_id}
+                    for reservation_id, student_id, _ in cancelled
+                ],
+            }
+        )
+    except Exception as e:
+        logger.error(
+            f'Failed to write audit log for {len(cancelled)} cancelled reservations',
+            exc_info=True,
+        )
     
-    logger.info(f"Successfully cancelled {total_expired} reservations")
-    return f"{total_expired} pending payment reservations cancelled."
+    total_cancelled = len(cancelled)
+    logger.info(f"Successfully cancelled {total_cancelled} reservations")
+    return f"{total_cancelled} pending payment reservations cancelled."
+
+
+@shared_task
+@task_with_logging
+def preload_pickup_sessions():
+    """
+    Load the pickup counter cache for meals about to be served.
+
+    A meal is loaded once any of its time slots starts within
+    PICKUP_PRELOAD_LEAD seconds and until its last slot has ended; meals
+    already loaded are left alone. See orders.pickup.
+    """
+    from django.conf import settings
+    from django.core.cache import cache
+    from menu.models import TimeSlot
+    from orders import pickup
+
+    now = timezone.now()
+    meals = set(
+        TimeSlot.objects.filter(
+            starts_at__lte=now + timedelta(seconds=settings.PICKUP_PRELOAD_LEAD), ends_at__gt=now
+        ).values_list('daily_menu_item__daily_menu__date', 'daily_menu_item__daily_menu__meal_type')
+    )
+
+    loaded = 0
+    for date, meal_type in meals:
+        if cache.get(pickup._session_key(date, meal_type)):
+            continue
+        pickup.load_session(date, meal_type)
+        loaded += 1
+    return f"{loaded} pickup sessions loaded."
+
+
+@shared_task
+@task_with_logging
+def purge_idempotency_records():
+    """Delete expired idempotency records kept in the database; see core.idempotency."""
+    from core.idempotency import purge_expired
+
+    deleted = purge_expired()
+    if deleted:
+        logger.info(f"Purged {deleted} expired idempotency records")
+    return f"{deleted} idempotency records purged."
@@ -18,11 +18,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from .views import health_check
+from .views import health_check, metrics
 
 urlpatterns = [ 
     path('admin/', admin.site.urls),
     path('health/', health_check, name='health_check'),
+    path('metrics/', metrics, name='metrics'),
     path('api/auth/', include('users.urls')),
     path('api/foods/', include('food.urls')),
     path('api/menu/', include('menu.urls')),
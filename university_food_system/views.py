@@ -1,6 +1,9 @@
 from django.http import HttpResponse
 from django.db import connection
 from django.core.cache import cache
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from core import metrics as core_metrics
 
 def health_check(request):
     """
@@ -22,3 +25,12 @@ def health_check(request):
         return HttpResponse("Cache connection failed", status=500)
     
     return HttpResponse("OK", status=200)
+
+
+def metrics(request):
+    """
+    Expose the Prometheus metrics of all web workers, including gateway latencies
+    """
+    if not core_metrics.is_scrape_allowed(request):
+        return HttpResponse("Forbidden", status=403)
+    return HttpResponse(core_metrics.render(), content_type=CONTENT_TYPE_LATEST)
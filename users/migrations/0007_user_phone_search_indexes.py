@@ -0,0 +1,44 @@
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+TRIGRAM_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['phone_number'], name='user_phone_trgm_idx', opclasses=['gin_trgm_ops']
+)
+
+
+def add_trigram_index(apps, schema_editor):
+    # pg_trgm ships with postgres' contrib modules; without them phone
+    # search still works, only without the substring index
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.add_index(apps.get_model('users', 'User'), TRIGRAM_INDEX)
+
+
+def remove_trigram_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX.name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_otp_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['phone_number'], name='user_phone_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='user', index=TRIGRAM_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_trigram_index, remove_trigram_index),
+            ],
+        ),
+    ]
@@ -1,5 +1,6 @@
 # users/models.py
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.contrib.auth.models import BaseUserManager
 
@@ -51,6 +52,14 @@ class User(AbstractUser):
     # Unfiltered manager to access soft-deleted rows when needed
     all_objects = models.Manager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Phone number prefix and substring search of the admin payment list
+            models.Index(fields=['phone_number'], name='user_phone_prefix_idx', opclasses=['varchar_pattern_ops']),
+            # Created only where pg_trgm is available; see migration 0007
+            GinIndex(fields=['phone_number'], name='user_phone_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
     def __str__(self):
         return self.phone_number
 
@@ -108,6 +117,12 @@ class OTP(models.Model):
     otp = models.CharField(max_length=6)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['phone_number', 'otp'], name='otp_phone_otp_idx'),
+            models.Index(fields=['created_at'], name='otp_created_at_idx'),
+        ]
+
     def is_valid(self):
         return self.created_at >= now() - timedelta(minutes=5)  # OTP is valid for 5 minutes
 
@@ -8,6 +8,7 @@ import json
 from django.utils import timezone
 from .models import User
 from django.db.models import F
+from notifications.providers import get_sms_client
 
 def recover_trust_scores_daily():
     """
@@ -65,7 +66,7 @@ class SMSService:
                 "parameters": [{"name": "Code", "value": otp_code}]
             }
 
-            response = requests.post(url, headers=headers, data=json.dumps(data))
+            response = get_sms_client().post(url, endpoint='send', headers=headers, data=json.dumps(data))
             
             # Log the response for debugging
             logger.info(f"SMS sending response: {response.text}")
@@ -135,7 +136,7 @@ class SMSService:
                                {"name": "delivery_code", "value": delivery_code}]
             }
 
-            response = requests.post(url, headers=headers, data=json.dumps(data))
+            response = get_sms_client().post(url, endpoint='send', headers=headers, data=json.dumps(data))
             
             # Log the response for debugging
             logger.info(f"Notification SMS response: {response.text}")